@@ -1,14 +1,18 @@
 from xml.etree import ElementTree
 
-import requests
+import httpx
 
+from . import rate_limit, resilience
 from .exceptions import ApiError
+from .. import metrics
+from .http_client import Upstream, get_client
 from ..schemas.vin import Vin
+from ..settings import settings
 
 class CarImageryApiError(ApiError):
   pass
 
-def find_car_photo_url(make: str, model: str, model_year: str) -> str | None:
+async def find_car_photo_url(make: str, model: str, model_year: str) -> str | None:
   """ https://www.carimagery.com/api.pdf """
   # Make sure arguments aren't empty or whitespaces
   make, model, model_year = make.strip(), model.strip(), model_year.strip()
@@ -16,20 +20,39 @@ def find_car_photo_url(make: str, model: str, model_year: str) -> str | None:
     raise ValueError('All arguments must not be empty string and not contain only whitespaces.')
 
   search_term = f'{make} {model} {model_year}'
-  response = requests.get(
-    f'https://www.carimagery.com/api.asmx/GetImageUrl?searchTerm={search_term}',
-    timeout=3
-  )
+  upstream = resilience.get_upstream(Upstream.CAR_IMAGERY.value, settings.car_imagery_timeout)
+  limiter = rate_limit.get_limiter(Upstream.CAR_IMAGERY.value, settings.car_imagery_rate_limit,
+                                  settings.car_imagery_rate_burst, settings.car_imagery_max_concurrency)
+  with metrics.track_upstream(Upstream.CAR_IMAGERY.value):
+    response = await upstream.call(
+      lambda timeout: _send(search_term, timeout),
+      idempotent=True,
+      open_error=CarImageryApiError('CarImagery API is unavailable.', 503),
+      limiter=limiter,
+    )
 
   try:
-    response.raise_for_status()
     root = ElementTree.fromstring(response.text)
     url = root.text
     return url if Vin.is_url(url) else None
   except ElementTree.ParseError:
     return None
-  except requests.HTTPError as ex:
-    raise CarImageryApiError(
-      'Failed to get photo url from CarImagery API.',
-      response.status_code
-    ) from ex
+
+async def _send(search_term: str, timeout: float) -> httpx.Response:
+  error_message = 'Failed to get photo url from CarImagery API.'
+  try:
+    response = await get_client(Upstream.CAR_IMAGERY).get(
+      f'{settings.car_imagery_base_url}/GetImageUrl',
+      params={'searchTerm': search_term},
+      timeout=httpx.Timeout(timeout, connect=settings.http_connect_timeout),
+    )
+  except httpx.TimeoutException as ex:
+    raise CarImageryApiError(error_message, 504) from ex
+  except httpx.TransportError as ex:
+    raise CarImageryApiError(error_message, 503) from ex
+
+  try:
+    response.raise_for_status()
+  except httpx.HTTPStatusError as ex:
+    raise CarImageryApiError(error_message, response.status_code) from ex
+  return response
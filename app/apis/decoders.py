@@ -0,0 +1,181 @@
+""" VIN decoders. vPIC's API is the default decoder, a local snapshot of
+    vPIC's decode tables (see `local_vpic`) can replace it, back it up
+    while vPIC fails, or run next to it for comparison.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from fastapi.concurrency import run_in_threadpool
+
+from . import vpic
+from .local_vpic import LocalVpicDecoder
+from ..schemas.vin import Vin
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+class VinDecoder(ABC):
+  @abstractmethod
+  async def find_vin(self, vin: str) -> Vin | None:
+    """ Return `None` if the VIN can't be decoded. """
+
+  @abstractmethod
+  async def find_vins(self, vins: list[str]) -> dict[str, Vin | None]:
+    """ Map each VIN to its decoded `Vin`, or to `None` if it can't be decoded. """
+
+class VpicDecoder(VinDecoder):
+  """ Decodes VINs with vPIC's API. Raises `vpic.VpicApiError` if vPIC fails. """
+  async def find_vin(self, vin: str) -> Vin | None:
+    return await vpic.find_vin(vin)
+
+  async def find_vins(self, vins: list[str]) -> dict[str, Vin | None]:
+    return await vpic.find_vins(vins)
+
+class LocalDecoder(VinDecoder):
+  """ Decodes VINs from a local vPIC snapshot, it never fails. """
+  def __init__(self, snapshot: LocalVpicDecoder):
+    self._snapshot = snapshot
+
+  async def find_vin(self, vin: str) -> Vin | None:
+    # The patterns of a new WMI are read from the snapshot file
+    return await run_in_threadpool(self._snapshot.find_vin, vin)
+
+  async def find_vins(self, vins: list[str]) -> dict[str, Vin | None]:
+    return await run_in_threadpool(lambda: {vin: self._snapshot.find_vin(vin) for vin in vins})
+
+class ChainedDecoder(VinDecoder):
+  """ The secondary decoder only decodes the VINs the primary couldn't. """
+  def __init__(self, primary: VinDecoder, secondary: VinDecoder):
+    self._primary = primary
+    self._secondary = secondary
+
+  async def find_vin(self, vin: str) -> Vin | None:
+    return await self._primary.find_vin(vin) or await self._secondary.find_vin(vin)
+
+  async def find_vins(self, vins: list[str]) -> dict[str, Vin | None]:
+    decoded_vins = await self._primary.find_vins(vins)
+    undecoded_vins = [vin for vin, decoded_vin in decoded_vins.items() if not decoded_vin]
+    if undecoded_vins:
+      decoded_vins.update(await self._secondary.find_vins(undecoded_vins))
+    return decoded_vins
+
+class FailoverDecoder(VinDecoder):
+  """ The backup decoder answers while the primary fails. The primary's
+      error is raised again if the backup can't decode the VINs either,
+      so that they aren't mistaken for VINs that can't be decoded.
+  """
+  def __init__(self, primary: VinDecoder, backup: VinDecoder):
+    self._primary = primary
+    self._backup = backup
+
+  async def find_vin(self, vin: str) -> Vin | None:
+    try:
+      return await self._primary.find_vin(vin)
+    except vpic.VpicApiError:
+      decoded_vin = await self._backup.find_vin(vin)
+      if not decoded_vin:
+        raise
+      return decoded_vin
+
+  async def find_vins(self, vins: list[str]) -> dict[str, Vin | None]:
+    try:
+      return await self._primary.find_vins(vins)
+    except vpic.VpicApiError:
+      decoded_vins = await self._backup.find_vins(vins)
+      if not all(decoded_vins.values()):
+        raise
+      return decoded_vins
+
+@dataclass
+class ShadowStats:
+  matches: int = 0
+  mismatches: int = 0
+  # VINs the shadow raised on
+  failures: int = 0
+  # VINs not compared because too many comparisons were already running
+  skips: int = 0
+
+shadow_stats = ShadowStats()
+
+# The comparisons run after the responses are sent. A slow shadow would otherwise pile
+# them up, each holding a thread of the threadpool that the routes also need.
+_MAX_SHADOW_COMPARISONS = 4
+_shadow_comparisons: set[asyncio.Task] = set()
+
+class ShadowDecoder(VinDecoder):
+  """ The primary decoder answers, the shadow decodes the same VINs in the
+      background and every disagreement is logged and counted in
+      `shadow_stats`. The shadow never delays or fails a lookup.
+  """
+  def __init__(self, primary: VinDecoder, shadow: VinDecoder):
+    self._primary = primary
+    self._shadow = shadow
+
+  async def find_vin(self, vin: str) -> Vin | None:
+    decoded_vin = await self._primary.find_vin(vin)
+    self._start_comparison({vin: decoded_vin})
+    return decoded_vin
+
+  async def find_vins(self, vins: list[str]) -> dict[str, Vin | None]:
+    decoded_vins = await self._primary.find_vins(vins)
+    self._start_comparison(decoded_vins)
+    return decoded_vins
+
+  def _start_comparison(self, decoded_vins: dict[str, Vin | None]):
+    if len(_shadow_comparisons) >= _MAX_SHADOW_COMPARISONS:
+      shadow_stats.skips += len(decoded_vins)
+      return
+
+    # The loop only keeps weak references to its tasks
+    task = asyncio.create_task(self._compare(dict(decoded_vins)))
+    _shadow_comparisons.add(task)
+    task.add_done_callback(_shadow_comparisons.discard)
+
+  async def _compare(self, decoded_vins: dict[str, Vin | None]):
+    try:
+      shadow_vins = await self._shadow.find_vins(list(decoded_vins))
+    except Exception:
+      shadow_stats.failures += len(decoded_vins)
+      logger.warning('The shadow decoder failed to decode %d VINs.', len(decoded_vins), exc_info=True)
+      return
+
+    for vin, decoded_vin in decoded_vins.items():
+      shadow_vin = shadow_vins.get(vin)
+      if _describe(decoded_vin) == _describe(shadow_vin):
+        shadow_stats.matches += 1
+      else:
+        shadow_stats.mismatches += 1
+        logger.warning('Decoders disagree on VIN %s: %s vs %s',
+                       vin, _describe(decoded_vin), _describe(shadow_vin))
+
+async def wait_for_shadow_comparisons():
+  """ Wait for the comparisons that are running, e.g. before reading `shadow_stats`. """
+  await asyncio.gather(*_shadow_comparisons)
+
+def _describe(vin: Vin | None) -> tuple[str, ...] | None:
+  if not vin:
+    return None
+  return tuple(
+    value.casefold() for value in (vin.make, vin.model, vin.model_year, vin.body_class)
+  )
+
+_local_snapshots: dict[str, LocalVpicDecoder] = {}
+
+def get_decoder() -> VinDecoder:
+  """ Return the decoder selected by `settings.local_vpic_mode`. """
+  if settings.local_vpic_mode == 'off':
+    return VpicDecoder()
+
+  if settings.local_vpic_snapshot not in _local_snapshots:
+    _local_snapshots[settings.local_vpic_snapshot] = LocalVpicDecoder(settings.local_vpic_snapshot)
+  local_decoder = LocalDecoder(_local_snapshots[settings.local_vpic_snapshot])
+
+  match settings.local_vpic_mode:
+    case 'primary':
+      return ChainedDecoder(local_decoder, VpicDecoder())
+    case 'fallback':
+      return FailoverDecoder(VpicDecoder(), local_decoder)
+    case 'shadow':
+      return ShadowDecoder(VpicDecoder(), local_decoder)
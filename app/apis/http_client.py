@@ -0,0 +1,74 @@
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import AsyncGenerator
+
+import httpx
+
+from . import rate_limit, resilience
+from ..settings import settings
+
+class Upstream(str, Enum):
+  VPIC = 'vpic'
+  CAR_IMAGERY = 'car_imagery'
+
+_clients: dict[Upstream, httpx.AsyncClient] = {}
+
+@asynccontextmanager
+async def open_clients(
+  transport: httpx.AsyncBaseTransport | None = None
+) -> AsyncGenerator[None, None]:
+  """ Open one pooled client per upstream for the duration of the context.
+      The app opens the clients in its lifespan so that connections are
+      kept alive and reused across requests. `transport` is meant for
+      tests that want to replace the network.
+  """
+  if _clients:
+    raise RuntimeError('The HTTP clients are already open.')
+
+  for upstream in Upstream:
+    _clients[upstream] = _create_client(upstream, transport)
+  # New clients start with a clean slate of breakers, latencies and rate limits
+  resilience.reset()
+  rate_limit.reset()
+
+  try:
+    yield
+  finally:
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+      await client.aclose()
+
+def get_client(upstream: Upstream) -> httpx.AsyncClient:
+  client = _clients.get(upstream)
+  if client is None:
+    raise RuntimeError('The HTTP clients are not open, use `open_clients()` first.')
+  return client
+
+def _create_client(
+  upstream: Upstream,
+  transport: httpx.AsyncBaseTransport | None
+) -> httpx.AsyncClient:
+  timeout = {
+    Upstream.VPIC: settings.vpic_timeout,
+    Upstream.CAR_IMAGERY: settings.car_imagery_timeout,
+  }[upstream]
+
+  return httpx.AsyncClient(
+    http2=settings.http2 and _is_http2_installed(),
+    limits=httpx.Limits(
+      max_connections=settings.http_max_connections,
+      max_keepalive_connections=settings.http_max_keepalive_connections,
+      keepalive_expiry=settings.http_keepalive_expiry,
+    ),
+    timeout=httpx.Timeout(timeout, connect=settings.http_connect_timeout),
+    transport=transport,
+  )
+
+def _is_http2_installed() -> bool:
+  """ HTTP/2 needs the optional `h2` package, i.e. `httpx[http2]`. """
+  try:
+    import h2
+    return True
+  except ImportError:
+    return False
@@ -0,0 +1,156 @@
+""" Decode VINs from a local snapshot of vPIC's decode tables instead of
+    calling the vPIC API. The snapshot is a SQLite file with two tables:
+
+    - `wmi`: the make of each World Manufacturer Identifier.
+    - `vds_pattern`: the model and body class of a WMI's vehicles whose
+      vehicle descriptor section (positions 4 to 8) matches a pattern,
+      for a range of model years. In a pattern `*` matches any character
+      and `[...]` matches one of the listed characters, like in vPIC.
+
+    Build it from CSV extracts of vPIC's standalone database with
+    `python -m app.apis.local_vpic <wmi.csv> <vds_pattern.csv> <snapshot.db>`.
+"""
+import csv
+import re
+import sqlite3
+import sys
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+
+from pydantic import ValidationError
+
+from .. import vin_analysis
+from ..schemas.vin import Vin
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS wmi (
+  wmi TEXT PRIMARY KEY,
+  make TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vds_pattern (
+  wmi TEXT NOT NULL,
+  pattern TEXT NOT NULL,
+  year_from INTEGER NOT NULL,
+  year_to INTEGER NOT NULL,
+  make TEXT,
+  model TEXT NOT NULL,
+  body_class TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_vds_pattern_wmi ON vds_pattern (wmi);
+'''
+
+_MODEL_YEAR_CYCLE = 30
+
+@dataclass(frozen=True)
+class VdsPattern:
+  regex: re.Pattern
+  # The number of positions the pattern pins down, the most specific match wins
+  specificity: int
+  year_from: int
+  year_to: int
+  make: str | None
+  model: str
+  body_class: str
+
+class LocalVpicDecoder:
+  """ Decodes VINs from a snapshot file, see the module docstring. The
+      patterns of a WMI are loaded and compiled on first use and then
+      kept in memory.
+  """
+  def __init__(self, snapshot_path: str, max_cached_wmis: int = 4096):
+    self._connection = sqlite3.connect(
+      f'file:{snapshot_path}?mode=ro', uri=True, check_same_thread=False
+    )
+    self._lock = threading.Lock()
+    self._find_wmi = lru_cache(maxsize=max_cached_wmis)(self._load_wmi)
+
+  def find_vin(self, vin: str) -> Vin | None:
+    """ Return `None` if the snapshot can't decode the VIN. """
+    vin = vin.upper()
+    latest_model_year = vin_analysis.decode_model_year(vin)
+    wmi_make, patterns = self._find_wmi(vin[:3])
+    if wmi_make is None or latest_model_year is None:
+      return None
+
+    vds = vin[3:8]
+    vds_patterns = [pattern for pattern in patterns if pattern.regex.fullmatch(vds)]
+    # The year codes repeat every 30 years. The 7th position only tells the cycles
+    # apart for light vehicles, so the latest cycle the patterns cover wins.
+    for model_year in (latest_model_year, latest_model_year - _MODEL_YEAR_CYCLE):
+      matches = [pattern for pattern in vds_patterns if pattern.year_from <= model_year <= pattern.year_to]
+      if matches:
+        break
+    else:
+      return None
+
+    best_match = max(matches, key=lambda pattern: pattern.specificity)
+    try:
+      return Vin(vin=vin,
+                 make=best_match.make or wmi_make,
+                 model=best_match.model,
+                 model_year=str(model_year),
+                 body_class=best_match.body_class)
+    except ValidationError:
+      return None
+
+  def close(self):
+    self._connection.close()
+
+  def _load_wmi(self, wmi: str) -> tuple[str | None, list[VdsPattern]]:
+    with self._lock:
+      make_row = self._connection.execute('SELECT make FROM wmi WHERE wmi = ?', (wmi,)).fetchone()
+      if not make_row:
+        return None, []
+
+      rows = self._connection.execute(
+        'SELECT pattern, year_from, year_to, make, model, body_class '
+        'FROM vds_pattern WHERE wmi = ?',
+        (wmi,)
+      ).fetchall()
+
+    return make_row[0], [
+      VdsPattern(
+        regex=_compile_pattern(pattern),
+        specificity=_specificity(pattern),
+        year_from=year_from,
+        year_to=year_to,
+        make=make,
+        model=model,
+        body_class=body_class,
+      )
+      for pattern, year_from, year_to, make, model, body_class in rows
+    ]
+
+def _compile_pattern(pattern: str) -> re.Pattern:
+  return re.compile(''.join(
+    '.' if token == '*' else token if token.startswith('[') else re.escape(token)
+    for token in re.findall(r'\[[^\]]*\]|.', pattern.upper())
+  ))
+
+def _specificity(pattern: str) -> int:
+  return sum(token != '*' for token in re.findall(r'\[[^\]]*\]|.', pattern))
+
+def build_snapshot(snapshot_path: str, wmi_csv_path: str, vds_pattern_csv_path: str):
+  """ Build a snapshot from two CSV files with the columns of the `wmi`
+      and `vds_pattern` tables, each starting with a header row.
+  """
+  with sqlite3.connect(snapshot_path) as connection:
+    connection.executescript(_SCHEMA)
+    with open(wmi_csv_path, newline='') as wmi_file:
+      connection.executemany(
+        'INSERT OR REPLACE INTO wmi (wmi, make) VALUES (:wmi, :make)',
+        csv.DictReader(wmi_file)
+      )
+    with open(vds_pattern_csv_path, newline='') as vds_pattern_file:
+      connection.executemany(
+        'INSERT INTO vds_pattern (wmi, pattern, year_from, year_to, make, model, body_class) '
+        'VALUES (:wmi, :pattern, :year_from, :year_to, NULLIF(:make, \'\'), :model, :body_class)',
+        csv.DictReader(vds_pattern_file)
+      )
+  connection.close()
+
+if __name__ == '__main__':
+  if len(sys.argv) != 4:
+    sys.exit('Usage: python -m app.apis.local_vpic <wmi.csv> <vds_pattern.csv> <snapshot.db>')
+  build_snapshot(sys.argv[3], sys.argv[1], sys.argv[2])
@@ -0,0 +1,189 @@
+""" Keep the calls to an upstream under its rate limit. Each upstream gets:
+
+    - A token bucket that spaces the calls out to a steady rate, allowing
+      short bursts, instead of sending them all at once and being throttled.
+    - A cap on the calls in flight at once.
+
+    Callers queue for both by priority, so interactive lookups go ahead of
+    batch work. With `rate_limit_shared` the bucket and the cap are kept in
+    the database and shared by every worker that uses it.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Iterator
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..db.connection import SessionLocal
+from ..db.entities.rate_limit import queries as rate_limit_queries
+from ..settings import settings
+
+class Priority(IntEnum):
+  """ Lower values go first. """
+  INTERACTIVE = 0
+  BATCH = 1
+
+_priority = contextvars.ContextVar('upstream_priority', default=Priority.INTERACTIVE)
+
+@contextmanager
+def priority(value: Priority) -> Iterator[None]:
+  """ Make the upstream calls within the context, including those of the tasks
+      created within it, queue at the given priority.
+  """
+  token = _priority.set(value)
+  try:
+    yield
+  finally:
+    _priority.reset(token)
+
+class PrioritySemaphore:
+  """ A semaphore whose waiters are woken by priority, then in arrival order. """
+  def __init__(self, value: int):
+    self._value = value
+    self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+    self._arrivals = itertools.count()
+
+  def locked(self) -> bool:
+    """ Whether `acquire` would have to wait. """
+    return self._value == 0
+
+  async def acquire(self, priority: Priority):
+    # Slots are only free while nobody is waiting for one
+    if self._value > 0:
+      self._value -= 1
+      return
+
+    waiter = asyncio.get_running_loop().create_future()
+    heapq.heappush(self._waiters, (priority, next(self._arrivals), waiter))
+    try:
+      await waiter
+    except asyncio.CancelledError:
+      if waiter.done() and not waiter.cancelled():
+        # The slot was handed over just as the waiter was cancelled, pass it on
+        self.release()
+      raise
+
+  def release(self):
+    while self._waiters:
+      _, _, waiter = heapq.heappop(self._waiters)
+      # Skip the waiters that were cancelled
+      if not waiter.done():
+        waiter.set_result(None)
+        return
+    self._value += 1
+
+class TokenBucket:
+  """ Refills at `rate` tokens per second up to `burst` tokens. A token can
+      be reserved before it is available, the bucket then goes into debt.
+  """
+  def __init__(self, rate: float, burst: int):
+    self.rate = rate
+    self.burst = burst
+    self._tokens = float(burst)
+    self._updated_at = time.monotonic()
+
+  def reserve(self) -> float:
+    """ Take a token and return how many seconds to wait before using it. """
+    now = time.monotonic()
+    self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate) - 1
+    self._updated_at = now
+    return max(0.0, -self._tokens / self.rate)
+
+class UpstreamLimiter:
+  """ The rate limit and the concurrency cap of one upstream, a `rate` or
+      `max_concurrency` of 0 disables either.
+  """
+  def __init__(self, name: str, rate: float, burst: int, max_concurrency: int):
+    self.name = name
+    self.rate = rate
+    self.burst = max(1, burst)
+    self.max_concurrency = max_concurrency
+    self._slots = PrioritySemaphore(max_concurrency) if max_concurrency > 0 else None
+    self._bucket = TokenBucket(rate, self.burst) if rate > 0 else None
+    # Tokens are taken one caller at a time, so that a caller that comes later
+    # but with a higher priority isn't stuck behind the debt of earlier ones
+    self._token_gate = PrioritySemaphore(1)
+
+  @property
+  def is_saturated(self) -> bool:
+    """ Whether a call would have to wait for a slot or behind other callers
+        for a token. Slots held by other workers aren't known here.
+    """
+    return (self._slots is not None and self._slots.locked()) or self._token_gate.locked()
+
+  @asynccontextmanager
+  async def acquire(self) -> AsyncIterator[None]:
+    """ Wait for a free slot and a token, and hold the slot for the duration
+        of the context, i.e. of the call to the upstream.
+    """
+    current_priority = _priority.get()
+    if self._slots:
+      await self._slots.acquire(current_priority)
+    try:
+      lease_id = await self._acquire_lease()
+      try:
+        await self._wait_for_token(current_priority)
+        yield
+      finally:
+        if lease_id is not None:
+          await run_in_threadpool(_release_lease, lease_id)
+    finally:
+      if self._slots:
+        self._slots.release()
+
+  async def _acquire_lease(self) -> int | None:
+    if not settings.rate_limit_shared or self.max_concurrency <= 0:
+      return None
+
+    while True:
+      lease_id = await run_in_threadpool(_try_acquire_lease, self.name, self.max_concurrency)
+      if lease_id is not None:
+        return lease_id
+      # Every slot is taken by other workers
+      await asyncio.sleep(settings.rate_limit_poll_interval)
+
+  async def _wait_for_token(self, current_priority: Priority):
+    if self.rate <= 0:
+      return
+
+    await self._token_gate.acquire(current_priority)
+    try:
+      if settings.rate_limit_shared:
+        wait = await run_in_threadpool(_reserve_token, self.name, self.rate, self.burst)
+      else:
+        wait = self._bucket.reserve()
+      await asyncio.sleep(wait)
+    finally:
+      self._token_gate.release()
+
+_limiters: dict[str, UpstreamLimiter] = {}
+
+def get_limiter(name: str, rate: float, burst: int, max_concurrency: int) -> UpstreamLimiter:
+  if name not in _limiters:
+    _limiters[name] = UpstreamLimiter(name, rate, burst, max_concurrency)
+  return _limiters[name]
+
+def reset():
+  """ Forget the state of every upstream. The state shared through the
+      database is kept, other workers may still be using it.
+  """
+  _limiters.clear()
+
+def _reserve_token(upstream: str, rate: float, burst: int) -> float:
+  with SessionLocal() as db_session:
+    return rate_limit_queries.reserve_token(db_session, upstream, rate, burst)
+
+def _try_acquire_lease(upstream: str, max_concurrency: int) -> int | None:
+  with SessionLocal() as db_session:
+    return rate_limit_queries.try_acquire_lease(
+      db_session, upstream, max_concurrency, settings.rate_limit_lease_ttl
+    )
+
+def _release_lease(lease_id: int):
+  with SessionLocal() as db_session:
+    rate_limit_queries.release_lease(db_session, lease_id)
@@ -0,0 +1,218 @@
+""" Keep a degraded upstream from tying up the app. Each upstream gets:
+
+    - A circuit breaker that fails calls fast while the upstream is down.
+    - Retries with jittered exponential backoff, for idempotent calls only.
+    - A timeout derived from the latency the upstream actually has.
+    - A hedged second request when an idempotent call is slower than most.
+
+    The state is per upstream and lives as long as the HTTP clients.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Awaitable, Callable, TypeVar
+
+from .exceptions import ApiError
+from .rate_limit import UpstreamLimiter
+from ..settings import settings
+
+T = TypeVar('T')
+
+# Failures worth retrying and that count against the circuit breaker, a 4xx
+# other than 429 means the request itself is wrong
+_RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+class CircuitBreaker:
+  """ Opens after `failure_threshold` consecutive failures and then rejects
+      calls for `open_duration` seconds. After that a single trial call is
+      let through, which closes the breaker if it succeeds and opens it
+      again if it fails.
+  """
+  def __init__(self, failure_threshold: int, open_duration: float):
+    self.failure_threshold = failure_threshold
+    self.open_duration = open_duration
+    self._consecutive_failures = 0
+    self._opened_at: float | None = None
+    self._is_trial_running = False
+    self._lock = threading.Lock()
+
+  @property
+  def is_open(self) -> bool:
+    """ `True` while calls are rejected without a trial call. """
+    with self._lock:
+      return self._opened_at is not None and time.monotonic() - self._opened_at < self.open_duration
+
+  def allow_call(self) -> bool:
+    with self._lock:
+      if self._opened_at is None:
+        return True
+      if time.monotonic() - self._opened_at < self.open_duration or self._is_trial_running:
+        return False
+      self._is_trial_running = True
+      return True
+
+  def record_success(self):
+    with self._lock:
+      self._consecutive_failures = 0
+      self._opened_at = None
+      self._is_trial_running = False
+
+  def release_trial(self):
+    """ End a trial call that neither succeeded nor failed, e.g. because it
+        was cancelled, so that the next call is let through as the trial.
+    """
+    with self._lock:
+      self._is_trial_running = False
+
+  def record_failure(self):
+    with self._lock:
+      self._consecutive_failures += 1
+      if self._is_trial_running or self._consecutive_failures >= self.failure_threshold:
+        self._opened_at = time.monotonic()
+      self._is_trial_running = False
+
+class LatencyWindow:
+  """ The latencies of the latest successful calls. """
+  def __init__(self, size: int):
+    self._latencies: deque[float] = deque(maxlen=size)
+
+  def add(self, latency: float):
+    self._latencies.append(latency)
+
+  def percentile(self, fraction: float, min_samples: int = 20) -> float | None:
+    """ `None` until there are enough samples to tell. """
+    if len(self._latencies) < min_samples:
+      return None
+    latencies = sorted(self._latencies)
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+class ResilientUpstream:
+  def __init__(self, max_timeout: float):
+    self.max_timeout = max_timeout
+    self.breaker = CircuitBreaker(settings.upstream_breaker_failure_threshold,
+                                  settings.upstream_breaker_open_duration)
+    self.latencies = LatencyWindow(settings.upstream_latency_window)
+
+  def timeout(self) -> float:
+    """ A few times the slowest typical latency, so that a stuck call is
+        given up on long before the upstream's configured timeout.
+    """
+    p99 = self.latencies.percentile(0.99)
+    if p99 is None:
+      return self.max_timeout
+    return min(self.max_timeout,
+               max(settings.upstream_min_timeout, p99 * settings.upstream_timeout_multiplier))
+
+  async def call(
+    self,
+    send: Callable[[float], Awaitable[T]],
+    idempotent: bool,
+    open_error: ApiError,
+    limiter: UpstreamLimiter | None = None
+  ) -> T:
+    """ Call `send` with the timeout to use. `open_error` is raised right
+        away while the circuit breaker is open. Each request waits for the
+        `limiter` before it's sent, the wait isn't part of its latency.
+    """
+    retries = settings.upstream_retries if idempotent else 0
+    for attempt in range(retries + 1):
+      if not self.breaker.allow_call():
+        raise open_error
+
+      try:
+        if idempotent:
+          result = await self._send_hedged(send, limiter)
+        else:
+          result = await self._send_timed(send, limiter)
+      except ApiError as ex:
+        if ex.error_status_code not in _RETRYABLE_STATUS_CODES:
+          # The upstream answered, it's the request that was wrong
+          self.breaker.record_success()
+          raise
+        self.breaker.record_failure()
+        if attempt == retries:
+          raise
+        # Full jitter, so that the retries of many callers don't line up
+        backoff = min(settings.upstream_retry_max_delay,
+                      settings.upstream_retry_base_delay * 2 ** attempt)
+        await asyncio.sleep(random.uniform(0, backoff))
+      except BaseException:
+        # Cancelled or failed before the upstream answered, which says nothing about it
+        self.breaker.release_trial()
+        raise
+      else:
+        self.breaker.record_success()
+        return result
+
+  async def _send_timed(
+    self,
+    send: Callable[[float], Awaitable[T]],
+    limiter: UpstreamLimiter | None,
+    is_sent: asyncio.Event | None = None
+  ) -> T:
+    async with limiter.acquire() if limiter else nullcontext():
+      if is_sent:
+        is_sent.set()
+      started_at = time.monotonic()
+      result = await send(self.timeout())
+      self.latencies.add(time.monotonic() - started_at)
+    return result
+
+  async def _send_hedged(self, send: Callable[[float], Awaitable[T]], limiter: UpstreamLimiter | None) -> T:
+    """ Send a second request if the first one is slower than the hedge
+        percentile, and return whichever answers first. There is no second
+        request while the `limiter` would make it wait, it would only add
+        to the queue.
+    """
+    hedge_delay = None
+    if settings.upstream_hedge_percentile > 0:
+      hedge_delay = self.latencies.percentile(settings.upstream_hedge_percentile)
+    if hedge_delay is None:
+      return await self._send_timed(send, limiter)
+
+    is_sent = asyncio.Event()
+    tasks = [asyncio.ensure_future(self._send_timed(send, limiter, is_sent))]
+    sent_waiter = asyncio.ensure_future(is_sent.wait())
+    try:
+      # The first request is only slow once it's sent, not while it waits for the limiter
+      await asyncio.wait([tasks[0], sent_waiter], return_when=asyncio.FIRST_COMPLETED)
+      done, pending = await asyncio.wait(tasks, timeout=hedge_delay)
+      if not done and not (limiter and limiter.is_saturated):
+        tasks.append(asyncio.ensure_future(self._send_timed(send, limiter)))
+        pending.add(tasks[-1])
+
+      while True:
+        for task in done:
+          if task.exception() is None:
+            return task.result()
+          error = task.exception()
+        # Give the other request a chance before giving up
+        if not pending:
+          raise error
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+      sent_waiter.cancel()
+      for task in tasks:
+        if task.done() and not task.cancelled():
+          # Mark the error of the losing request as retrieved
+          task.exception()
+        task.cancel()
+
+_upstreams: dict[str, ResilientUpstream] = {}
+
+def get_upstream(name: str, max_timeout: float) -> ResilientUpstream:
+  if name not in _upstreams:
+    _upstreams[name] = ResilientUpstream(max_timeout)
+  return _upstreams[name]
+
+def is_open(name: str) -> bool:
+  """ Whether the upstream's circuit breaker is rejecting calls. """
+  upstream = _upstreams.get(name)
+  return upstream is not None and upstream.breaker.is_open
+
+def reset():
+  """ Forget the state of every upstream. """
+  _upstreams.clear()
@@ -1,26 +1,94 @@
-import requests
+import httpx
 from pydantic import ValidationError
+from . import rate_limit, resilience
 from .exceptions import ApiError
+from .. import metrics, vin_analysis
+from .http_client import Upstream, get_client
 from ..schemas.vin import Vin
+from ..settings import settings
 
 class VpicApiError(ApiError):
   pass
 
-def find_vin(vin: str) -> Vin | None:
-  if not Vin.is_vin_correct_format(vin):
-    raise ValueError(f'VIN {vin} must be a 17 alphanumeric characters string.')
+async def find_vin(vin: str) -> Vin | None:
+  vin_error = vin_analysis.find_vin_error(vin)
+  if vin_error:
+    raise ValueError(f'VIN {vin} is invalid: {vin_error}')
 
-  response = requests.get(
-    f'https://vpic.nhtsa.dot.gov/api/vehicles/DecodeVinValues/{vin}?format=json',
-    timeout=3
+  response = await _send(
+    'GET',
+    f'{settings.vpic_base_url}/DecodeVinValues/{vin}',
+    f'Failed to get VIN {vin} from vpic API.',
+    params={'format': 'json'}
   )
 
+  json_obj = response.json()['Results'][0]
+  return _to_vin(vin, json_obj)
+
+async def find_vins(vins: list[str]) -> dict[str, Vin | None]:
+  """ Decode multiple VINs with a single call to vPIC's
+      DecodeVINValuesBatch endpoint. At most `settings.vpic_batch_size`
+      VINs may be given. The returned dict maps each given VIN to its
+      decoded `Vin`, or to `None` if vPIC could not decode it.
+  """
+  if len(vins) > settings.vpic_batch_size:
+    raise ValueError(f'At most {settings.vpic_batch_size} VINs can be decoded in one batch.')
+
+  for vin in vins:
+    vin_error = vin_analysis.find_vin_error(vin)
+    if vin_error:
+      raise ValueError(f'VIN {vin} is invalid: {vin_error}')
+
+  if not vins:
+    return {}
+
+  response = await _send(
+    'POST',
+    f'{settings.vpic_base_url}/DecodeVINValuesBatch/',
+    f'Failed to get {len(vins)} VINs from vpic API.',
+    data={'format': 'json', 'data': ';'.join(vins)}
+  )
+
+  json_objs = {
+    json_obj['VIN'].strip().upper(): json_obj
+    for json_obj in response.json()['Results']
+  }
+
+  return {
+    vin: _to_vin(vin, json_objs[vin.upper()]) if vin.upper() in json_objs else None
+    for vin in vins
+  }
+
+async def _send(method: str, url: str, error_message: str, **kwargs) -> httpx.Response:
+  upstream = resilience.get_upstream(Upstream.VPIC.value, settings.vpic_timeout)
+  limiter = rate_limit.get_limiter(Upstream.VPIC.value, settings.vpic_rate_limit,
+                                  settings.vpic_rate_burst, settings.vpic_max_concurrency)
+  with metrics.track_upstream(Upstream.VPIC.value):
+    return await upstream.call(
+      lambda timeout: _send_once(
+        method, url, error_message,
+        timeout=httpx.Timeout(timeout, connect=settings.http_connect_timeout), **kwargs
+      ),
+      idempotent=method == 'GET',
+      open_error=VpicApiError(f'{error_message} vpic API is unavailable.', 503),
+      limiter=limiter,
+    )
+
+async def _send_once(method: str, url: str, error_message: str, **kwargs) -> httpx.Response:
+  try:
+    response = await get_client(Upstream.VPIC).request(method, url, **kwargs)
+  except httpx.TimeoutException as ex:
+    raise VpicApiError(error_message, 504) from ex
+  except httpx.TransportError as ex:
+    raise VpicApiError(error_message, 503) from ex
+
   try:
     response.raise_for_status()
-  except requests.HTTPError as ex:
-    raise VpicApiError(f'Failed to get VIN {vin} from vpic API.', response.status_code) from ex
+  except httpx.HTTPStatusError as ex:
+    raise VpicApiError(error_message, response.status_code) from ex
+  return response
 
-  json_obj = response.json()['Results'][0]
+def _to_vin(vin: str, json_obj: dict) -> Vin | None:
   try:
     return Vin(vin=vin,
                make=json_obj['Make'],
@@ -0,0 +1,3 @@
+""" Benchmarks of the API and of its hot spots, run them with
+    `python -m app.benchmarks`, see `__main__` for the options.
+"""
@@ -0,0 +1,113 @@
+""" Run the benchmarks and compare them to a baseline, e.g.
+
+    python -m app.benchmarks --rows 10000,100000,1000000 --save-baseline
+    python -m app.benchmarks --rows 10000,100000,1000000
+
+    `--profile-imports` instead reports how long a worker takes to import
+    the app and which modules it spends that time on.
+
+    The second run exits with status 1 if any benchmark regressed by more
+    than `--tolerance` compared to the saved baseline. Baselines only
+    compare runs on the same machine, so they aren't committed.
+    The benchmarks run against a fresh cache in a temporary directory,
+    with vPIC and CarImagery replaced by a local stub server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+DEFAULT_BASELINE = Path(__file__).parent / 'baseline.json'
+
+def main() -> int:
+  parser = argparse.ArgumentParser(prog='python -m app.benchmarks')
+  parser.add_argument('--only', default='startup,lookup,cache,micro',
+                      help='Comma separated benchmark groups to run (default: %(default)s)')
+  parser.add_argument('--rows', default='10000,100000,1000000',
+                      help='Comma separated cache sizes for /list and /export (default: %(default)s)')
+  parser.add_argument('--lookups', type=int, default=500)
+  parser.add_argument('--concurrency', type=int, default=10)
+  parser.add_argument('--list-calls', type=int, default=50)
+  parser.add_argument('--export-calls', type=int, default=3)
+  parser.add_argument('--startup-calls', type=int, default=5)
+  parser.add_argument('--vpic-latency', type=float, default=0.05, help='Seconds')
+  parser.add_argument('--car-imagery-latency', type=float, default=0.05, help='Seconds')
+  parser.add_argument('--error-rate', type=float, default=0.0,
+                      help='Share of upstream requests that fail')
+  parser.add_argument('--output', help='Also write the results to this JSON file')
+  parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+  parser.add_argument('--save-baseline', action='store_true',
+                      help='Store the results as the baseline instead of comparing them')
+  parser.add_argument('--tolerance', type=float, default=0.25)
+  parser.add_argument('--profile-imports', type=int, nargs='?', const=30, metavar='TOP',
+                      help='Only report the startup time and the TOP slowest imports (default: 30)')
+  args = parser.parse_args()
+
+  if args.profile_imports is not None:
+    from .bench_startup import format_report, profile_startup
+    print(format_report(profile_startup(with_import_times=True), args.profile_imports))
+    return 0
+
+  groups = set(args.only.split(','))
+  # Keep the real cache out of it
+  database_path = os.path.join(tempfile.mkdtemp(prefix='vin-lookup-bench-'), 'vin_cache.db')
+  os.environ['VIN_LOOKUP_DATABASE_URL'] = f'sqlite:///{database_path}'
+
+  results = asyncio.run(_run(groups, args))
+  results_json = {result.name: result.to_json() for result in results}
+  for result in results:
+    print(f'{result.name:<32} {result.throughput:>10.1f}/s'
+          f'  p50 {result.p50_ms:>9.3f} ms  p99 {result.p99_ms:>9.3f} ms')
+
+  if args.output:
+    Path(args.output).write_text(json.dumps(results_json, indent=2))
+
+  if args.save_baseline:
+    Path(args.baseline).write_text(json.dumps(results_json, indent=2))
+    print(f'Saved the baseline to {args.baseline}')
+    return 0
+
+  if not os.path.exists(args.baseline):
+    print(f'No baseline at {args.baseline}, run with --save-baseline to create one')
+    return 0
+
+  from .harness import find_regressions
+  baseline = json.loads(Path(args.baseline).read_text())
+  regressions = find_regressions(results_json, baseline, args.tolerance)
+  for regression in regressions:
+    print(f'REGRESSION {regression}', file=sys.stderr)
+  return 1 if regressions else 0
+
+async def _run(groups: set[str], args: argparse.Namespace):
+  # Imported here so that the app picks up the temporary database
+  from .stubs import StubUpstreamServer
+  from . import bench_cache, bench_lookup, bench_micro, bench_startup
+
+  results = []
+  if 'startup' in groups:
+    results += bench_startup.run(args.startup_calls)
+
+  if 'micro' in groups:
+    results += bench_micro.run()
+
+  if 'lookup' in groups:
+    stub = StubUpstreamServer({})
+    stub.vpic_delay = args.vpic_latency
+    stub.car_imagery_delay = args.car_imagery_latency
+    stub.error_rate = args.error_rate
+    stub.start()
+    try:
+      results += await bench_lookup.run(stub, args.lookups, args.concurrency)
+    finally:
+      stub.stop()
+
+  if 'cache' in groups:
+    row_counts = [int(row_count) for row_count in args.rows.split(',')]
+    results += await bench_cache.run(row_counts, args.list_calls, args.export_calls)
+
+  return results
+
+sys.exit(main())
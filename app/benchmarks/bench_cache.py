@@ -0,0 +1,57 @@
+import random
+
+import httpx
+
+from ..db.connection import SessionLocal
+from ..db.entities.vin import queries as vin_queries
+from ..main import app
+from .data import MODELS, generate_rows, generate_vins
+from .harness import BenchmarkResult, measure_async
+
+_INSERT_CHUNK_SIZE = 10_000
+
+async def run(row_counts: list[int], list_calls: int, export_calls: int) -> list[BenchmarkResult]:
+  """ Time `/list`, `/search` and `/export` as the cache grows to each of `row_counts`. """
+  results = []
+  cached_rows = 0
+  random_cursor = random.Random(0)
+
+  async with app.router.lifespan_context(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://app', timeout=None) as client:
+      for row_count in sorted(row_counts):
+        _fill_cache(cached_rows, row_count)
+        cached_rows = row_count
+
+        def list_page():
+          return client.get('/list', params={'cursor': random_cursor.randrange(row_count), 'limit': 1000})
+
+        def list_filtered_page():
+          return client.get('/list', params={'model': random_cursor.choice(MODELS), 'limit': 1000})
+
+        def search_model():
+          return client.get('/search', params={'q': f'peterbilt {random_cursor.choice(MODELS)}'})
+
+        def search_vin_prefix():
+          vin = generate_vins(1, random_cursor.randrange(row_count))[0]
+          return client.get('/search', params={'vin_prefix': vin[:14]})
+
+        def export(export_format: str):
+          return lambda: client.get('/export', params={'export_format': export_format})
+
+        results += [
+          await measure_async(f'list_page_{row_count}', [list_page] * list_calls, 1),
+          await measure_async(f'list_filtered_page_{row_count}', [list_filtered_page] * list_calls, 1),
+          await measure_async(f'search_model_{row_count}', [search_model] * list_calls, 1),
+          await measure_async(f'search_vin_prefix_{row_count}', [search_vin_prefix] * list_calls, 1),
+          await measure_async(f'export_csv_{row_count}', [export('csv')] * export_calls, 1),
+          await measure_async(f'export_parquet_{row_count}', [export('parquet')] * export_calls, 1),
+        ]
+  return results
+
+def _fill_cache(start: int, stop: int):
+  with SessionLocal() as db_session:
+    for offset in range(start, stop, _INSERT_CHUNK_SIZE):
+      vin_queries.insert_vin_rows(
+        db_session, generate_rows(min(_INSERT_CHUNK_SIZE, stop - offset), offset)
+      )
@@ -0,0 +1,27 @@
+import httpx
+
+from ..main import app
+from ..settings import settings
+from .stubs import StubUpstreamServer
+from .data import generate_vins, to_vehicle
+from .harness import BenchmarkResult, measure_async
+
+async def run(stub: StubUpstreamServer, lookups: int, concurrency: int) -> list[BenchmarkResult]:
+  """ Look up VINs that aren't cached, through the stub upstream, and
+      then look them up again now that they are.
+  """
+  vins = generate_vins(lookups, offset=10_000_000 - lookups)
+  stub.vehicles.update((vin, to_vehicle(index)) for index, vin in enumerate(vins))
+  settings.vpic_base_url = stub.vpic_url
+  settings.car_imagery_base_url = stub.car_imagery_url
+  # Measure the app rather than the rate limits, the stub has none to respect
+  settings.vpic_rate_limit = settings.car_imagery_rate_limit = 0
+
+  async with app.router.lifespan_context(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://app') as client:
+      lookup_calls = [lambda vin=vin: client.get(f'/lookup/{vin}') for vin in vins]
+      return [
+        await measure_async('lookup_miss', lookup_calls, concurrency),
+        await measure_async('lookup_hit', lookup_calls, concurrency),
+      ]
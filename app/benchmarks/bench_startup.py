@@ -0,0 +1,99 @@
+""" The cold start of a worker, i.e. importing `app.main` in a fresh
+    interpreter, which every uvicorn worker and test process pays.
+"""
+import json
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+from .harness import BenchmarkResult, measure
+
+# Slow to import and only needed to export or load files,
+# so they must not be imported at startup
+LAZY_MODULES = ('pandas', 'numpy', 'fastparquet')
+
+_ROOT_PATH = Path(__file__).parents[2]
+
+# The resident memory once imported. `ru_maxrss` is a fallback where there's no
+# /proc, it's in KiB on Linux and in bytes on macOS, but on Linux it can carry
+# over the memory of the process that started the interpreter.
+_PROBE = '''
+import json, resource, sys, time
+started_at = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started_at
+try:
+  with open('/proc/self/status') as status:
+    rss_kib = next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+  rss = rss_kib * 1024
+except OSError:
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  rss = rss if sys.platform == 'darwin' else rss * 1024
+print(json.dumps({{'seconds': seconds, 'rss_bytes': rss, 'modules': sorted(sys.modules)}}))
+'''
+
+@dataclass
+class ImportTime:
+  module: str
+  self_us: int
+  # Including the modules it imported
+  cumulative_us: int
+
+@dataclass
+class StartupProfile:
+  # Spent importing the module, without the interpreter's own startup
+  seconds: float
+  rss_bytes: int
+  modules: list[str]
+  # Empty unless the profile was asked for them
+  import_times: list[ImportTime]
+
+def profile_startup(module: str = 'app.main', with_import_times: bool = False) -> StartupProfile:
+  """ Import the module in a fresh interpreter and report how long that
+      took and how much memory it used. `with_import_times` adds the time
+      spent on each imported module, but slows the import down a little.
+  """
+  options = ['-X', 'importtime'] if with_import_times else []
+  completed = subprocess.run(
+    [sys.executable, *options, '-c', _PROBE.format(module=module)],
+    cwd=_ROOT_PATH, capture_output=True, text=True, check=True,
+  )
+  probe = json.loads(completed.stdout.splitlines()[-1])
+  return StartupProfile(
+    seconds=probe['seconds'],
+    rss_bytes=probe['rss_bytes'],
+    modules=probe['modules'],
+    import_times=parse_import_times(completed.stderr) if with_import_times else [],
+  )
+
+def parse_import_times(output: str) -> list[ImportTime]:
+  """ Parse the output of `python -X importtime`, e.g.
+      `import time:       305 |     356148 |   fastapi`
+  """
+  import_times = []
+  for line in output.splitlines():
+    if not line.startswith('import time:'):
+      continue
+    self_us, cumulative_us, module = line.removeprefix('import time:').split('|')
+    # Skip the header
+    if not self_us.strip().isdigit():
+      continue
+    import_times.append(ImportTime(module.strip(), int(self_us), int(cumulative_us)))
+  return import_times
+
+def format_report(profile: StartupProfile, top: int) -> str:
+  slowest = sorted(profile.import_times, key=lambda import_time: import_time.cumulative_us, reverse=True)
+  lines = [
+    f'Imported app.main in {profile.seconds * 1000:.0f} ms, '
+    f'RSS {profile.rss_bytes / 1024 / 1024:.1f} MiB, {len(profile.modules)} modules',
+    f'{"cumulative ms":>14} {"self ms":>9}  module',
+  ]
+  lines += [
+    f'{import_time.cumulative_us / 1000:>14.1f} {import_time.self_us / 1000:>9.1f}  {import_time.module}'
+    for import_time in slowest[:top]
+  ]
+  return '\n'.join(lines)
+
+def run(calls: int) -> list[BenchmarkResult]:
+  return [measure('startup_import_app_main', profile_startup, calls)]
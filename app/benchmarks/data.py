@@ -0,0 +1,29 @@
+from .. import vin_analysis
+
+MODELS = ['579', '379', '389', '567', '520', '220', '337', '348', '365', '386']
+
+def generate_vins(count: int, offset: int = 0) -> list[str]:
+  """ Generate distinct VINs with a valid check digit, the same `offset`
+      always gives the same VINs.
+  """
+  vins = []
+  for index in range(offset, offset + count):
+    plant, serial = divmod(index, 1_000_000)
+    vin = f'1XPWD40X0E{"ABCDEFGHJK"[plant]}{serial:06d}'
+    vins.append(vin[:8] + vin_analysis.compute_check_digit(vin) + vin[9:])
+  return vins
+
+def to_vehicle(index: int) -> dict[str, str]:
+  return {
+    'make': 'PETERBILT',
+    'model': MODELS[index % len(MODELS)],
+    'model_year': '2014',
+    'body_class': 'Truck-Tractor',
+  }
+
+def generate_rows(count: int, offset: int = 0) -> list[dict[str, str]]:
+  """ Generate cache rows, as accepted by `vin_queries.insert_vin_rows`. """
+  return [
+    {'vin': vin, **to_vehicle(index), 'photo_url': ''}
+    for index, vin in enumerate(generate_vins(count, offset), start=offset)
+  ]
@@ -0,0 +1,88 @@
+import asyncio
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable
+
+@dataclass
+class BenchmarkResult:
+  name: str
+  # Calls per second over the whole run, including concurrency
+  throughput: float
+  p50_ms: float
+  p99_ms: float
+  calls: int
+
+  def to_json(self) -> dict[str, float]:
+    result = asdict(self)
+    del result['name']
+    return result
+
+def measure(name: str, fn: Callable[[], object], calls: int, warmup: int = 1) -> BenchmarkResult:
+  """ Call `fn` `calls` times in a row and time each call. """
+  for _ in range(warmup):
+    fn()
+
+  latencies = []
+  started_at = time.perf_counter()
+  for _ in range(calls):
+    call_started_at = time.perf_counter()
+    fn()
+    latencies.append(time.perf_counter() - call_started_at)
+  return _to_result(name, latencies, time.perf_counter() - started_at)
+
+async def measure_async(name: str, fns: list[Callable[[], Awaitable[object]]],
+                        concurrency: int) -> BenchmarkResult:
+  """ Await each of `fns` once, `concurrency` of them at a time. """
+  semaphore = asyncio.Semaphore(concurrency)
+  latencies = []
+
+  async def timed_call(fn: Callable[[], Awaitable[object]]):
+    async with semaphore:
+      call_started_at = time.perf_counter()
+      await fn()
+      latencies.append(time.perf_counter() - call_started_at)
+
+  started_at = time.perf_counter()
+  await asyncio.gather(*(timed_call(fn) for fn in fns))
+  return _to_result(name, latencies, time.perf_counter() - started_at)
+
+def _to_result(name: str, latencies: list[float], elapsed: float) -> BenchmarkResult:
+  if len(latencies) > 1:
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    p50, p99 = percentiles[49], percentiles[98]
+  else:
+    p50 = p99 = latencies[0]
+
+  return BenchmarkResult(
+    name=name,
+    throughput=len(latencies) / elapsed,
+    p50_ms=p50 * 1000,
+    p99_ms=p99 * 1000,
+    calls=len(latencies),
+  )
+
+def find_regressions(results: dict[str, dict[str, float]],
+                     baseline: dict[str, dict[str, float]],
+                     tolerance: float) -> list[str]:
+  """ Compare the results to the baseline. A benchmark regresses if its
+      latency grew, or its throughput dropped, by more than `tolerance`
+      (e.g. 0.2 for 20%). Benchmarks missing from either side are ignored.
+  """
+  regressions = []
+  for name, baseline_result in baseline.items():
+    result = results.get(name)
+    if result is None:
+      continue
+
+    for metric in ('p50_ms', 'p99_ms'):
+      if result[metric] > baseline_result[metric] * (1 + tolerance):
+        regressions.append(
+          f'{name}: {metric} is {result[metric]:.3f}, the baseline is {baseline_result[metric]:.3f}'
+        )
+    if result['throughput'] < baseline_result['throughput'] * (1 - tolerance):
+      regressions.append(
+        f'{name}: throughput is {result["throughput"]:.1f}/s, '
+        f'the baseline is {baseline_result["throughput"]:.1f}/s'
+      )
+  return regressions
@@ -0,0 +1,217 @@
+import json
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+class StubUpstreamServer:
+  """ A local HTTP server that stands in for the vPIC and CarImagery APIs.
+      vPIC is served under `/vpic` and CarImagery under `/carimagery`.
+      Only the VINs in `vehicles` can be decoded, every other VIN is
+      answered the way vPIC answers a VIN it can't decode.
+      `vpic_delay` and `car_imagery_delay` slow every response of that API by
+      that many seconds, and `error_rate` is the share of requests that are
+      answered with a 500.
+  """
+  def __init__(self, vehicles: dict[str, dict[str, str]]):
+    self.vehicles = vehicles
+    self.vpic_delay = 0.0
+    self.car_imagery_delay = 0.0
+    self.error_rate = 0.0
+    self._random = random.Random(0)
+    self.requests: list[str] = []
+    self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+  @property
+  def url(self) -> str:
+    host, port = self._server.server_address
+    return f'http://{host}:{port}'
+
+  @property
+  def vpic_url(self) -> str:
+    return f'{self.url}/vpic'
+
+  @property
+  def car_imagery_url(self) -> str:
+    return f'{self.url}/carimagery'
+
+  def start(self):
+    self._thread.start()
+
+  def stop(self):
+    self._server.shutdown()
+    self._server.server_close()
+    self._thread.join()
+
+  def should_fail(self) -> bool:
+    return self.error_rate > 0 and self._random.random() < self.error_rate
+
+  def decode(self, vin: str) -> dict[str, str]:
+    vehicle = self.vehicles.get(vin.upper(), {})
+    return {
+      'VIN': vin,
+      'Make': vehicle.get('make', ''),
+      'Model': vehicle.get('model', ''),
+      'ModelYear': vehicle.get('model_year', ''),
+      'BodyClass': vehicle.get('body_class', ''),
+    }
+
+  def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        stub.requests.append(f'GET {self.path}')
+        url = urlparse(self.path)
+        if stub.should_fail():
+          self._send(500, 'text/plain', 'Stub error')
+          return
+
+        if url.path.startswith('/vpic/DecodeVinValues/'):
+          time.sleep(stub.vpic_delay)
+          vin = unquote(url.path.rsplit('/', 1)[-1])
+          self._send(200, 'application/json', json.dumps({'Results': [stub.decode(vin)]}))
+        elif url.path == '/carimagery/GetImageUrl':
+          time.sleep(stub.car_imagery_delay)
+          search_term = parse_qs(url.query)['searchTerm'][0]
+          photo_url = f'http://images.example.com/{search_term.replace(" ", "_")}.jpg'
+          self._send(200, 'text/xml', f'<string xmlns="http://carimagery.com/">{photo_url}</string>')
+        else:
+          self._send(404, 'text/plain', 'Not found')
+
+      def do_POST(self):
+        stub.requests.append(f'POST {self.path}')
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        if stub.should_fail():
+          self._send(500, 'text/plain', 'Stub error')
+          return
+
+        if url.path == '/vpic/DecodeVINValuesBatch/':
+          time.sleep(stub.vpic_delay)
+          vins = parse_qs(body)['data'][0].split(';')
+          results = [stub.decode(vin.strip()) for vin in vins if vin.strip()]
+          self._send(200, 'application/json', json.dumps({'Results': results}))
+        else:
+          self._send(404, 'text/plain', 'Not found')
+
+      def log_message(self, format, *args):
+        pass
+
+      def _send(self, status_code: int, content_type: str, body: str):
+        payload = body.encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    return Handler
+
+class StubRedisServer:
+  """ A local server that speaks enough of the Redis protocol for the
+      `redis` cache backend: GET, MGET, SET with NX and PX, DEL, PUBLISH
+      and SUBSCRIBE. Keys never expire.
+  """
+  def __init__(self):
+    self.data: dict[bytes, bytes] = {}
+    self._subscribers: dict[bytes, list[socketserver.StreamRequestHandler]] = {}
+    self._lock = threading.Lock()
+    self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._make_handler())
+    self._server.daemon_threads = True
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+  @property
+  def url(self) -> str:
+    host, port = self._server.server_address
+    return f'redis://{host}:{port}/0'
+
+  def start(self):
+    self._thread.start()
+
+  def stop(self):
+    self._server.shutdown()
+    self._server.server_close()
+    self._thread.join()
+
+  def subscriber_count(self, channel: str) -> int:
+    with self._lock:
+      return len(self._subscribers.get(channel.encode(), []))
+
+  def _make_handler(self) -> type[socketserver.StreamRequestHandler]:
+    stub = self
+
+    class Handler(socketserver.StreamRequestHandler):
+      def handle(self):
+        try:
+          while True:
+            command = self._read_command()
+            if command is None:
+              return
+            self._run(command[0].upper(), command[1:])
+        except (ConnectionError, OSError):
+          pass
+        finally:
+          with stub._lock:
+            for subscribers in stub._subscribers.values():
+              if self in subscribers:
+                subscribers.remove(self)
+
+      def _run(self, name: bytes, args: list[bytes]):
+        with stub._lock:
+          match name:
+            case b'GET':
+              self.send(stub.data.get(args[0]))
+            case b'MGET':
+              self.send([stub.data.get(key) for key in args])
+            case b'SET':
+              key, value, options = args[0], args[1], [option.upper() for option in args[2:]]
+              if b'NX' in options and key in stub.data:
+                self.send(None)
+              else:
+                stub.data[key] = value
+                self.send(b'+OK')
+            case b'DEL':
+              self.send(sum(stub.data.pop(key, None) is not None for key in args))
+            case b'PUBLISH':
+              subscribers = stub._subscribers.get(args[0], [])
+              for subscriber in subscribers:
+                subscriber.send([b'message', args[0], args[1]])
+              self.send(len(subscribers))
+            case b'SUBSCRIBE':
+              stub._subscribers.setdefault(args[0], []).append(self)
+              self.send([b'subscribe', args[0], 1])
+            case b'SELECT' | b'PING':
+              self.send(b'+OK')
+            case _:
+              self.wfile.write(b'-ERR unknown command\r\n')
+
+      def send(self, reply: bytes | int | list | None):
+        self.wfile.write(self._encode(reply))
+        self.wfile.flush()
+
+      def _encode(self, reply: bytes | int | list | None) -> bytes:
+        if reply is None:
+          return b'$-1\r\n'
+        if isinstance(reply, int):
+          return b':%d\r\n' % reply
+        if isinstance(reply, list):
+          return b'*%d\r\n' % len(reply) + b''.join(self._encode(item) for item in reply)
+        if reply.startswith(b'+'):
+          return reply + b'\r\n'
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+
+      def _read_command(self) -> list[bytes] | None:
+        line = self.rfile.readline()
+        if not line:
+          return None
+        arguments = []
+        for _ in range(int(line[1:-2])):
+          length = int(self.rfile.readline()[1:-2])
+          arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    return Handler
@@ -0,0 +1,636 @@
+""" Where the cached VINs are kept, behind each worker's memory cache.
+    `database` keeps them in the database only. `redis` also shares them
+    through Redis, so that instances that each have their own database
+    fetch a VIN from upstream only once, and a VIN removed on one instance
+    is removed from every instance. `memory` keeps them in the process,
+    as a stand-in for tests.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+from .connection import SessionLocal
+from .entities.cache_generation import queries as generation_queries
+from .entities.vin import queries as vin_queries
+from .entities.vin.memory_cache import vin_memory_cache
+from .resp import RespClient, RespConnection, RespError
+from ..schemas.vin import Vin
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+# The kinds of the messages about VINs that an instance changed or removed
+_CHANGED = 'changed'
+_REMOVED = 'removed'
+
+class CacheBackend(ABC):
+  @abstractmethod
+  def find_vin(self, vin: str) -> Vin | None:
+    pass
+
+  @abstractmethod
+  def find_vins(self, vins: list[str]) -> list[Vin]:
+    """ The given VINs that are cached. """
+
+  @abstractmethod
+  def insert_vin(self, vin: Vin):
+    """ Cache the VIN, overwriting it if it's already cached. """
+
+  @abstractmethod
+  def insert_vins(self, vins: list[Vin]):
+    """ Cache the VINs, skipping those that are already cached. """
+
+  @abstractmethod
+  def upsert_vin_rows(self, rows: list[dict[str, str]]) -> int:
+    """ Same as `vin_queries.upsert_vin_rows`. """
+
+  @abstractmethod
+  def update_photo_url(self, vin: str, photo_url: str) -> bool:
+    """ Return `False` if the VIN wasn't cached. """
+
+  @abstractmethod
+  def fill_empty_photo_urls(self, make: str, model: str, model_year: str, photo_url: str) -> list[str]:
+    """ Same as `vin_queries.fill_empty_photo_urls`. """
+
+  @abstractmethod
+  def remove_vin(self, vin: str) -> bool:
+    """ Return `False` if the VIN wasn't cached. """
+
+  @abstractmethod
+  def remove_vins(self, vins: list[str]) -> list[str]:
+    """ Same as `vin_queries.remove_vins`. """
+
+  @abstractmethod
+  def remove_vins_created_before(self, created_before: float, limit: int) -> list[str]:
+    """ Same as `vin_queries.remove_vins_created_before`. """
+
+  @abstractmethod
+  def remove_oldest_vins(self, count: int, by_last_access: bool) -> list[str]:
+    """ Same as `vin_queries.remove_oldest_vins`. """
+
+  @abstractmethod
+  def touch_vins(self, accessed_at: dict[str, float]):
+    """ Same as `vin_queries.touch_vins`. """
+
+  @abstractmethod
+  def measure_vins(self) -> tuple[int, int]:
+    """ Same as `vin_queries.measure_vins`. """
+
+  @abstractmethod
+  def has_vins(self) -> bool:
+    pass
+
+  @abstractmethod
+  def find_vehicles_without_photo(self, after_id: int, limit: int) -> list[tuple[int, str, str, str]]:
+    """ Same as `vin_queries.find_vehicles_without_photo`. """
+
+  @abstractmethod
+  def list_vin_rows(self, columns: list[str], filters: dict[str, str],
+                    after_id: int | None, limit: int) -> list[tuple]:
+    """ Same as `vin_queries.list_vin_rows`, each row is the `id`
+        followed by the values of the given columns.
+    """
+
+  @abstractmethod
+  def iter_vin_rows(self, batch_size: int) -> Iterator[list[tuple[str, ...]]]:
+    """ Same as `vin_queries.iter_vin_rows`. """
+
+  @abstractmethod
+  def search_vins(self, terms: list[str], vin_prefix: str, offset: int, limit: int) -> list[Vin]:
+    """ Same as `vin_queries.search_vins`. """
+
+  @abstractmethod
+  def find_generation(self) -> generation_queries.CacheGeneration:
+    """ Changes with every change to the cached VINs. """
+
+  def listen_for_invalidations(self, on_invalidated: Callable[[str], None]) -> Callable[[], None]:
+    """ Call `on_invalidated` with each VIN that another instance removes
+        or changes, until the returned function is called. Backends that aren't shared
+        by several instances have nothing to listen to.
+    """
+    return lambda: None
+
+class DatabaseBackend(CacheBackend):
+  """ The cache database, see `settings.database_url`. """
+  def find_vin(self, vin: str) -> Vin | None:
+    with SessionLocal() as db_session:
+      return vin_queries.find_vin(db_session, vin)
+
+  def find_vins(self, vins: list[str]) -> list[Vin]:
+    with SessionLocal() as db_session:
+      return vin_queries.find_vins(db_session, vins)
+
+  def insert_vin(self, vin: Vin):
+    with SessionLocal() as db_session:
+      vin_queries.insert_vin(db_session, vin)
+
+  def insert_vins(self, vins: list[Vin]):
+    with SessionLocal() as db_session:
+      vin_queries.insert_vins(db_session, vins)
+
+  def upsert_vin_rows(self, rows: list[dict[str, str]]) -> int:
+    with SessionLocal() as db_session:
+      return vin_queries.upsert_vin_rows(db_session, rows)
+
+  def update_photo_url(self, vin: str, photo_url: str) -> bool:
+    with SessionLocal() as db_session:
+      return vin_queries.update_photo_url(db_session, vin, photo_url)
+
+  def fill_empty_photo_urls(self, make: str, model: str, model_year: str, photo_url: str) -> list[str]:
+    with SessionLocal() as db_session:
+      return vin_queries.fill_empty_photo_urls(db_session, make, model, model_year, photo_url)
+
+  def remove_vin(self, vin: str) -> bool:
+    with SessionLocal() as db_session:
+      return vin_queries.remove_vin(db_session, vin)
+
+  def remove_vins(self, vins: list[str]) -> list[str]:
+    with SessionLocal() as db_session:
+      return vin_queries.remove_vins(db_session, vins)
+
+  def remove_vins_created_before(self, created_before: float, limit: int) -> list[str]:
+    with SessionLocal() as db_session:
+      return vin_queries.remove_vins_created_before(db_session, created_before, limit)
+
+  def remove_oldest_vins(self, count: int, by_last_access: bool) -> list[str]:
+    with SessionLocal() as db_session:
+      return vin_queries.remove_oldest_vins(db_session, count, by_last_access)
+
+  def touch_vins(self, accessed_at: dict[str, float]):
+    with SessionLocal() as db_session:
+      vin_queries.touch_vins(db_session, accessed_at)
+
+  def measure_vins(self) -> tuple[int, int]:
+    with SessionLocal() as db_session:
+      return vin_queries.measure_vins(db_session)
+
+  def has_vins(self) -> bool:
+    with SessionLocal() as db_session:
+      return vin_queries.has_vins(db_session)
+
+  def find_vehicles_without_photo(self, after_id: int, limit: int) -> list[tuple[int, str, str, str]]:
+    with SessionLocal() as db_session:
+      return [tuple(row) for row in vin_queries.find_vehicles_without_photo(db_session, after_id, limit)]
+
+  def list_vin_rows(self, columns: list[str], filters: dict[str, str],
+                    after_id: int | None, limit: int) -> list[tuple]:
+    with SessionLocal() as db_session:
+      return vin_queries.list_vin_rows(db_session, columns, filters, after_id, limit)
+
+  def iter_vin_rows(self, batch_size: int) -> Iterator[list[tuple[str, ...]]]:
+    with SessionLocal() as db_session:
+      yield from vin_queries.iter_vin_rows(db_session, batch_size)
+
+  def search_vins(self, terms: list[str], vin_prefix: str, offset: int, limit: int) -> list[Vin]:
+    with SessionLocal() as db_session:
+      return vin_queries.search_vins(
+        db_session, terms, vin_prefix, offset, limit, settings.search_max_ranked_matches
+      )
+
+  def find_generation(self) -> generation_queries.CacheGeneration:
+    with SessionLocal() as db_session:
+      return generation_queries.find_generation(db_session)
+
+@dataclass
+class _MemoryRow:
+  id: int
+  vin: Vin
+  created_at: float
+  last_accessed_at: float
+
+class MemoryBackend(CacheBackend):
+  """ Keeps the VINs in the process, in the order they were first cached. """
+  def __init__(self):
+    self._rows: dict[str, _MemoryRow] = {}
+    self._next_id = 1
+    self._generation = generation_queries.CacheGeneration(0, time.time())
+    self._lock = threading.Lock()
+
+  def find_vin(self, vin: str) -> Vin | None:
+    with self._lock:
+      row = self._rows.get(vin)
+      return row.vin if row else None
+
+  def find_vins(self, vins: list[str]) -> list[Vin]:
+    with self._lock:
+      return [self._rows[vin].vin for vin in dict.fromkeys(vins) if vin in self._rows]
+
+  def insert_vin(self, vin: Vin):
+    with self._lock:
+      self._put(vin)
+      self._bump_generation()
+
+  def insert_vins(self, vins: list[Vin]):
+    with self._lock:
+      for vin in vins:
+        if vin.vin not in self._rows:
+          self._put(vin)
+      self._bump_generation()
+
+  def upsert_vin_rows(self, rows: list[dict[str, str]]) -> int:
+    with self._lock:
+      cached_count = sum(row['vin'] in self._rows for row in rows)
+      for row in rows:
+        self._put(Vin.model_construct(**row))
+      if rows:
+        self._bump_generation()
+      return cached_count
+
+  def update_photo_url(self, vin: str, photo_url: str) -> bool:
+    with self._lock:
+      row = self._rows.get(vin)
+      if not row:
+        return False
+      row.vin = row.vin.model_copy(update={'photo_url': photo_url})
+      self._bump_generation()
+      return True
+
+  def fill_empty_photo_urls(self, make: str, model: str, model_year: str, photo_url: str) -> list[str]:
+    with self._lock:
+      rows = [
+        row for row in self._rows.values()
+        if (row.vin.make, row.vin.model, row.vin.model_year, row.vin.photo_url) == (make, model, model_year, '')
+      ]
+      for row in rows:
+        row.vin = row.vin.model_copy(update={'photo_url': photo_url})
+      if rows:
+        self._bump_generation()
+      return [row.vin.vin for row in rows]
+
+  def remove_vin(self, vin: str) -> bool:
+    return bool(self.remove_vins([vin]))
+
+  def remove_vins(self, vins: list[str]) -> list[str]:
+    with self._lock:
+      return self._remove([vin for vin in dict.fromkeys(vins) if vin in self._rows])
+
+  def remove_vins_created_before(self, created_before: float, limit: int) -> list[str]:
+    with self._lock:
+      rows = sorted(
+        (row for row in self._rows.values() if row.created_at < created_before),
+        key=lambda row: (row.created_at, row.id)
+      )
+      return self._remove([row.vin.vin for row in rows[:limit]])
+
+  def remove_oldest_vins(self, count: int, by_last_access: bool) -> list[str]:
+    with self._lock:
+      rows = sorted(
+        self._rows.values(),
+        key=lambda row: (row.last_accessed_at if by_last_access else row.created_at, row.id)
+      )
+      return self._remove([row.vin.vin for row in rows[:count]])
+
+  def touch_vins(self, accessed_at: dict[str, float]):
+    with self._lock:
+      for vin, timestamp in accessed_at.items():
+        if vin in self._rows:
+          self._rows[vin].last_accessed_at = timestamp
+
+  def measure_vins(self) -> tuple[int, int]:
+    with self._lock:
+      string_bytes = sum(
+        len(getattr(row.vin, column)) for row in self._rows.values() for column in vin_queries.VIN_COLUMNS
+      )
+      return len(self._rows), string_bytes + len(self._rows) * vin_queries.ROW_OVERHEAD_BYTES
+
+  def has_vins(self) -> bool:
+    return bool(self._rows)
+
+  def find_vehicles_without_photo(self, after_id: int, limit: int) -> list[tuple[int, str, str, str]]:
+    return [
+      (row_id, make, model, model_year)
+      for row_id, make, model, model_year, photo_url in self.list_vin_rows(
+        ['make', 'model', 'model_year', 'photo_url'], {}, after_id, len(self._rows)
+      )
+      if not photo_url
+    ][:limit]
+
+  def list_vin_rows(self, columns: list[str], filters: dict[str, str],
+                    after_id: int | None, limit: int) -> list[tuple]:
+    return [
+      (row.id, *(getattr(row.vin, column) for column in columns))
+      for row in self._sorted_rows()
+      if (after_id is None or row.id > after_id)
+      and all(getattr(row.vin, column) == value for column, value in filters.items())
+    ][:limit]
+
+  def iter_vin_rows(self, batch_size: int) -> Iterator[list[tuple[str, ...]]]:
+    rows = [
+      tuple(getattr(row.vin, column) for column in vin_queries.VIN_COLUMNS)
+      for row in self._sorted_rows()
+    ]
+    for start in range(0, len(rows), batch_size):
+      yield rows[start:start + batch_size]
+
+  def search_vins(self, terms: list[str], vin_prefix: str, offset: int, limit: int) -> list[Vin]:
+    """ Matches come in the order they were cached, they aren't ranked. """
+    def is_match(vin: Vin) -> bool:
+      words = vin_queries.to_search_terms(' '.join([vin.make, vin.model, vin.body_class, vin.model_year]))
+      *whole_terms, last_term = terms or ['']
+      return (vin.vin.startswith(vin_prefix)
+              and all(term in words for term in whole_terms)
+              and any(word.startswith(last_term) for word in words))
+
+    vins = [row.vin for row in self._sorted_rows() if is_match(row.vin)]
+    if not terms:
+      vins.sort(key=lambda vin: vin.vin)
+    return vins[offset:offset + limit]
+
+  def find_generation(self) -> generation_queries.CacheGeneration:
+    return self._generation
+
+  def _sorted_rows(self) -> list[_MemoryRow]:
+    with self._lock:
+      return sorted(self._rows.values(), key=lambda row: row.id)
+
+  def _put(self, vin: Vin):
+    row = self._rows.get(vin.vin)
+    if row:
+      row.vin = vin
+    else:
+      now = time.time()
+      self._rows[vin.vin] = _MemoryRow(self._next_id, vin, created_at=now, last_accessed_at=now)
+      self._next_id += 1
+
+  def _remove(self, vins: list[str]) -> list[str]:
+    for vin in vins:
+      del self._rows[vin]
+    if vins:
+      self._bump_generation()
+    return vins
+
+  def _bump_generation(self):
+    self._generation = generation_queries.CacheGeneration(self._generation.generation + 1, time.time())
+
+class RedisBackend(CacheBackend):
+  """ Shares the VINs of the instances through Redis, in front of each
+      instance's own backend, e.g. its database. Lookups check Redis before
+      the instance's backend, and the VINs an instance caches are also
+      stored in Redis for `redis_vin_ttl` seconds. Removals, evictions and
+      updates are published to every other instance, which drops its own
+      copy of the VINs from its backend and memory cache. Listing, searching and exporting only cover the
+      instance's own backend. While Redis is unreachable, only the own
+      backend is used.
+  """
+  def __init__(self, store: CacheBackend, url: str, key_prefix: str):
+    self.store = store
+    self.url = url
+    self._client = RespClient(url, settings.redis_timeout)
+    self._key_prefix = key_prefix
+    self._channel = f'{key_prefix}invalidations'
+    # Tells the messages of this instance apart from those of the others
+    self._sender_id = uuid.uuid4().hex
+
+  def find_vin(self, vin: str) -> Vin | None:
+    try:
+      shared_vin = self._client.execute('GET', self._to_key(vin))
+    except RespError:
+      logger.warning('Failed to get VIN %s from Redis.', vin, exc_info=True)
+      return self.store.find_vin(vin)
+
+    if shared_vin is not None:
+      cache_vin = _from_json(shared_vin)
+      vin_memory_cache.put(cache_vin.vin, cache_vin)
+      return cache_vin
+
+    cache_vin = self.store.find_vin(vin)
+    if cache_vin:
+      self._share([cache_vin])
+    return cache_vin
+
+  def find_vins(self, vins: list[str]) -> list[Vin]:
+    if not vins:
+      return []
+
+    try:
+      shared_vins = self._client.execute('MGET', *(self._to_key(vin) for vin in vins))
+    except RespError:
+      logger.warning('Failed to get %d VINs from Redis.', len(vins), exc_info=True)
+      return self.store.find_vins(vins)
+
+    cache_vins = [_from_json(shared_vin) for shared_vin in shared_vins if shared_vin is not None]
+    found_vins = {cache_vin.vin for cache_vin in cache_vins}
+    stored_vins = self.store.find_vins([vin for vin in vins if vin not in found_vins])
+    self._share(stored_vins)
+    return cache_vins + stored_vins
+
+  def insert_vin(self, vin: Vin):
+    self.store.insert_vin(vin)
+    self._share([vin])
+
+  def insert_vins(self, vins: list[Vin]):
+    self.store.insert_vins(vins)
+    self._share(vins, only_new=True)
+
+  def upsert_vin_rows(self, rows: list[dict[str, str]]) -> int:
+    cached_count = self.store.upsert_vin_rows(rows)
+    self._publish_changes([Vin.model_construct(**row) for row in rows])
+    return cached_count
+
+  def update_photo_url(self, vin: str, photo_url: str) -> bool:
+    is_updated = self.store.update_photo_url(vin, photo_url)
+    if is_updated:
+      self._publish_changes(self.store.find_vins([vin]))
+    return is_updated
+
+  def fill_empty_photo_urls(self, make: str, model: str, model_year: str, photo_url: str) -> list[str]:
+    updated_vins = self.store.fill_empty_photo_urls(make, model, model_year, photo_url)
+    self._publish_changes(self.store.find_vins(updated_vins))
+    return updated_vins
+
+  def remove_vin(self, vin: str) -> bool:
+    is_removed = self.store.remove_vin(vin)
+    return self._publish_removals([vin]) > 0 or is_removed
+
+  def remove_vins(self, vins: list[str]) -> list[str]:
+    removed_vins = self.store.remove_vins(vins)
+    self._publish_removals(removed_vins)
+    return removed_vins
+
+  def remove_vins_created_before(self, created_before: float, limit: int) -> list[str]:
+    removed_vins = self.store.remove_vins_created_before(created_before, limit)
+    self._publish_removals(removed_vins)
+    return removed_vins
+
+  def remove_oldest_vins(self, count: int, by_last_access: bool) -> list[str]:
+    removed_vins = self.store.remove_oldest_vins(count, by_last_access)
+    self._publish_removals(removed_vins)
+    return removed_vins
+
+  def touch_vins(self, accessed_at: dict[str, float]):
+    self.store.touch_vins(accessed_at)
+
+  def measure_vins(self) -> tuple[int, int]:
+    return self.store.measure_vins()
+
+  def has_vins(self) -> bool:
+    return self.store.has_vins()
+
+  def find_vehicles_without_photo(self, after_id: int, limit: int) -> list[tuple[int, str, str, str]]:
+    return self.store.find_vehicles_without_photo(after_id, limit)
+
+  def list_vin_rows(self, columns: list[str], filters: dict[str, str],
+                    after_id: int | None, limit: int) -> list[tuple]:
+    return self.store.list_vin_rows(columns, filters, after_id, limit)
+
+  def iter_vin_rows(self, batch_size: int) -> Iterator[list[tuple[str, ...]]]:
+    return self.store.iter_vin_rows(batch_size)
+
+  def search_vins(self, terms: list[str], vin_prefix: str, offset: int, limit: int) -> list[Vin]:
+    return self.store.search_vins(terms, vin_prefix, offset, limit)
+
+  def find_generation(self) -> generation_queries.CacheGeneration:
+    return self.store.find_generation()
+
+  def listen_for_invalidations(self, on_invalidated: Callable[[str], None]) -> Callable[[], None]:
+    is_stopped = threading.Event()
+    connection: RespConnection | None = None
+
+    def listen():
+      nonlocal connection
+      while not is_stopped.is_set():
+        try:
+          connection = RespConnection(self.url, timeout=None)
+          connection.execute('SUBSCRIBE', self._channel)
+          while True:
+            kind, _, message = connection.read_reply()
+            if kind == b'message':
+              self._invalidate(json.loads(message), on_invalidated)
+        except Exception:
+          if is_stopped.is_set():
+            return
+          logger.warning('Lost the subscription to Redis invalidations, retrying.', exc_info=True)
+          if connection:
+            connection.close()
+          is_stopped.wait(settings.redis_reconnect_delay)
+
+    def stop():
+      is_stopped.set()
+      if connection:
+        connection.close()
+      thread.join()
+
+    thread = threading.Thread(target=listen, name='redis-invalidations', daemon=True)
+    thread.start()
+    return stop
+
+  def _invalidate(self, message: dict, on_invalidated: Callable[[str], None]):
+    # The instance that changed the VINs gets its own message too, its copies are already current
+    if message['sender'] == self._sender_id:
+      return
+    if message['kind'] == _REMOVED:
+      self.store.remove_vins(message['vins'])
+    else:
+      self._refresh(message['vins'])
+    for vin in message['vins']:
+      on_invalidated(vin)
+
+  def _refresh(self, vins: list[str]):
+    """ Overwrite the rows of the changed VINs that this instance has with
+        the shared copies. The rows stay if the shared copies are gone, the
+        database may well be the one the other instance changed.
+    """
+    stored_vins = [cache_vin.vin for cache_vin in self.store.find_vins(vins)]
+    if not stored_vins:
+      return
+
+    try:
+      shared_vins = self._client.execute('MGET', *(self._to_key(vin) for vin in stored_vins))
+    except RespError:
+      logger.warning('Failed to get %d changed VINs from Redis.', len(stored_vins), exc_info=True)
+      return
+    self.store.upsert_vin_rows([json.loads(shared_vin) for shared_vin in shared_vins if shared_vin is not None])
+
+  def _share(self, vins: list[Vin], only_new: bool = False):
+    if not vins:
+      return
+
+    try:
+      self._client.execute_many(self._to_set_commands(vins, only_new))
+    except RespError:
+      logger.warning('Failed to share %d VINs through Redis.', len(vins), exc_info=True)
+
+  def _publish_changes(self, vins: list[Vin]):
+    """ Overwrite the shared copies of the changed VINs rather than deleting
+        them, the other instances refresh their own copies from Redis.
+    """
+    if not vins:
+      return
+
+    try:
+      self._client.execute_many([
+        *self._to_set_commands(vins, only_new=False),
+        ('PUBLISH', self._channel, self._to_message(_CHANGED, [vin.vin for vin in vins])),
+      ])
+    except RespError:
+      logger.warning('Failed to publish %d changed VINs through Redis.', len(vins), exc_info=True)
+
+  def _publish_removals(self, vins: list[str]) -> int:
+    """ Return the number of VINs that were shared. """
+    if not vins:
+      return 0
+
+    try:
+      deleted_count, _ = self._client.execute_many([
+        ('DEL', *(self._to_key(vin) for vin in vins)),
+        ('PUBLISH', self._channel, self._to_message(_REMOVED, vins)),
+      ])
+    except RespError:
+      logger.warning('Failed to remove %d VINs from Redis.', len(vins), exc_info=True)
+      return 0
+    return deleted_count
+
+  def _to_set_commands(self, vins: list[Vin], only_new: bool) -> list[tuple]:
+    ttl_ms = int(settings.redis_vin_ttl * 1000)
+    options = ['NX'] if only_new else []
+    if ttl_ms > 0:
+      options += ['PX', ttl_ms]
+    return [('SET', self._to_key(vin.vin), vin.model_dump_json(), *options) for vin in vins]
+
+  def _to_message(self, kind: str, vins: list[str]) -> str:
+    return json.dumps({'sender': self._sender_id, 'kind': kind, 'vins': vins})
+
+  def _to_key(self, vin: str) -> str:
+    return f'{self._key_prefix}vin:{vin}'
+
+def _from_json(data: bytes) -> Vin:
+  # It was validated before it was shared
+  return Vin.model_construct(**json.loads(data))
+
+_backends: dict[str, CacheBackend] = {}
+
+def get_cache_backend() -> CacheBackend:
+  """ Return the backend selected by `settings.cache_backend`. """
+  if settings.cache_backend not in _backends:
+    match settings.cache_backend:
+      case 'database':
+        backend = DatabaseBackend()
+      case 'memory':
+        backend = MemoryBackend()
+      case 'redis':
+        backend = RedisBackend(DatabaseBackend(), settings.redis_url, settings.redis_key_prefix)
+      case _:
+        raise NotImplementedError(f'Cache backend {settings.cache_backend} is not supported.')
+    _backends[settings.cache_backend] = backend
+  return _backends[settings.cache_backend]
+
+def reset():
+  """ Forget the backends, e.g. to start over with an empty `memory` backend. """
+  _backends.clear()
+
+@contextmanager
+def listen_for_invalidations() -> Iterator[None]:
+  """ Drop the VINs that other instances remove from the memory cache,
+      for as long as the context is open.
+  """
+  stop = get_cache_backend().listen_for_invalidations(vin_memory_cache.invalidate)
+  try:
+    yield
+  finally:
+    stop()
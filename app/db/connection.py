@@ -1,14 +1,49 @@
 from typing import Generator
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, event, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
 
-SQLITE_FILE_PATH = './vin_cache.db'
+from .. import metrics
+from ..settings import settings
 
-Engine = create_engine(
-  f'sqlite:///{SQLITE_FILE_PATH}',
-  connect_args={'check_same_thread': False}
-)
+def create_db_engine(database_url: str) -> Engine:
+  """ Create the engine of the cache database. SQLite connections get the
+      pragmas from the settings, and every file backed database gets a pool
+      large enough for the threadpool that runs the sync routes.
+  """
+  url = make_url(database_url)
+  if url.get_backend_name() != 'sqlite':
+    return create_engine(url, pool_pre_ping=True, **_pool_options())
+
+  # An in-memory database lives and dies with its only connection
+  if url.database in (None, '', ':memory:'):
+    engine = create_engine(url, connect_args={'check_same_thread': False})
+  else:
+    engine = create_engine(url, connect_args={'check_same_thread': False}, **_pool_options())
+  event.listen(engine, 'connect', _set_sqlite_pragmas)
+  return engine
+
+def _pool_options() -> dict[str, int | float]:
+  return {
+    'pool_size': settings.database_pool_size,
+    'max_overflow': settings.database_max_overflow,
+    'pool_timeout': settings.database_pool_timeout,
+  }
+
+def _set_sqlite_pragmas(dbapi_connection, _):
+  cursor = dbapi_connection.cursor()
+  try:
+    # With WAL, readers no longer wait for writers to commit
+    cursor.execute(f'PRAGMA journal_mode = {settings.sqlite_journal_mode}')
+    cursor.execute(f'PRAGMA synchronous = {settings.sqlite_synchronous}')
+    cursor.execute(f'PRAGMA mmap_size = {settings.sqlite_mmap_size:d}')
+    cursor.execute(f'PRAGMA cache_size = {settings.sqlite_cache_size:d}')
+    cursor.execute(f'PRAGMA busy_timeout = {settings.sqlite_busy_timeout:d}')
+  finally:
+    cursor.close()
+
+Engine = create_db_engine(settings.database_url)
+metrics.instrument_engine(Engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=Engine)
 
 Base = declarative_base()
@@ -0,0 +1,15 @@
+from sqlalchemy import Insert, Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+def upsert_insert(db: Session, entity: type | Table) -> Insert:
+  """ An INSERT for the session's database that supports
+      `on_conflict_do_nothing` and `on_conflict_do_update`.
+  """
+  match db.get_bind().dialect.name:
+    case 'sqlite':
+      return sqlite.insert(entity)
+    case 'postgresql':
+      return postgresql.insert(entity)
+    case dialect_name:
+      raise NotImplementedError(f'Upserts are not supported for {dialect_name}.')
@@ -1,3 +1,9 @@
 from .vin.entity import VinEntity
+from .cache_generation.entity import CacheGenerationEntity
+from .job.entity import JobEntity, JobVinEntity
+from .lookup_lock.entity import LookupLockEntity
+from .negative_vin.entity import NegativeVinEntity
+from .photo.entity import PhotoEntity
+from .rate_limit.entity import RateLimitBucketEntity, RateLimitLeaseEntity
 
 
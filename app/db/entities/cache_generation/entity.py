@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Float, Integer
+from ...connection import Base
+
+class CacheGenerationEntity(Base):
+  """ A single row counting the changes to the cached VINs, so that
+      anything derived from the whole cache, like an export, can tell
+      whether it's still up to date.
+  """
+  __tablename__ = 'cache_generation'
+
+  id = Column(Integer, primary_key=True)
+  generation = Column(Integer, nullable=False)
+  updated_at = Column(Float, nullable=False)
@@ -0,0 +1,36 @@
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .entity import CacheGenerationEntity
+
+@dataclass(frozen=True)
+class CacheGeneration:
+  generation: int
+  # When the generation was last bumped, as a Unix timestamp
+  updated_at: float
+
+  @property
+  def tag(self) -> str:
+    """ Identifies the state of the cache. It includes the time so that a
+        generation number reused by a new database isn't mistaken for an
+        old one.
+    """
+    return f'{self.generation}-{int(self.updated_at * 1000)}'
+
+def find_generation(db: Session) -> CacheGeneration:
+  row = db.execute(
+    select(CacheGenerationEntity.generation, CacheGenerationEntity.updated_at)
+  ).first()
+  return CacheGeneration(row.generation, row.updated_at) if row else CacheGeneration(0, 0)
+
+def bump_generation(db: Session):
+  """ Record that the cached VINs changed. It runs in the caller's
+      transaction, so it's committed along with the change.
+  """
+  db.execute(
+    update(CacheGenerationEntity)
+    .values(generation=CacheGenerationEntity.generation + 1, updated_at=time.time())
+  )
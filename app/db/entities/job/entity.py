@@ -0,0 +1,49 @@
+from enum import Enum
+
+from sqlalchemy import Column, Float, Index, Integer, String
+from ...connection import Base
+
+class JobStatus(str, Enum):
+  PENDING = 'pending'
+  RUNNING = 'running'
+  COMPLETED = 'completed'
+
+class JobVinStatus(str, Enum):
+  """ `pending` until the VIN is looked up, then the status of its lookup. """
+  PENDING = 'pending'
+  CACHED = 'cached'
+  FETCHED = 'fetched'
+  NOT_FOUND = 'not_found'
+  INVALID = 'invalid'
+  ERROR = 'error'
+
+class JobEntity(Base):
+  """ A backfill job that looks up a list of VINs in the background. A
+      running job whose worker stopped showing signs of life, e.g. because
+      it was restarted, is taken over by another worker.
+  """
+  __tablename__ = 'job'
+
+  id = Column(String, primary_key=True)
+  status = Column(String, nullable=False, index=True)
+  vin_count = Column(Integer, nullable=False)
+  # The worker running the job and when it last made progress, as epoch seconds
+  owner = Column(String, nullable=True)
+  heartbeat_at = Column(Float, nullable=True)
+  created_at = Column(Float, nullable=False)
+  updated_at = Column(Float, nullable=False)
+
+class JobVinEntity(Base):
+  """ One VIN of a job and the outcome of its lookup. """
+  __tablename__ = 'job_vin'
+
+  id = Column(Integer, primary_key=True)
+  job_id = Column(String, nullable=False)
+  vin = Column(String, nullable=False)
+  status = Column(String, nullable=False)
+  detail = Column(String, nullable=False, default='')
+
+  # Workers take the pending VINs of a job in order, and the progress counts them by status
+  __table_args__ = (
+    Index('ix_job_vin_job_id_status_id', job_id, status, id),
+  )
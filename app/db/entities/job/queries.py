@@ -0,0 +1,150 @@
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from .entity import JobEntity, JobStatus, JobVinEntity, JobVinStatus
+
+# How many times a worker that lost the race for a job tries the next one
+_CLAIM_ATTEMPTS = 3
+
+@dataclass(frozen=True)
+class JobProgress:
+  id: str
+  status: JobStatus
+  vin_count: int
+  # The number of VINs by status, every status is included
+  counts: dict[JobVinStatus, int]
+  # Epoch seconds
+  created_at: float
+  updated_at: float
+
+@dataclass(frozen=True)
+class PendingVin:
+  id: int
+  vin: str
+
+def create_job(db: Session, job_id: str, vins: list[str], vin_errors: dict[str, str]):
+  """ Store a job of distinct VINs. The VINs in `vin_errors` are stored as
+      `invalid` with their error, the others are pending. A job without any
+      pending VIN is completed right away.
+  """
+  now = time.time()
+  has_pending_vins = len(vin_errors) < len(vins)
+  db.execute(insert(JobEntity).values(
+    id=job_id,
+    status=JobStatus.PENDING.value if has_pending_vins else JobStatus.COMPLETED.value,
+    vin_count=len(vins),
+    created_at=now,
+    updated_at=now,
+  ))
+  if vins:
+    db.execute(insert(JobVinEntity), [
+      {
+        'job_id': job_id,
+        'vin': vin,
+        'status': JobVinStatus.INVALID.value if vin in vin_errors else JobVinStatus.PENDING.value,
+        'detail': vin_errors.get(vin, ''),
+      }
+      for vin in vins
+    ])
+  db.commit()
+
+def find_job_progress(db: Session, job_id: str) -> JobProgress | None:
+  job = db.execute(
+    select(JobEntity.status, JobEntity.vin_count, JobEntity.created_at, JobEntity.updated_at)
+    .where(JobEntity.id == job_id)
+  ).first()
+  if not job:
+    return None
+
+  counts = dict.fromkeys(JobVinStatus, 0)
+  rows = db.execute(
+    select(JobVinEntity.status, func.count())
+    .where(JobVinEntity.job_id == job_id)
+    .group_by(JobVinEntity.status)
+  ).all()
+  for vin_status, count in rows:
+    counts[JobVinStatus(vin_status)] = count
+
+  return JobProgress(job_id, JobStatus(job.status), job.vin_count, counts, job.created_at, job.updated_at)
+
+def claim_job(db: Session, owner: str, stale_before: float) -> str | None:
+  """ Take the oldest pending job, or a running job whose worker made no
+      progress since `stale_before`, and return its id.
+  """
+  is_claimable = or_(
+    JobEntity.status == JobStatus.PENDING.value,
+    and_(JobEntity.status == JobStatus.RUNNING.value, JobEntity.heartbeat_at < stale_before),
+  )
+  # Skips the jobs that other PostgreSQL transactions are claiming, SQLite runs
+  # one writer at a time and leaves the clause out
+  oldest_job_id = (select(JobEntity.id)
+                   .where(is_claimable)
+                   .order_by(JobEntity.created_at)
+                   .limit(1)
+                   .with_for_update(skip_locked=True)
+                   .scalar_subquery())
+  for _ in range(_CLAIM_ATTEMPTS):
+    now = time.time()
+    # Checked again in the update, so that concurrent workers can't both claim the job
+    job_id = db.execute(
+      update(JobEntity)
+      .where(JobEntity.id == oldest_job_id, is_claimable)
+      .values(status=JobStatus.RUNNING.value, owner=owner, heartbeat_at=now, updated_at=now)
+      .returning(JobEntity.id)
+    ).scalar()
+    db.commit()
+    if job_id is not None:
+      return job_id
+    # Another worker claimed the job first, try the next one if there is one
+    if db.scalar(select(JobEntity.id).where(is_claimable).limit(1)) is None:
+      return None
+  return None
+
+def find_pending_vins(db: Session, job_id: str, limit: int) -> list[PendingVin]:
+  rows = db.execute(
+    select(JobVinEntity.id, JobVinEntity.vin)
+    .where(JobVinEntity.job_id == job_id, JobVinEntity.status == JobVinStatus.PENDING.value)
+    .order_by(JobVinEntity.id)
+    .limit(limit)
+  ).all()
+  return [PendingVin(row.id, row.vin) for row in rows]
+
+def record_outcomes(
+  db: Session,
+  job_id: str,
+  owner: str,
+  outcomes: dict[int, tuple[JobVinStatus, str]]
+) -> bool:
+  """ Store the status and detail of the job's VINs, by their id, and record
+      that the owner is making progress. Returns `False` without storing
+      anything if another worker took the job over.
+  """
+  now = time.time()
+  owned_count = db.execute(
+    update(JobEntity)
+    .where(JobEntity.id == job_id, JobEntity.owner == owner, JobEntity.status == JobStatus.RUNNING.value)
+    .values(heartbeat_at=now, updated_at=now)
+  ).rowcount
+  if owned_count == 0:
+    db.rollback()
+    return False
+
+  if outcomes:
+    # An update by primary key per VIN, sent in one go
+    db.execute(update(JobVinEntity), [
+      {'id': vin_id, 'status': vin_status.value, 'detail': detail}
+      for vin_id, (vin_status, detail) in outcomes.items()
+    ])
+  db.commit()
+  return True
+
+def complete_job(db: Session, job_id: str, owner: str):
+  (db
+    .query(JobEntity)
+    .filter(JobEntity.id == job_id, JobEntity.owner == owner)
+    .update({'status': JobStatus.COMPLETED.value, 'updated_at': time.time()})
+  )
+  db.commit()
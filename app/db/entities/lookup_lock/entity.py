@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Float, String
+from ...connection import Base
+
+class LookupLockEntity(Base):
+  """ A lock held by the worker that is fetching a VIN from upstream,
+      so that the other workers wait for the VIN to be cached instead.
+  """
+  __tablename__ = 'lookup_lock'
+
+  vin = Column(String(length=17), primary_key=True)
+  owner = Column(String, nullable=False)
+  expires_at = Column(Float, nullable=False)
@@ -0,0 +1,33 @@
+import time
+
+from sqlalchemy.orm import Session
+
+from .entity import LookupLockEntity
+from ...dialect import upsert_insert
+
+def try_acquire_lock(db: Session, vin: str, owner: str, ttl: float) -> bool:
+  """ Acquire the lock of the VIN unless another owner holds it. A lock
+      that was not released within `ttl` seconds can be taken over.
+  """
+  now = time.time()
+  (db
+    .query(LookupLockEntity)
+    .filter(LookupLockEntity.vin == vin, LookupLockEntity.expires_at < now)
+    .delete()
+  )
+
+  result = db.execute(
+    upsert_insert(db, LookupLockEntity)
+    .values(vin=vin, owner=owner, expires_at=now + ttl)
+    .on_conflict_do_nothing(index_elements=['vin'])
+  )
+  db.commit()
+  return result.rowcount == 1
+
+def release_lock(db: Session, vin: str, owner: str):
+  (db
+    .query(LookupLockEntity)
+    .filter(LookupLockEntity.vin == vin, LookupLockEntity.owner == owner)
+    .delete()
+  )
+  db.commit()
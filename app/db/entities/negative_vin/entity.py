@@ -0,0 +1,17 @@
+from enum import Enum
+
+from sqlalchemy import Column, Float, String
+from ...connection import Base
+
+class NegativeVinReason(str, Enum):
+  VPIC_NOT_DECODED = 'vpic_not_decoded'
+
+class NegativeVinEntity(Base):
+  """ A well-formed VIN that could not be decoded, so that lookups of
+      it are answered without another upstream call.
+  """
+  __tablename__ = 'negative_vin'
+
+  vin = Column(String(length=17), primary_key=True)
+  reason = Column(String, nullable=False)
+  created_at = Column(Float, nullable=False, index=True)
@@ -0,0 +1,76 @@
+import time
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from .entity import NegativeVinEntity, NegativeVinReason
+from ...dialect import upsert_insert
+
+def find_negative_vins(db: Session, vins: list[str], ttl: float) -> dict[str, str]:
+  """ Map each of the given VINs that was recorded as undecodable less
+      than `ttl` seconds ago to the reason it was recorded for.
+  """
+  if not vins:
+    return {}
+
+  rows = db.execute(
+    select(NegativeVinEntity.vin, NegativeVinEntity.reason)
+    .where(NegativeVinEntity.vin.in_(vins), NegativeVinEntity.created_at >= time.time() - ttl)
+  ).all()
+  return {row.vin: row.reason for row in rows}
+
+def find_negative_vin(db: Session, vin: str, ttl: float) -> str | None:
+  return find_negative_vins(db, [vin], ttl).get(vin)
+
+def insert_negative_vins(db: Session, vins: list[str], reason: NegativeVinReason):
+  """ Record the VINs as undecodable. Expired and excess entries are
+      left to `prune_negative_vins`.
+  """
+  if not vins:
+    return
+
+  now = time.time()
+  db.execute(
+    upsert_insert(db, NegativeVinEntity)
+    .on_conflict_do_update(
+      index_elements=['vin'],
+      set_={'reason': reason.value, 'created_at': now}
+    ),
+    [{'vin': vin, 'reason': reason.value, 'created_at': now} for vin in vins]
+  )
+  db.commit()
+
+def prune_negative_vins(db: Session, ttl: float, max_size: int) -> int:
+  """ Drop the expired entries, then the oldest entries beyond `max_size`.
+      Returns the number of entries dropped.
+  """
+  removed_count = (db
+    .query(NegativeVinEntity)
+    .filter(NegativeVinEntity.created_at < time.time() - ttl)
+    .delete()
+  )
+
+  excess_count = db.scalar(select(func.count()).select_from(NegativeVinEntity)) - max_size
+  if excess_count > 0:
+    # Entries recorded at once share their `created_at`, the VIN breaks the tie
+    oldest_vins = (
+      select(NegativeVinEntity.vin)
+      .order_by(NegativeVinEntity.created_at, NegativeVinEntity.vin)
+      .limit(excess_count)
+    )
+    removed_count += db.execute(
+      delete(NegativeVinEntity).where(NegativeVinEntity.vin.in_(oldest_vins))
+    ).rowcount
+
+  db.commit()
+  return removed_count
+
+def remove_negative_vin(db: Session, vin: str) -> bool:
+  removed_count = (db
+    .query(NegativeVinEntity)
+    .filter(NegativeVinEntity.vin == vin)
+    .delete()
+  )
+
+  db.commit()
+  return removed_count == 1
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Float, Integer, String, UniqueConstraint
+from ...connection import Base
+
+class PhotoEntity(Base):
+  """ The photo url of a make, model and model year. VINs of the same
+      vehicle share the photo, so it's cached separately from the VINs.
+      An empty photo url records that CarImagery has no photo.
+  """
+  __tablename__ = 'photo'
+
+  id = Column(Integer, primary_key=True)
+  make = Column(String, nullable=False)
+  model = Column(String, nullable=False)
+  model_year = Column(String, nullable=False)
+  photo_url = Column(String, nullable=False)
+  fetched_at = Column(Float, nullable=False)
+
+  __table_args__ = (
+    UniqueConstraint(make, model, model_year, name='uq_photo_make_model_model_year'),
+  )
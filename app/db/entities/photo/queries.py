@@ -0,0 +1,55 @@
+import time
+from typing import NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .entity import PhotoEntity
+from ...dialect import upsert_insert
+
+class PhotoKey(NamedTuple):
+  make: str
+  model: str
+  model_year: str
+
+class CachedPhoto(NamedTuple):
+  photo_url: str
+  is_stale: bool
+
+def to_photo_key(make: str, model: str, model_year: str) -> PhotoKey:
+  """ Normalize the vehicle so that spelling variants share the photo. """
+  return PhotoKey(*(' '.join(value.split()).upper() for value in (make, model, model_year)))
+
+def find_photo(db: Session, key: PhotoKey, ttl: float) -> CachedPhoto | None:
+  """ Find the cached photo of the vehicle, a photo fetched more than
+      `ttl` seconds ago is returned as stale.
+  """
+  row = db.execute(
+    select(PhotoEntity.photo_url, PhotoEntity.fetched_at)
+    .where(
+      PhotoEntity.make == key.make,
+      PhotoEntity.model == key.model,
+      PhotoEntity.model_year == key.model_year,
+    )
+  ).first()
+  if not row:
+    return None
+
+  return CachedPhoto(row.photo_url, is_stale=row.fetched_at < time.time() - ttl)
+
+def upsert_photo(db: Session, key: PhotoKey, photo_url: str):
+  row = {**key._asdict(), 'photo_url': photo_url, 'fetched_at': time.time()}
+  db.execute(
+    upsert_insert(db, PhotoEntity)
+    .values(**row)
+    .on_conflict_do_update(
+      index_elements=['make', 'model', 'model_year'],
+      set_={'photo_url': row['photo_url'], 'fetched_at': row['fetched_at']}
+    )
+  )
+  db.commit()
+
+def remove_all_photos(db: Session) -> int:
+  removed_count = db.query(PhotoEntity).delete()
+  db.commit()
+  return removed_count
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Float, Integer, String
+from ...connection import Base
+
+class RateLimitBucketEntity(Base):
+  """ The token bucket of an upstream, shared by all the workers. `tokens`
+      goes negative when callers reserve tokens ahead of time.
+  """
+  __tablename__ = 'rate_limit_bucket'
+
+  upstream = Column(String, primary_key=True)
+  tokens = Column(Float, nullable=False)
+  updated_at = Column(Float, nullable=False)
+
+class RateLimitLeaseEntity(Base):
+  """ One call in flight to an upstream. A lease that wasn't released
+      before it expired, e.g. because its worker died, no longer counts.
+  """
+  __tablename__ = 'rate_limit_lease'
+
+  id = Column(Integer, primary_key=True)
+  upstream = Column(String, nullable=False, index=True)
+  expires_at = Column(Float, nullable=False)
@@ -0,0 +1,70 @@
+import time
+
+from sqlalchemy import case, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from .entity import RateLimitBucketEntity, RateLimitLeaseEntity
+from ...dialect import upsert_insert
+
+def reserve_token(db: Session, upstream: str, rate: float, burst: int) -> float:
+  """ Take a token from the upstream's bucket, which refills at `rate` tokens
+      per second up to `burst` tokens. Returns how many seconds the caller
+      must wait before using the token, 0 if it can be used right away.
+  """
+  now = time.time()
+  db.execute(
+    upsert_insert(db, RateLimitBucketEntity)
+    .values(upstream=upstream, tokens=burst, updated_at=now)
+    .on_conflict_do_nothing(index_elements=['upstream'])
+  )
+
+  # Refill and take the token in one statement, so that concurrent workers can't
+  # both take the last token
+  refilled_tokens = (RateLimitBucketEntity.tokens
+                     + (literal(now) - RateLimitBucketEntity.updated_at) * rate)
+  tokens = db.execute(
+    update(RateLimitBucketEntity)
+    .where(RateLimitBucketEntity.upstream == upstream)
+    .values(
+      tokens=case((refilled_tokens > burst, burst), else_=refilled_tokens) - 1,
+      updated_at=now,
+    )
+    .returning(RateLimitBucketEntity.tokens)
+  ).scalar_one()
+  db.commit()
+  return max(0.0, -tokens / rate)
+
+def try_acquire_lease(db: Session, upstream: str, max_concurrency: int, ttl: float) -> int | None:
+  """ Lease one of the `max_concurrency` slots of the upstream. Returns the
+      id of the lease, or `None` if all the slots are taken.
+  """
+  # Under read committed, concurrent transactions could each count the leases before
+  # the others insert theirs. SQLite has one writer at a time, the delete waits its turn.
+  if db.get_bind().dialect.name == 'postgresql':
+    db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f'rate_limit_lease:{upstream}'))))
+
+  now = time.time()
+  (db
+    .query(RateLimitLeaseEntity)
+    .filter(RateLimitLeaseEntity.upstream == upstream, RateLimitLeaseEntity.expires_at < now)
+    .delete()
+  )
+
+  active_count = (select(func.count(RateLimitLeaseEntity.id))
+                  .where(RateLimitLeaseEntity.upstream == upstream)
+                  .scalar_subquery())
+  # Count and insert in one statement, so that a slot freed in between isn't missed
+  lease_id = db.execute(
+    insert(RateLimitLeaseEntity)
+    .from_select(
+      ['upstream', 'expires_at'],
+      select(literal(upstream), literal(now + ttl)).where(active_count < max_concurrency)
+    )
+    .returning(RateLimitLeaseEntity.id)
+  ).scalar()
+  db.commit()
+  return lease_id
+
+def release_lease(db: Session, lease_id: int):
+  db.query(RateLimitLeaseEntity).filter(RateLimitLeaseEntity.id == lease_id).delete()
+  db.commit()
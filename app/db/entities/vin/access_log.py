@@ -0,0 +1,23 @@
+import threading
+import time
+
+class AccessLog:
+  """ Collects when each VIN was last served from the cache, so that the
+      cache maintenance can write them to the database in one batch instead
+      of every lookup writing to it.
+  """
+  def __init__(self):
+    self._accessed_at: dict[str, float] = {}
+    self._lock = threading.Lock()
+
+  def touch(self, vin: str):
+    with self._lock:
+      self._accessed_at[vin] = time.time()
+
+  def drain(self) -> dict[str, float]:
+    """ Return the accesses collected since the last drain. """
+    with self._lock:
+      accessed_at, self._accessed_at = self._accessed_at, {}
+    return accessed_at
+
+vin_access_log = AccessLog()
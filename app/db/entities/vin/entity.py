@@ -1,6 +1,14 @@
-from sqlalchemy import Column, Integer, String
+import time
+
+from sqlalchemy import Column, Float, Index, Integer, String
 from ...connection import Base
 
+# The columns the `search` API matches words in. SQLite indexes them in the `vin_search`
+# FTS5 table, PostgreSQL in a full-text index on `POSTGRES_SEARCH_DOCUMENT`, which
+# queries must use verbatim for the index to be used.
+SEARCH_COLUMNS = ['make', 'model', 'body_class', 'model_year']
+POSTGRES_SEARCH_DOCUMENT = "to_tsvector('simple', make || ' ' || model || ' ' || body_class || ' ' || model_year)"
+
 class VinEntity(Base):
   """ The entity that models the data in the Vin cache. """
   __tablename__ = 'vin'
@@ -12,3 +20,15 @@ class VinEntity(Base):
   model_year = Column(String, nullable=False)
   body_class = Column(String, nullable=False)
   photo_url = Column(String, nullable=False)
+  # Epoch seconds, the cache maintenance evicts rows by one of them. Their
+  # indexes are created by the migration that adds them, not declared here.
+  created_at = Column(Float, nullable=False, default=time.time)
+  last_accessed_at = Column(Float, nullable=False, default=time.time)
+
+  # The `list` API filters on these columns and pages through the results by `id`.
+  # The migrations create every index declared here on the columns above.
+  __table_args__ = (
+    Index('ix_vin_make_model_model_year_id', make, model, model_year, id),
+    Index('ix_vin_model_year_id', model_year, id),
+    Index('ix_vin_body_class_id', body_class, id),
+  )
@@ -0,0 +1,10 @@
+from ...memory_cache import MemoryCache
+from ....schemas.vin import Vin
+from ....settings import settings
+
+# The in-process tier in front of the `vin` table, keyed by the upper case VIN.
+# The stored `Vin`s were validated when they were cached, so they can be served as is.
+vin_memory_cache = MemoryCache[Vin](
+  max_size=settings.vin_memory_cache_max_size,
+  ttl=settings.vin_memory_cache_ttl,
+)
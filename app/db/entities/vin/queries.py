@@ -1,6 +1,22 @@
+import re
+from typing import Iterator
+
+from sqlalchemy import Row, Select, bindparam, column, func, literal_column, select, table, update
 from sqlalchemy.orm import Session
 from ....schemas import Vin
-from .entity import VinEntity
+from .entity import POSTGRES_SEARCH_DOCUMENT, VinEntity
+from ..cache_generation import queries as generation_queries
+from ...dialect import upsert_insert
+from .memory_cache import vin_memory_cache
+
+# The columns of a VIN row, in the order of the `Vin` fields
+VIN_COLUMNS = ['vin', 'make', 'model', 'model_year', 'body_class', 'photo_url']
+# A rough size of a row beyond its strings: the id, timestamps and index entries
+ROW_OVERHEAD_BYTES = 100
+# Stay well below the number of bound parameters a query may have
+_IN_QUERY_BATCH_SIZE = 500
+# The full-text index of SQLite, whose rowid is the `id` of the VIN
+_vin_search_table = table('vin_search', column('rowid'))
 
 def get_all_vins(db: Session) -> list[Vin]:
   return [
@@ -15,12 +31,117 @@ def get_all_vins(db: Session) -> list[Vin]:
     for vin_entity in db.query(VinEntity).all()
   ]
 
+def has_vins(db: Session) -> bool:
+  return db.query(VinEntity.id).first() is not None
+
+def iter_vin_rows(db: Session, batch_size: int) -> Iterator[list[tuple[str, ...]]]:
+  """ Stream every cached VIN as plain tuples of `VIN_COLUMNS`,
+      `batch_size` rows at a time, without loading the whole table.
+  """
+  columns = [getattr(VinEntity, column) for column in VIN_COLUMNS]
+  result = db.execute(
+    select(*columns)
+    .order_by(VinEntity.id)
+    .execution_options(yield_per=batch_size)
+  )
+  for partition in result.partitions():
+    yield [tuple(row) for row in partition]
+
+def list_vin_rows(
+  db: Session,
+  columns: list[str],
+  filters: dict[str, str],
+  after_id: int | None,
+  limit: int
+) -> list[Row]:
+  """ Get a page of at most `limit` VINs with an `id` greater than `after_id`,
+      ordered by `id`. Only `id` and the given columns are selected and each
+      `filters` item is an equality filter on a column.
+  """
+  query = select(VinEntity.id, *(getattr(VinEntity, column) for column in columns))
+  for column, value in filters.items():
+    query = query.where(getattr(VinEntity, column) == value)
+  if after_id is not None:
+    query = query.where(VinEntity.id > after_id)
+
+  return db.execute(query.order_by(VinEntity.id).limit(limit)).all()
+
+def to_search_terms(text: str) -> list[str]:
+  """ Split a search into lower case words, the way the full-text index
+      splits the columns it indexes.
+  """
+  return re.findall(r'[^\W_]+', text.lower())
+
+def search_vins(
+  db: Session,
+  terms: list[str],
+  vin_prefix: str,
+  offset: int,
+  limit: int,
+  max_ranked_count: int
+) -> list[Vin]:
+  """ Find the VINs that start with `vin_prefix` and whose make, model, body
+      class and model year have each of the `terms` as a word, except for the
+      last term which only has to start a word, as it may still be typed.
+      Either can be empty, but not both. Matches of the terms come best first,
+      unless there are more than `max_ranked_count` of them, which would take
+      too long to rank, they then come in the order they were cached. VINs
+      found by their prefix alone come in VIN order.
+  """
+  query = select(*(getattr(VinEntity, column) for column in VIN_COLUMNS))
+  if vin_prefix:
+    # A range on the VIN's unique index, unlike LIKE which SQLite can't use it for
+    query = query.where(VinEntity.vin >= vin_prefix, VinEntity.vin < _next_prefix(vin_prefix))
+
+  if terms:
+    query, ranked_order, cached_order = _match_terms(db, query, terms)
+    # Only counted up to the limit, so that a broad search is cheap to count too
+    matches = query.with_only_columns(VinEntity.id).limit(max_ranked_count + 1).subquery()
+    match_count = db.execute(select(func.count()).select_from(matches)).scalar()
+    query = query.order_by(*(ranked_order if match_count <= max_ranked_count else cached_order))
+  else:
+    query = query.order_by(VinEntity.vin)
+
+  rows = db.execute(query.offset(offset).limit(limit)).all()
+  # The rows were validated when they were cached
+  return [Vin.model_construct(**row._asdict()) for row in rows]
+
+def _match_terms(db: Session, query: Select, terms: list[str]) -> tuple[Select, list, list]:
+  """ Filter the query on the terms, and return it with the ordering by
+      rank and the ordering in which the VINs were cached.
+  """
+  match db.get_bind().dialect.name:
+    case 'sqlite':
+      vin_search = literal_column('vin_search')
+      # Quoted so that the terms are never read as FTS5 operators. Whole words are
+      # looked up directly, a prefix is slower as every word it starts is merged.
+      quoted_terms = ['"{}"'.format(term.replace('"', '""')) for term in terms]
+      match_query = ' AND '.join(quoted_terms) + '*'
+      query = (query
+        .join(_vin_search_table, _vin_search_table.c.rowid == VinEntity.id)
+        .where(vin_search.op('MATCH')(match_query)))
+      # The index returns its matches by rowid, so that order needs no sorting
+      return query, [func.bm25(vin_search), VinEntity.id], [_vin_search_table.c.rowid]
+    case 'postgresql':
+      document = literal_column(POSTGRES_SEARCH_DOCUMENT)
+      quoted_terms = ["'{}'".format(term.replace("'", "''")) for term in terms]
+      ts_query = func.to_tsquery('simple', ' & '.join(quoted_terms) + ':*')
+      query = query.where(document.op('@@')(ts_query))
+      return query, [func.ts_rank(document, ts_query).desc(), VinEntity.id], [VinEntity.id]
+    case dialect_name:
+      raise NotImplementedError(f'Search is not supported for {dialect_name}.')
+
+def _next_prefix(prefix: str) -> str:
+  """ The first string after all the strings that start with `prefix`. """
+  return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
 def find_vin(db: Session, vin: str) -> Vin | None:
   vin_entity = db.query(VinEntity).filter(VinEntity.vin == vin).first()
   if not vin_entity:
     return None
 
-  return Vin(
+  # The row was validated when it was cached
+  cache_vin = Vin.model_construct(
     vin=vin_entity.vin,
     make=vin_entity.make,
     model=vin_entity.model,
@@ -28,19 +149,111 @@ def find_vin(db: Session, vin: str) -> Vin | None:
     body_class=vin_entity.body_class,
     photo_url=vin_entity.photo_url,
   )
+  vin_memory_cache.put(cache_vin.vin, cache_vin)
+  return cache_vin
+
+def find_vins(db: Session, vins: list[str]) -> list[Vin]:
+  """ Find all the given VINs that are in the cache with one query. The rows
+      were validated when they were cached, so they aren't validated again.
+  """
+  if not vins:
+    return []
+
+  return [
+    Vin.model_construct(
+      vin=vin_entity.vin,
+      make=vin_entity.make,
+      model=vin_entity.model,
+      model_year=vin_entity.model_year,
+      body_class=vin_entity.body_class,
+      photo_url=vin_entity.photo_url,
+    )
+    for vin_entity in db.query(VinEntity).filter(VinEntity.vin.in_(vins)).all()
+  ]
 
 def insert_vin(db: Session, vin: Vin):
-  vin_entity = VinEntity(
-    vin=vin.vin,
-    make=vin.make,
-    model=vin.model,
-    model_year=vin.model_year,
-    body_class=vin.body_class,
-    photo_url=vin.photo_url,
+  """ Insert the VIN, or overwrite it if it is already in the cache,
+      so that concurrent inserts of the same VIN don't conflict.
+  """
+  row = vin.model_dump()
+  db.execute(
+    upsert_insert(db, VinEntity)
+    .values(**row)
+    .on_conflict_do_update(
+      index_elements=['vin'],
+      set_={column: row[column] for column in VIN_COLUMNS if column != 'vin'}
+    )
+  )
+  generation_queries.bump_generation(db)
+  db.commit()
+  vin_memory_cache.put(vin.vin, vin)
+
+def insert_vins(db: Session, vins: list[Vin]):
+  """ Insert multiple VINs with one bulk insert. VINs that are
+      already in the cache are skipped.
+  """
+  insert_vin_rows(db, [vin.model_dump() for vin in vins])
+
+def insert_vin_rows(db: Session, rows: list[dict[str, str]]):
+  """ Same as `insert_vins` but for rows that are already validated,
+      each row has the same keys as the fields of `Vin`.
+  """
+  if not rows:
+    return
+
+  # Insert into the table rather than the entity, which skips the ORM's bulk
+  # persistence bookkeeping that dominates the cost of large inserts
+  db.execute(
+    upsert_insert(db, VinEntity.__table__).on_conflict_do_nothing(index_elements=['vin']),
+    rows
+  )
+  generation_queries.bump_generation(db)
+  db.commit()
+
+def upsert_vin_rows(db: Session, rows: list[dict[str, str]]) -> int:
+  """ Same as `insert_vin_rows` but VINs that are already in the cache are
+      overwritten. Each VIN may only appear once. Returns the number of VINs
+      that were already in the cache.
+  """
+  if not rows:
+    return 0
+
+  vins = [row['vin'] for row in rows]
+  cached_vins = [
+    vin
+    for start in range(0, len(vins), _IN_QUERY_BATCH_SIZE)
+    for vin in db.scalars(
+      select(VinEntity.vin).where(VinEntity.vin.in_(vins[start:start + _IN_QUERY_BATCH_SIZE]))
+    )
+  ]
+
+  statement = upsert_insert(db, VinEntity.__table__)
+  db.execute(
+    statement.on_conflict_do_update(
+      index_elements=['vin'],
+      set_={column: statement.excluded[column] for column in VIN_COLUMNS if column != 'vin'}
+    ),
+    rows
+  )
+  generation_queries.bump_generation(db)
+  db.commit()
+
+  for vin in cached_vins:
+    vin_memory_cache.invalidate(vin)
+  return len(cached_vins)
+
+def update_photo_url(db: Session, vin: str, photo_url: str) -> bool:
+  updated_count = (db
+    .query(VinEntity)
+    .filter(VinEntity.vin == vin)
+    .update({VinEntity.photo_url: photo_url})
   )
+  if updated_count:
+    generation_queries.bump_generation(db)
 
-  db.add(vin_entity)
   db.commit()
+  vin_memory_cache.invalidate(vin)
+  return updated_count == 1
 
 def remove_vin(db: Session, vin: str) -> bool:
   removed_count = (db
@@ -48,6 +261,123 @@ def remove_vin(db: Session, vin: str) -> bool:
     .filter(VinEntity.vin == vin)
     .delete()
   )
+  if removed_count:
+    generation_queries.bump_generation(db)
 
   db.commit()
+  vin_memory_cache.invalidate(vin)
   return removed_count == 1
+
+def touch_vins(db: Session, accessed_at: dict[str, float]):
+  """ Record when each VIN was last served from the cache. """
+  if not accessed_at:
+    return
+
+  table = VinEntity.__table__
+  db.execute(
+    update(table)
+    .where(table.c.vin == bindparam('accessed_vin'))
+    .values(last_accessed_at=bindparam('accessed_at')),
+    [{'accessed_vin': vin, 'accessed_at': timestamp} for vin, timestamp in accessed_at.items()]
+  )
+  db.commit()
+
+def measure_vins(db: Session) -> tuple[int, int]:
+  """ Return the number of cached VINs and an estimate of their size in bytes. """
+  row_count, string_bytes = db.execute(
+    select(
+      func.count(VinEntity.id),
+      func.sum(
+        func.length(VinEntity.vin) + func.length(VinEntity.make) + func.length(VinEntity.model)
+        + func.length(VinEntity.model_year) + func.length(VinEntity.body_class)
+        + func.length(VinEntity.photo_url)
+      ),
+    )
+  ).one()
+  return row_count, (string_bytes or 0) + row_count * ROW_OVERHEAD_BYTES
+
+def remove_vins(db: Session, vins: list[str]) -> list[str]:
+  """ Remove the given VINs with one delete per batch. Returns the removed VINs. """
+  return _remove_vin_rows(db, [
+    row
+    for start in range(0, len(vins), _IN_QUERY_BATCH_SIZE)
+    for row in db.execute(
+      select(VinEntity.id, VinEntity.vin).where(VinEntity.vin.in_(vins[start:start + _IN_QUERY_BATCH_SIZE]))
+    )
+  ])
+
+def remove_vins_created_before(db: Session, created_before: float, limit: int) -> list[str]:
+  """ Remove at most `limit` VINs cached before `created_before`,
+      the oldest first. Returns the removed VINs.
+  """
+  return _remove_vin_rows(db, db.execute(
+    select(VinEntity.id, VinEntity.vin)
+    .where(VinEntity.created_at < created_before)
+    .order_by(VinEntity.created_at, VinEntity.id)
+    .limit(limit)
+  ).all())
+
+def remove_oldest_vins(db: Session, count: int, by_last_access: bool) -> list[str]:
+  """ Remove the `count` least recently served VINs, or the `count` VINs
+      that were cached first. Returns the removed VINs.
+  """
+  order_column = VinEntity.last_accessed_at if by_last_access else VinEntity.created_at
+  return _remove_vin_rows(db, db.execute(
+    select(VinEntity.id, VinEntity.vin)
+    .order_by(order_column, VinEntity.id)
+    .limit(count)
+  ).all())
+
+def _remove_vin_rows(db: Session, rows: list[Row]) -> list[str]:
+  ids = [row.id for row in rows]
+  for start in range(0, len(ids), _IN_QUERY_BATCH_SIZE):
+    (db
+      .query(VinEntity)
+      .filter(VinEntity.id.in_(ids[start:start + _IN_QUERY_BATCH_SIZE]))
+      .delete(synchronize_session=False)
+    )
+  if rows:
+    generation_queries.bump_generation(db)
+  db.commit()
+
+  for row in rows:
+    vin_memory_cache.invalidate(row.vin)
+  return [row.vin for row in rows]
+
+def find_vehicles_without_photo(
+  db: Session,
+  after_id: int,
+  limit: int
+) -> list[Row[tuple[int, str, str, str]]]:
+  """ Page through the VINs that have no photo by `id`, returning
+      the `id`, `make`, `model` and `model_year` of each.
+  """
+  return db.execute(
+    select(VinEntity.id, VinEntity.make, VinEntity.model, VinEntity.model_year)
+    .where(VinEntity.photo_url == '', VinEntity.id > after_id)
+    .order_by(VinEntity.id)
+    .limit(limit)
+  ).all()
+
+def fill_empty_photo_urls(db: Session, make: str, model: str, model_year: str, photo_url: str) -> list[str]:
+  """ Set the photo of every VIN of the vehicle that has none.
+      Returns the updated VINs.
+  """
+  vins = db.scalars(
+    select(VinEntity.vin)
+    .where(VinEntity.make == make, VinEntity.model == model,
+           VinEntity.model_year == model_year, VinEntity.photo_url == '')
+  ).all()
+  for start in range(0, len(vins), _IN_QUERY_BATCH_SIZE):
+    (db
+      .query(VinEntity)
+      .filter(VinEntity.vin.in_(vins[start:start + _IN_QUERY_BATCH_SIZE]))
+      .update({VinEntity.photo_url: photo_url}, synchronize_session=False)
+    )
+  if vins:
+    generation_queries.bump_generation(db)
+  db.commit()
+
+  for vin in vins:
+    vin_memory_cache.invalidate(vin)
+  return list(vins)
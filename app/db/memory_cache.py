@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+T = TypeVar('T')
+
+@dataclass
+class MemoryCacheStats:
+  hits: int = 0
+  misses: int = 0
+  evictions: int = 0
+  size: int = 0
+
+class MemoryCache(Generic[T]):
+  """ A bounded, thread safe, in-process LRU cache. Entries older than
+      `ttl` seconds are treated as missing, a `ttl` of 0 disables expiry.
+      A `max_size` of 0 disables the cache altogether.
+  """
+  def __init__(self, max_size: int, ttl: float):
+    self.max_size = max_size
+    self.ttl = ttl
+    self._entries: OrderedDict[str, tuple[float, T]] = OrderedDict()
+    self._lock = threading.Lock()
+    self._stats = MemoryCacheStats()
+
+  def get(self, key: str) -> T | None:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        self._stats.misses += 1
+        return None
+
+      stored_at, value = entry
+      if self.ttl and time.monotonic() - stored_at > self.ttl:
+        del self._entries[key]
+        self._stats.misses += 1
+        self._stats.evictions += 1
+        return None
+
+      self._entries.move_to_end(key)
+      self._stats.hits += 1
+      return value
+
+  def put(self, key: str, value: T):
+    if self.max_size <= 0:
+      return
+
+    with self._lock:
+      self._entries[key] = (time.monotonic(), value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_size:
+        self._entries.popitem(last=False)
+        self._stats.evictions += 1
+
+  def invalidate(self, key: str):
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self) -> MemoryCacheStats:
+    with self._lock:
+      return MemoryCacheStats(
+        hits=self._stats.hits,
+        misses=self._stats.misses,
+        evictions=self._stats.evictions,
+        size=len(self._entries),
+      )
@@ -0,0 +1,147 @@
+from typing import Callable
+
+import time
+
+from sqlalchemy import Column, Engine, Integer, MetaData, Table, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+
+from .entities import (
+  CacheGenerationEntity, JobEntity, JobVinEntity, LookupLockEntity, NegativeVinEntity, PhotoEntity,
+  RateLimitBucketEntity, RateLimitLeaseEntity, VinEntity,
+)
+from .entities.vin.entity import POSTGRES_SEARCH_DOCUMENT, SEARCH_COLUMNS
+
+# The key of the PostgreSQL advisory lock held while migrating
+_MIGRATION_LOCK_ID = 0x76696e5f6d6967
+
+schema_version_table = Table(
+  'schema_version',
+  MetaData(),
+  Column('version', Integer, nullable=False),
+)
+
+def _create_vin_table(connection: Connection):
+  VinEntity.__table__.create(connection, checkfirst=True)
+
+def _create_vin_list_indexes(connection: Connection):
+  for index in VinEntity.__table__.indexes:
+    index.create(connection, checkfirst=True)
+
+def _create_lookup_lock_table(connection: Connection):
+  LookupLockEntity.__table__.create(connection, checkfirst=True)
+
+def _create_negative_vin_table(connection: Connection):
+  NegativeVinEntity.__table__.create(connection, checkfirst=True)
+
+def _create_photo_table(connection: Connection):
+  PhotoEntity.__table__.create(connection, checkfirst=True)
+
+def _add_vin_timestamps(connection: Connection):
+  # The table is already created with these columns in a new database
+  columns = {column['name'] for column in inspect(connection).get_columns('vin')}
+  for column in ['created_at', 'last_accessed_at']:
+    if column not in columns:
+      # Rows cached before the upgrade count as new
+      connection.execute(text(
+        f'ALTER TABLE vin ADD COLUMN {column} FLOAT NOT NULL DEFAULT {time.time()}'
+      ))
+
+  # Not declared on the entity, `_create_vin_list_indexes` creates all of its
+  # indexes while these columns don't exist yet
+  for column in ['created_at', 'last_accessed_at']:
+    connection.execute(text(f'CREATE INDEX IF NOT EXISTS ix_vin_{column} ON vin ({column})'))
+
+def _create_rate_limit_tables(connection: Connection):
+  RateLimitBucketEntity.__table__.create(connection, checkfirst=True)
+  RateLimitLeaseEntity.__table__.create(connection, checkfirst=True)
+
+def _create_cache_generation_table(connection: Connection):
+  CacheGenerationEntity.__table__.create(connection, checkfirst=True)
+  if connection.execute(select(CacheGenerationEntity.id)).first() is None:
+    connection.execute(insert(CacheGenerationEntity).values(id=1, generation=0, updated_at=time.time()))
+
+def _create_job_tables(connection: Connection):
+  JobEntity.__table__.create(connection, checkfirst=True)
+  JobVinEntity.__table__.create(connection, checkfirst=True)
+
+def _create_vin_search_index(connection: Connection):
+  # Triggers keep the index in step with every change to the `vin` table
+  columns = ', '.join(SEARCH_COLUMNS)
+  new_values = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+  old_values = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+  match connection.dialect.name:
+    case 'sqlite':
+      statements = [
+        # The index doesn't keep a copy of the columns, it reads them from `vin`. The
+        # prefix indexes make the short prefixes that are typed first fast too.
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS vin_search USING fts5("
+        f"{columns}, content='vin', content_rowid='id', prefix='2 3')",
+        f'CREATE TRIGGER IF NOT EXISTS vin_search_insert AFTER INSERT ON vin BEGIN '
+        f'INSERT INTO vin_search(rowid, {columns}) VALUES (new.id, {new_values}); END',
+        f"CREATE TRIGGER IF NOT EXISTS vin_search_delete AFTER DELETE ON vin BEGIN "
+        f"INSERT INTO vin_search(vin_search, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS vin_search_update AFTER UPDATE OF {columns} ON vin BEGIN "
+        f"INSERT INTO vin_search(vin_search, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO vin_search(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        # Index the VINs that are already cached
+        "INSERT INTO vin_search(vin_search) VALUES ('rebuild')",
+      ]
+    case 'postgresql':
+      statements = [f'CREATE INDEX IF NOT EXISTS ix_vin_search ON vin USING gin (({POSTGRES_SEARCH_DOCUMENT}))']
+    case dialect_name:
+      raise NotImplementedError(f'Search is not supported for {dialect_name}.')
+
+  for statement in statements:
+    connection.execute(text(statement))
+
+# The migration at index `i` upgrades the schema from version `i` to `i + 1`.
+# Only ever append to this list, never edit or reorder the existing migrations.
+MIGRATIONS: list[Callable[[Connection], None]] = [
+  _create_vin_table,
+  _create_vin_list_indexes,
+  _create_lookup_lock_table,
+  _create_negative_vin_table,
+  _create_photo_table,
+  _add_vin_timestamps,
+  _create_rate_limit_tables,
+  _create_cache_generation_table,
+  _create_job_tables,
+  _create_vin_search_index,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate(engine: Engine) -> int:
+  """ Bring the database schema up to `SCHEMA_VERSION` and return
+      the version the database was at before the migration.
+  """
+  with engine.begin() as connection:
+    # Workers that start together each migrate, the first one to get the lock
+    # does the work and the others find the schema up to date once they get it
+    _lock_schema(connection)
+    schema_version_table.create(connection, checkfirst=True)
+    version = connection.execute(select(func.max(schema_version_table.c.version))).scalar() or 0
+
+    if version > SCHEMA_VERSION:
+      raise RuntimeError(f'The database schema version {version} is newer than '
+                         f'the version {SCHEMA_VERSION} this app supports.')
+
+    for migration in MIGRATIONS[version:]:
+      migration(connection)
+
+    # Also drops the extra rows that concurrent migrations used to insert
+    connection.execute(schema_version_table.delete())
+    connection.execute(schema_version_table.insert().values(version=SCHEMA_VERSION))
+    return version
+
+def _lock_schema(connection: Connection):
+  """ Hold a lock that serializes migrations until the transaction ends. """
+  match connection.dialect.name:
+    case 'sqlite':
+      # pysqlite only opens a transaction before the first write, this opens
+      # it right away and keeps other connections from writing until it ends
+      connection.exec_driver_sql('BEGIN EXCLUSIVE')
+    case 'postgresql':
+      connection.execute(select(func.pg_advisory_xact_lock(_MIGRATION_LOCK_ID)))
+    case dialect_name:
+      raise NotImplementedError(f'Migrations are not supported for {dialect_name}.')
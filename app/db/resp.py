@@ -0,0 +1,119 @@
+""" A minimal client of the Redis protocol (RESP2), enough for the shared
+    cache tier to talk to Redis or anything that speaks its protocol, e.g.
+    Valkey or KeyDB, without another dependency.
+"""
+import socket
+import threading
+from urllib.parse import unquote, urlparse
+
+Reply = bytes | int | list['Reply'] | None
+
+class RespError(Exception):
+  """ An error reply, or a connection that failed. """
+
+class RespConnection:
+  def __init__(self, url: str, timeout: float | None):
+    """ `url` is e.g. `redis://:password@localhost:6379/0`. A `timeout` of
+        `None` blocks forever, which is meant for subscriptions.
+    """
+    parsed_url = urlparse(url)
+    if parsed_url.scheme != 'redis':
+      raise ValueError(f'Only redis:// URLs are supported, not "{url}".')
+
+    try:
+      self._socket = socket.create_connection(
+        (parsed_url.hostname or 'localhost', parsed_url.port or 6379), timeout=timeout
+      )
+    except OSError as ex:
+      raise RespError(f'Failed to connect to {parsed_url.hostname}:{parsed_url.port}.') from ex
+    self._reader = self._socket.makefile('rb')
+
+    if parsed_url.password:
+      credentials = [unquote(parsed_url.password)]
+      if parsed_url.username:
+        credentials.insert(0, unquote(parsed_url.username))
+      self.execute('AUTH', *credentials)
+    database = parsed_url.path.lstrip('/')
+    if database and database != '0':
+      self.execute('SELECT', database)
+
+  def execute(self, *args: str | bytes | int | float) -> Reply:
+    self.send(*args)
+    return self.read_reply()
+
+  def send(self, *args: str | bytes | int | float):
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+      data = arg if isinstance(arg, bytes) else str(arg).encode()
+      parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    try:
+      self._socket.sendall(b''.join(parts))
+    except OSError as ex:
+      raise RespError('Failed to send the command.') from ex
+
+  def read_reply(self) -> Reply:
+    try:
+      line = self._reader.readline()
+    except OSError as ex:
+      raise RespError('Failed to read the reply.') from ex
+    if not line.endswith(b'\r\n'):
+      raise RespError('The connection was closed.')
+
+    kind, value = line[:1], line[1:-2]
+    match kind:
+      case b'+':
+        return value
+      case b'-':
+        raise RespError(value.decode(errors='replace'))
+      case b':':
+        return int(value)
+      case b'$':
+        if int(value) < 0:
+          return None
+        data = self._reader.read(int(value) + 2)
+        return data[:-2]
+      case b'*':
+        if int(value) < 0:
+          return None
+        return [self.read_reply() for _ in range(int(value))]
+      case _:
+        raise RespError(f'Unexpected reply {line!r}.')
+
+  def close(self):
+    # Also wakes up a thread blocked reading from the connection
+    try:
+      self._socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
+    self._reader.close()
+    self._socket.close()
+
+class RespClient:
+  """ Runs each command on a connection of the calling thread, so that the
+      threadpool's threads don't wait on each other. The connection is
+      opened again on the next command after an error.
+  """
+  def __init__(self, url: str, timeout: float):
+    self.url = url
+    self.timeout = timeout
+    self._local = threading.local()
+
+  def execute(self, *args: str | bytes | int | float) -> Reply:
+    return self.execute_many([args])[0]
+
+  def execute_many(self, commands: list[tuple[str | bytes | int | float, ...]]) -> list[Reply]:
+    """ Send all the commands at once and then read their replies. """
+    connection = getattr(self._local, 'connection', None)
+    if connection is None:
+      connection = RespConnection(self.url, self.timeout)
+      self._local.connection = connection
+
+    try:
+      for args in commands:
+        connection.send(*args)
+      return [connection.read_reply() for _ in commands]
+    except RespError:
+      # The replies after an error may still be unread, so start over
+      connection.close()
+      self._local.connection = None
+      raise
@@ -0,0 +1,134 @@
+""" Bulk loading of files into the cache. pandas, numpy and fastparquet are
+    only imported once a file is loaded, they are slow to import and most
+    workers never load a file.
+"""
+import functools
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterator
+
+from sqlalchemy.orm import Session
+
+from .cache_backends import CacheBackend
+from .entities.vin import queries as vin_queries
+from .. import vin_analysis
+
+if TYPE_CHECKING:
+  import numpy as np
+  import pandas as pd
+
+_CSV_CHUNK_SIZE = 50_000
+
+_VIN_PATTERN = f'[{"".join(sorted(vin_analysis.VIN_CHARACTERS))}]{{{vin_analysis.VIN_LENGTH}}}'
+_URL_PATTERN = r'(?:[A-Za-z][A-Za-z0-9+.-]*://[^/?#\s]+\S*)?'
+
+@dataclass
+class ImportCounts:
+  inserted: int = 0
+  updated: int = 0
+  rejected: int = 0
+
+def warm_up_cache(db: Session, file_path: str) -> int:
+  """ Load the VINs of a file produced by the `export` API into the cache.
+      The file format is chosen by the file extension, `.csv` or `.parquet`.
+      VINs that are already in the cache are skipped. Returns the number of
+      rows read from the file that passed validation.
+  """
+  _, extension = os.path.splitext(file_path)
+  file_format = extension.lower().lstrip('.')
+  if file_format == 'parq':
+    file_format = 'parquet'
+
+  loaded_count = 0
+  for df in read_chunks(file_path, file_format):
+    rows = _to_valid_rows(df)
+    vin_queries.insert_vin_rows(db, rows)
+    loaded_count += len(rows)
+  return loaded_count
+
+def import_vins(cache_backend: CacheBackend, file_path: str, file_format: str) -> ImportCounts:
+  """ Load the VINs of a `csv` or `parquet` file with the columns of the
+      `export` API into the cache, one chunk at a time. VINs that are already
+      in the cache are overwritten. Rows that fail validation are counted
+      as rejected. Raises `ValueError` if the file can't be read, the chunks
+      read before that stay imported.
+  """
+  counts = ImportCounts()
+  for df in read_chunks(file_path, file_format):
+    rows = _to_valid_rows(df)
+    # The last row of a VIN wins, like it would with one upsert per row
+    unique_rows = list({row['vin']: row for row in rows}.values())
+    cached_count = cache_backend.upsert_vin_rows(unique_rows)
+
+    counts.rejected += len(df) - len(rows)
+    counts.inserted += len(unique_rows) - cached_count
+    counts.updated += len(rows) - len(unique_rows) + cached_count
+  return counts
+
+def read_chunks(file_path: str, file_format: str) -> Iterator['pd.DataFrame']:
+  import fastparquet
+  import pandas as pd
+
+  match file_format:
+    case 'csv':
+      yield from pd.read_csv(file_path, sep=',', header=0, dtype=str,
+                             keep_default_na=False, chunksize=_CSV_CHUNK_SIZE)
+    case 'parquet':
+      try:
+        parquet_file = fastparquet.ParquetFile(file_path)
+      except Exception as ex:
+        raise ValueError(f'"{file_path}" is not a valid Parquet file.') from ex
+      yield from parquet_file.iter_row_groups(columns=vin_queries.VIN_COLUMNS)
+    case _:
+      raise ValueError(f'Cannot load the cache from "{file_path}", '
+                       'only .csv and .parquet files are supported.')
+
+def _to_valid_rows(df: 'pd.DataFrame') -> list[dict[str, str]]:
+  """ Validate all the rows of the chunk at once rather than
+      building a `Vin` per row, it's much faster.
+  """
+  missing_columns = [column for column in vin_queries.VIN_COLUMNS if column not in df.columns]
+  if missing_columns:
+    raise ValueError(f'The file is missing the columns {", ".join(missing_columns)}.')
+
+  df = df[vin_queries.VIN_COLUMNS].fillna('').astype(str).apply(lambda column: column.str.strip())
+  df['vin'] = df['vin'].str.upper()
+
+  is_valid = _find_valid_vins(df['vin'])
+  for column in ['make', 'model', 'model_year', 'body_class']:
+    is_valid &= df[column] != ''
+  is_valid &= df['photo_url'].str.fullmatch(_URL_PATTERN)
+
+  # Much faster than `to_dict('records')`
+  return [
+    dict(zip(vin_queries.VIN_COLUMNS, row))
+    for row in df[is_valid].itertuples(index=False, name=None)
+  ]
+
+@functools.cache
+def _transliteration_table() -> 'np.ndarray':
+  """ The value of each VIN character in the check digit, indexed by its ASCII code. """
+  import numpy as np
+
+  table = np.zeros(128, dtype=np.int64)
+  for character, value in vin_analysis.TRANSLITERATIONS.items():
+    table[ord(character)] = value
+  return table
+
+def _find_valid_vins(vins: 'pd.Series') -> 'pd.Series':
+  """ The vectorized version of `vin_analysis.is_vin_valid`. """
+  import numpy as np
+
+  is_valid = vins.str.fullmatch(_VIN_PATTERN).astype(bool)
+  checked = is_valid & vins.str[0].isin(list(vin_analysis.NORTH_AMERICA_CODES))
+  if not checked.any():
+    return is_valid
+
+  checked_vins = vins[checked]
+  characters = np.frombuffer(''.join(checked_vins).encode('ascii'), dtype=np.uint8)
+  characters = characters.reshape(-1, vin_analysis.VIN_LENGTH)
+  remainders = _transliteration_table()[characters] @ np.array(vin_analysis.CHECK_DIGIT_WEIGHTS) % 11
+  expected_check_digits = np.where(remainders == 10, ord('X'), ord('0') + remainders)
+
+  is_valid[checked] = characters[:, vin_analysis.CHECK_DIGIT_INDEX] == expected_check_digits
+  return is_valid
@@ -1,73 +1,221 @@
-import tempfile
-
+import csv
+import io
+import os
+import struct
+import threading
+from email.utils import formatdate, parsedate_to_datetime
 from enum import Enum
+from typing import TYPE_CHECKING, BinaryIO, Iterator
 
-import fastparquet
-import pandas as pd
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
-from fastapi.responses import FileResponse
-from sqlalchemy.orm.session import Session
+from fastapi import APIRouter, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
-from ...db.connection import get_db_session
+from ... import metrics
+from ...db import cache_backends
+from ...db.entities.cache_generation import queries as generation_queries
 from ...db.entities.vin import queries as vin_queries
-from ...schemas.vin import Vin
+from ...settings import settings
+from . import snapshots
+
+if TYPE_CHECKING:
+  import pandas as pd
 
 class ExportFormat(str, Enum):
   CSV = 'csv'
   PARQUET = 'parquet'
 
+_MEDIA_TYPES = {
+  ExportFormat.CSV: 'text/csv',
+  ExportFormat.PARQUET: 'application/vnd.apache.parquet',
+}
+
+# Concurrent requests for the same export wait for one build instead of each building it
+_build_locks = {export_format: threading.Lock() for export_format in ExportFormat}
+
 router = APIRouter()
 
 @router.get('/export', status_code=status.HTTP_200_OK)
 def export(
-  background_tasks: BackgroundTasks,
+  request: Request,
   export_format: ExportFormat = ExportFormat.CSV,
-  db_session: Session = Depends(get_db_session)
-) -> FileResponse:
-  vins = vin_queries.get_all_vins(db_session)
-  if not vins:
-    return None
-
-  # Create a temp file to store the vins
-  temp_file = tempfile.NamedTemporaryFile(delete_on_close=True)
-  file_path = temp_file.name
-
-  try:
-    # After we return successfully, run background task to delete the temp file
-    background_tasks.add_task(temp_file.close)
-
-    df = _convert_to_dataframe(vins)
-
-    match export_format:
-      case ExportFormat.CSV:
-        df.to_csv(file_path, header=True, sep=',', index=False)
-      case ExportFormat.PARQUET:
-        fastparquet.write(file_path, df)
-      case _:
-        raise NotImplementedError(f'Export format {export_format} is not supported.')
-
-    return FileResponse(
-      file_path,
-      filename=f'vins_cache.{export_format.value}',
+) -> Response:
+  """ Export the cache as a file. The export of each cache generation is
+      stored and served again until the cache changes, and clients that
+      send back its `ETag` get a 304 until then.
+  """
+  cache_backend = cache_backends.get_cache_backend()
+  generation = cache_backend.find_generation()
+  if _is_not_modified(request, generation, export_format):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers=_to_cache_headers(generation, export_format))
+
+  if settings.export_snapshot_max_bytes <= 0:
+    if not cache_backend.has_vins():
+      return None
+    return StreamingResponse(
+      _measure(_stream(export_format), export_format),
+      media_type=_MEDIA_TYPES[export_format],
+      headers=_to_headers(generation, export_format),
     )
-  except:
-    # Close the file when something unexpected happened
-    temp_file.close()
-    raise
-
-def _convert_to_dataframe(vins: list[Vin]) -> pd.DataFrame:
-  df_columns = ['vin', 'make', 'model', 'model_year', 'body_class', 'photo_url']
-  data = []
-
-  for vin in vins:
-    df_row = {
-      df_columns[0]: vin.vin,
-      df_columns[1]: vin.make,
-      df_columns[2]: vin.model,
-      df_columns[3]: vin.model_year,
-      df_columns[4]: vin.body_class,
-      df_columns[5]: vin.photo_url
-    }
-    data.append(df_row)
-
-  return pd.DataFrame(data)
+
+  snapshot = snapshots.open_snapshot(export_format.value, generation.tag)
+  if snapshot is None:
+    if not cache_backend.has_vins():
+      return None
+    generation, snapshot = _build_snapshot(cache_backend, export_format)
+
+  return StreamingResponse(
+    snapshots.read_snapshot(snapshot),
+    media_type=_MEDIA_TYPES[export_format],
+    headers={
+      **_to_headers(generation, export_format),
+      'Content-Length': str(os.fstat(snapshot.fileno()).st_size),
+    },
+    # In case the client goes away before the snapshot is read to the end
+    background=BackgroundTask(snapshot.close),
+  )
+
+def _build_snapshot(cache_backend: cache_backends.CacheBackend,
+                    export_format: ExportFormat) -> tuple[generation_queries.CacheGeneration, BinaryIO]:
+  with _build_locks[export_format]:
+    # Read the generation before the rows, so that a change made during the build
+    # can only make the snapshot newer than its generation, never older
+    generation = cache_backend.find_generation()
+    # Another request may have built it while this one waited
+    snapshot = snapshots.open_snapshot(export_format.value, generation.tag)
+    if snapshot is None:
+      snapshot = snapshots.store_snapshot(
+        export_format.value, generation.tag, _measure(_stream(export_format), export_format)
+      )
+    return generation, snapshot
+
+def _stream(export_format: ExportFormat) -> Iterator[bytes]:
+  match export_format:
+    case ExportFormat.CSV:
+      return _stream_csv(settings.export_csv_chunk_size)
+    case ExportFormat.PARQUET:
+      return _stream_parquet(settings.export_parquet_row_group_size)
+    case _:
+      raise NotImplementedError(f'Export format {export_format} is not supported.')
+
+def _is_not_modified(request: Request, generation: generation_queries.CacheGeneration,
+                     export_format: ExportFormat) -> bool:
+  # If-Modified-Since is only looked at without If-None-Match, like RFC 9110 says
+  if_none_match = request.headers.get('if-none-match')
+  if if_none_match is not None:
+    etag = _to_etag(generation, export_format)
+    return any(
+      tag.strip().removeprefix('W/') in (etag, '*')
+      for tag in if_none_match.split(',')
+    )
+
+  if_modified_since = request.headers.get('if-modified-since')
+  if if_modified_since is not None:
+    try:
+      return int(generation.updated_at) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+      return False
+  return False
+
+def _to_headers(generation: generation_queries.CacheGeneration,
+                export_format: ExportFormat) -> dict[str, str]:
+  filename = f'vins_cache.{export_format.value}'
+  return {
+    **_to_cache_headers(generation, export_format),
+    'Content-Disposition': f'attachment; filename="{filename}"',
+  }
+
+def _to_cache_headers(generation: generation_queries.CacheGeneration,
+                      export_format: ExportFormat) -> dict[str, str]:
+  return {
+    'ETag': _to_etag(generation, export_format),
+    'Last-Modified': formatdate(generation.updated_at, usegmt=True),
+    # Caches may keep the export but must check that it's still current
+    'Cache-Control': 'no-cache',
+  }
+
+def _to_etag(generation: generation_queries.CacheGeneration, export_format: ExportFormat) -> str:
+  return f'"{generation.tag}-{export_format.value}"'
+
+def _stream_csv(chunk_size: int) -> Iterator[bytes]:
+  """ Write the cache as CSV, one chunk of rows at a time. """
+  buffer = io.StringIO()
+  csv_writer = csv.writer(buffer, lineterminator='\n')
+  csv_writer.writerow(vin_queries.VIN_COLUMNS)
+
+  for rows in cache_backends.get_cache_backend().iter_vin_rows(chunk_size):
+    csv_writer.writerows(rows)
+    yield buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+
+  # The header of an empty cache
+  if buffer.tell():
+    yield buffer.getvalue().encode()
+
+def _stream_parquet(row_group_size: int) -> Iterator[bytes]:
+  """ Write the cache as a single Parquet file, one row group at a time.
+      The footer that describes the row groups is written last.
+  """
+  # Imported on first use, the export is rare and these take long to
+  # import and use a lot of memory, which every worker would pay at startup
+  from fastparquet import writer as parquet_writer
+
+  output = _ByteCounter()
+  file_metadata = None
+  row_groups = []
+
+  for rows in cache_backends.get_cache_backend().iter_vin_rows(row_group_size):
+    df = _convert_to_dataframe(rows)
+    if file_metadata is None:
+      file_metadata = parquet_writer.make_metadata(
+        df, object_encoding='utf8', index_cols=[], cols_dtype=df.columns.dtype
+      )
+      output.write(parquet_writer.MARKER)
+
+    row_groups.append(parquet_writer.make_row_group(output, df, file_metadata.schema))
+    yield output.drain()
+
+  if file_metadata is None:
+    return
+
+  file_metadata.row_groups = row_groups
+  file_metadata.num_rows = sum(row_group.num_rows for row_group in row_groups)
+  footer_size = parquet_writer.write_thrift(output, file_metadata)
+  output.write(struct.pack(b'<I', footer_size))
+  output.write(parquet_writer.MARKER)
+  yield output.drain()
+
+def _measure(content: Iterator[bytes], export_format: ExportFormat) -> Iterator[bytes]:
+  size = 0
+  with metrics.export_duration.time(export_format.value):
+    for chunk in content:
+      size += len(chunk)
+      yield chunk
+  metrics.export_size.observe(size, export_format.value)
+
+def _convert_to_dataframe(rows: list[tuple[str, ...]]) -> 'pd.DataFrame':
+  import pandas as pd
+  return pd.DataFrame.from_records(rows, columns=vin_queries.VIN_COLUMNS)
+
+class _ByteCounter:
+  """ A write-only file that keeps track of its position, so that the
+      Parquet writer can record offsets, while the written bytes are
+      drained as soon as each row group is complete.
+  """
+  def __init__(self):
+    self._buffer = io.BytesIO()
+    self._position = 0
+
+  def write(self, data: bytes) -> int:
+    self._position += len(data)
+    return self._buffer.write(data)
+
+  def tell(self) -> int:
+    return self._position
+
+  def drain(self) -> bytes:
+    data = self._buffer.getvalue()
+    self._buffer = io.BytesIO()
+    return data
@@ -0,0 +1,82 @@
+""" Exports stored on disk, one file per format and cache generation, so
+    that an export is only built once for as long as the cache doesn't change.
+    Snapshots are served from a file opened before the response starts, a
+    snapshot removed by another request or worker in the meantime is still
+    read to the end.
+"""
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from ...settings import settings
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+def open_snapshot(export_format: str, tag: str) -> BinaryIO | None:
+  try:
+    return open(_to_path(export_format, tag), 'rb')
+  except FileNotFoundError:
+    return None
+
+def store_snapshot(export_format: str, tag: str, content: Iterator[bytes]) -> BinaryIO:
+  """ Write the export to disk, then remove the snapshots of older generations
+      of the format and the least recently used ones beyond the size budget.
+      The file only appears once complete, so that other workers never serve
+      a partial export. An export over the budget on its own isn't kept, only
+      the returned file can still read it.
+  """
+  directory = Path(settings.export_snapshot_dir)
+  directory.mkdir(parents=True, exist_ok=True)
+  path = _to_path(export_format, tag)
+
+  file = tempfile.NamedTemporaryFile(dir=directory, prefix='.', suffix='.tmp', delete=False)
+  try:
+    for chunk in content:
+      file.write(chunk)
+    file.flush()
+    size = file.tell()
+    if size <= settings.export_snapshot_max_bytes:
+      os.replace(file.name, path)
+      _remove_snapshots(export_format, keep=path, kept_bytes=size)
+    else:
+      os.remove(file.name)
+  except BaseException:
+    file.close()
+    Path(file.name).unlink(missing_ok=True)
+    raise
+
+  file.seek(0)
+  return file
+
+def read_snapshot(file: BinaryIO) -> Iterator[bytes]:
+  """ Read the snapshot to the end, then close it. """
+  with file:
+    while chunk := file.read(_READ_CHUNK_SIZE):
+      yield chunk
+
+def _remove_snapshots(export_format: str, keep: Path, kept_bytes: int):
+  snapshots = []
+  for path in Path(settings.export_snapshot_dir).glob('vins_cache.*'):
+    if path == keep:
+      continue
+    # Nothing asks for an older generation once a newer one is stored
+    if path.suffix == f'.{export_format}':
+      path.unlink(missing_ok=True)
+      continue
+    try:
+      stat_result = path.stat()
+    except FileNotFoundError:
+      # Another worker removed it first
+      continue
+    snapshots.append((stat_result.st_atime, stat_result.st_size, path))
+
+  total_bytes = kept_bytes + sum(size for _, size, _ in snapshots)
+  for _, size, path in sorted(snapshots):
+    if total_bytes <= settings.export_snapshot_max_bytes:
+      break
+    total_bytes -= size
+    path.unlink(missing_ok=True)
+
+def _to_path(export_format: str, tag: str) -> Path:
+  return Path(settings.export_snapshot_dir) / f'vins_cache.{tag}.{export_format}'
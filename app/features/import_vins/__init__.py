@@ -0,0 +1,43 @@
+import tempfile
+
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from ... import request_bodies
+from ...db import cache_backends, warmup
+from ...settings import settings
+from ..export import ExportFormat
+
+router = APIRouter()
+
+class ImportResponse(BaseModel):
+  """ The response data returned by the `import` API. """
+  inserted: int
+  updated: int
+  rejected: int
+
+@router.post('/import', status_code=status.HTTP_200_OK)
+async def import_vins(
+  request: Request,
+  import_format: ExportFormat = ExportFormat.CSV
+) -> ImportResponse:
+  """ Load a file produced by the `export` API, sent as the raw request
+      body, into the cache. VINs that are already cached are overwritten.
+      Bodies larger than `settings.import_max_bytes` are rejected.
+  """
+  # Parquet keeps its metadata at the end of the file, so the body is spooled to
+  # disk before it's read back in chunks. That also keeps memory flat for CSV.
+  with tempfile.NamedTemporaryFile(suffix=f'.{import_format.value}') as file:
+    async for chunk in request_bodies.stream_body(request, settings.import_max_bytes):
+      await run_in_threadpool(file.write, chunk)
+    await run_in_threadpool(file.flush)
+
+    try:
+      counts = await run_in_threadpool(
+        warmup.import_vins, cache_backends.get_cache_backend(), file.name, import_format.value
+      )
+    except ValueError as ex:
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex))
+
+  return ImportResponse(inserted=counts.inserted, updated=counts.updated, rejected=counts.rejected)
@@ -1,18 +1,67 @@
-from fastapi import APIRouter, Depends, status
+from enum import Enum
+
+from fastapi import APIRouter, HTTPException, Query, status
 from pydantic import BaseModel
-from sqlalchemy.orm.session import Session
 
-from ...db.connection import get_db_session
-from ...db.entities.vin import queries as vin_queries
-from ...schemas.vin import Vin
+from ...db import cache_backends
+from ...responses import TrustedJSONResponse
+from ...settings import settings
 
 router = APIRouter()
 
+class VinField(str, Enum):
+  VIN = 'vin'
+  MAKE = 'make'
+  MODEL = 'model'
+  MODEL_YEAR = 'model_year'
+  BODY_CLASS = 'body_class'
+  PHOTO_URL = 'photo_url'
+
+class ListedVin(BaseModel):
+  """ A cached VIN, with only the fields that were asked for. """
+  vin: str | None = None
+  make: str | None = None
+  model: str | None = None
+  model_year: str | None = None
+  body_class: str | None = None
+  photo_url: str | None = None
+
 class ListResponse(BaseModel):
-  """ The response data returned by the `list` API. """
-  vins: list[Vin]
+  """ The response data returned by the `list` API. Pass `next_cursor`
+      as the `cursor` of the next request to get the next page, it is
+      `None` on the last page.
+  """
+  vins: list[ListedVin]
+  next_cursor: int | None = None
+
+@router.get('/list', status_code=status.HTTP_200_OK, response_model=ListResponse)
+def list_vins(
+  cursor: int | None = None,
+  limit: int = Query(default=None, ge=1),
+  make: str | None = None,
+  model: str | None = None,
+  model_year: str | None = None,
+  body_class: str | None = None,
+  fields: list[VinField] = Query(default=[]),
+) -> TrustedJSONResponse:
+  limit = limit or settings.list_default_page_size
+  if limit > settings.list_max_page_size:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f'The page size must be at most {settings.list_max_page_size}.')
+
+  columns = [field.value for field in fields] or [field.value for field in VinField]
+  filters = {
+    column: value
+    for column, value in [
+      ('make', make), ('model', model), ('model_year', model_year), ('body_class', body_class)
+    ]
+    if value is not None
+  }
+
+  rows = cache_backends.get_cache_backend().list_vin_rows(columns, filters, cursor, limit)
 
-@router.get('/list', status_code=status.HTTP_200_OK)
-def list_vins(db_session: Session = Depends(get_db_session)) -> ListResponse:
-  vins = vin_queries.get_all_vins(db_session)
-  return ListResponse(vins=vins)
+  # The rows come straight from our cache, so there's nothing to validate.
+  # Only the fields that were asked for are returned.
+  vins = [dict(zip(columns, row[1:])) for row in rows]
+  next_cursor = rows[-1][0] if len(rows) == limit else None
+  return TrustedJSONResponse({'vins': vins, 'next_cursor': next_cursor})
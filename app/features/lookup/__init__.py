@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.orm.session import Session
 
-from ...apis import car_imagery, vpic
+from ... import metrics, vin_analysis
+from ...apis import vpic
+from ...db import cache_backends
 from ...db.connection import get_db_session
-from ...db.entities.vin import queries as vin_queries
-from ...schemas.vin import Vin
+from ...db.entities.negative_vin import queries as negative_vin_queries
+from ...db.entities.vin.access_log import vin_access_log
+from ...db.entities.vin.memory_cache import vin_memory_cache
+from ...responses import TrustedJSONResponse
+from ...settings import settings
+from . import pipeline
+from .pipeline import BatchLookupStatus
 
 router = APIRouter()
 
@@ -18,35 +28,126 @@ class LookupResponse(BaseModel):
   body_class: str
   photo_url: str = ''
   cached: bool = False
+  # `True` if vPIC was unavailable and the response was guessed from the VIN
+  partial: bool = False
 
-@router.get('/lookup/{vin}', status_code=status.HTTP_200_OK)
-def lookup(vin: str, db_session: Session = Depends(get_db_session)) -> LookupResponse:
-  if not Vin.is_vin_correct_format(vin):
-    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                        detail='VIN must be a 17 alphanumeric characters string.')
+class BatchLookupRequest(BaseModel):
+  """ The request data accepted by the `lookup/batch` API. """
+  vins: list[str]
+
+class BatchLookupItem(BaseModel):
+  """ The lookup result of a single VIN in a `lookup/batch` request. """
+  vin: str
+  status: BatchLookupStatus
+  result: LookupResponse | None = None
+  detail: str = ''
+
+class BatchLookupResponse(BaseModel):
+  """ The response data returned by the `lookup/batch` API. """
+  results: list[BatchLookupItem]
+
+@router.get('/lookup/{vin}', status_code=status.HTTP_200_OK, response_model=LookupResponse)
+async def lookup(
+  vin: str,
+  background_tasks: BackgroundTasks,
+  response: Response,
+  db_session: Session = Depends(get_db_session)
+) -> Response | LookupResponse:
+  # Reject obviously bad VINs before touching the cache or vPIC
+  vin_error = vin_analysis.find_vin_error(vin)
+  if vin_error:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=vin_error)
 
-  cache_vin = vin_queries.find_vin(db_session, vin)
+  vin = vin.upper()
+
+  # Hot VINs are served from memory without a database round trip
+  cache_vin = vin_memory_cache.get(vin)
+  if not cache_vin:
+    cache_vin = await run_in_threadpool(cache_backends.get_cache_backend().find_vin, vin)
+    metrics.record_cache_result('database', cache_vin is not None)
   if cache_vin:
-    return LookupResponse(**cache_vin.model_dump(), cached=True)
+    vin_access_log.touch(vin)
+    # Cache hits are the bulk of the traffic, skip building a `LookupResponse` only to
+    # have FastAPI validate and serialize it again
+    return TrustedJSONResponse({**cache_vin.__dict__, 'cached': True, 'partial': False})
+
+  # Don't ask vPIC again about a VIN it recently couldn't decode
+  negative_reason = await run_in_threadpool(
+    negative_vin_queries.find_negative_vin, db_session, vin, settings.negative_cache_ttl
+  )
+  metrics.record_cache_result('negative', negative_reason is not None)
+  if negative_reason:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f'VIN {vin} not found.')
+
+  # Don't hold on to a pooled connection while waiting for upstream,
+  # the fetch opens sessions of its own
+  await run_in_threadpool(db_session.close)
 
   try:
-    fetched_vin = vpic.find_vin(vin)
-    if not fetched_vin:
-      # VIN not found
-      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                          detail=f'VIN {vin} not found.')
-
-    # Attempt to find an image of this car
-    photo_url = car_imagery.find_car_photo_url(
-      fetched_vin.make, fetched_vin.model, fetched_vin.model_year
-    ) or ''
-
-    fetched_vin.photo_url = photo_url
-    vin_queries.insert_vin(db_session, fetched_vin)
-    return LookupResponse(**fetched_vin.model_dump(), cached=False)
+    result = await pipeline.fetch_vin(vin)
   except vpic.VpicApiError as ex:
-    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                        detail=f'vpic API returns an error: {ex}.') from ex
-  except car_imagery.CarImageryApiError as ex:
-    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                        detail=f'CarImagery API returns an error: {ex}.') from ex
+    partial_response = _to_partial_response(vin) if settings.lookup_partial_on_vpic_error else None
+    if not partial_response:
+      raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                          detail=f'vpic API returns an error: {ex}.') from ex
+
+    response.status_code = status.HTTP_203_NON_AUTHORITATIVE_INFORMATION
+    return partial_response
+
+  if not result.vin:
+    # VIN not found
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f'VIN {vin} not found.')
+
+  if result.late_photo_task:
+    # Finish storing the photo after the response is sent
+    background_tasks.add_task(_wait_for, result.late_photo_task)
+
+  return LookupResponse(**result.vin.model_dump(), cached=result.cached)
+
+@router.post('/lookup/batch', status_code=status.HTTP_200_OK)
+async def lookup_batch(request: BatchLookupRequest) -> BatchLookupResponse:
+  if len(request.vins) > settings.lookup_batch_max_vins:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f'At most {settings.lookup_batch_max_vins} VINs can be looked up at once.')
+
+  # Normalize and de-duplicate the VINs while keeping their order
+  vins = list(dict.fromkeys(vin.strip().upper() for vin in request.vins))
+  items: dict[str, BatchLookupItem] = {}
+
+  valid_vins = []
+  for vin in vins:
+    vin_error = vin_analysis.find_vin_error(vin)
+    if vin_error:
+      items[vin] = BatchLookupItem(vin=vin, status=BatchLookupStatus.INVALID, detail=vin_error)
+    else:
+      valid_vins.append(vin)
+
+  outcomes = await pipeline.lookup_vins(valid_vins)
+  for vin, outcome in outcomes.items():
+    result = None
+    if outcome.vin:
+      result = LookupResponse(**outcome.vin.model_dump(),
+                              cached=outcome.status == BatchLookupStatus.CACHED)
+    items[vin] = BatchLookupItem(vin=vin, status=outcome.status, result=result, detail=outcome.detail)
+
+  return BatchLookupResponse(results=[items[vin] for vin in vins])
+
+def _to_partial_response(vin: str) -> LookupResponse | None:
+  """ Guess what we can from the VIN itself while vPIC is unavailable. """
+  analysis = vin_analysis.analyze_vin(vin)
+  if not analysis.manufacturer:
+    return None
+
+  return LookupResponse(
+    vin=vin,
+    make=analysis.manufacturer,
+    model='',
+    model_year=str(analysis.model_year or ''),
+    body_class='',
+    partial=True,
+  )
+
+async def _wait_for(task: asyncio.Task[None]):
+  await task
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi.concurrency import run_in_threadpool
+
+from ...apis import rate_limit, resilience
+from ...apis.http_client import Upstream
+from ...db import cache_backends
+from ...db.connection import SessionLocal
+from ...db.entities.negative_vin import queries as negative_vin_queries
+from ...db.entities.vin.access_log import vin_access_log
+from ...settings import settings
+from . import pipeline
+
+logger = logging.getLogger(__name__)
+
+class CacheMaintenance:
+  """ Keeps the `vin` table and the negative cache within their budgets and
+      fills in the photos that are missing, e.g. because CarImagery was down when the VIN was cached.
+      VINs keep being served as they are while their photo is refreshed.
+      All the database work runs in the threadpool, off the event loop.
+  """
+  def __init__(self):
+    # Photos are refreshed a batch at a time, going through the table by `id`
+    self._photo_cursor = 0
+
+  async def run_forever(self):
+    while True:
+      await asyncio.sleep(settings.cache_maintenance_interval)
+      try:
+        await self.run_once()
+      except Exception:
+        logger.exception('The cache maintenance failed, retrying on the next run.')
+
+  async def run_once(self):
+    await run_in_threadpool(self._flush_accesses)
+    await run_in_threadpool(self._evict_vins)
+    await run_in_threadpool(self._prune_negative_vins)
+    # Photos of lookups in progress go first
+    with rate_limit.priority(rate_limit.Priority.BATCH):
+      await self._refresh_photos()
+
+  def _flush_accesses(self):
+    cache_backends.get_cache_backend().touch_vins(vin_access_log.drain())
+
+  def _evict_vins(self):
+    cache_backend = cache_backends.get_cache_backend()
+    batch_size = settings.cache_eviction_batch_size
+    if settings.cache_max_age > 0:
+      batch_size -= len(cache_backend.remove_vins_created_before(
+        time.time() - settings.cache_max_age, batch_size
+      ))
+
+    if settings.cache_max_rows <= 0 and settings.cache_max_bytes <= 0:
+      return
+
+    row_count, byte_count = cache_backend.measure_vins()
+    excess_count = 0
+    if settings.cache_max_rows > 0:
+      excess_count = row_count - settings.cache_max_rows
+    if settings.cache_max_bytes > 0 and byte_count > settings.cache_max_bytes:
+      bytes_per_row = byte_count / row_count
+      excess_count = max(excess_count,
+                         math.ceil((byte_count - settings.cache_max_bytes) / bytes_per_row))
+
+    if excess_count > 0 and batch_size > 0:
+      cache_backend.remove_oldest_vins(min(excess_count, batch_size),
+                                       by_last_access=settings.cache_eviction_policy == 'lru')
+
+  def _prune_negative_vins(self):
+    if settings.negative_cache_max_size <= 0:
+      return
+
+    with SessionLocal() as db_session:
+      negative_vin_queries.prune_negative_vins(
+        db_session, settings.negative_cache_ttl, settings.negative_cache_max_size
+      )
+
+  async def _refresh_photos(self):
+    if settings.cache_photo_refresh_batch_size <= 0 or resilience.is_open(Upstream.CAR_IMAGERY.value):
+      return
+
+    rows = await run_in_threadpool(
+      cache_backends.get_cache_backend().find_vehicles_without_photo,
+      self._photo_cursor, settings.cache_photo_refresh_batch_size
+    )
+    # Start over from the beginning of the table once the end is reached
+    self._photo_cursor = rows[-1][0] if len(rows) == settings.cache_photo_refresh_batch_size else 0
+
+    semaphore = asyncio.Semaphore(settings.cache_photo_refresh_concurrency)
+
+    async def refresh_photo(make: str, model: str, model_year: str):
+      async with semaphore:
+        photo_url = await pipeline.find_photo_url(make, model, model_year)
+      if photo_url:
+        await run_in_threadpool(cache_backends.get_cache_backend().fill_empty_photo_urls,
+                                make, model, model_year, photo_url)
+
+    vehicles = dict.fromkeys((make, model, model_year) for _, make, model, model_year in rows)
+    await asyncio.gather(*(refresh_photo(*vehicle) for vehicle in vehicles))
+
+@asynccontextmanager
+async def run_in_background() -> AsyncIterator[None]:
+  """ Run the cache maintenance for as long as the context is open. """
+  if settings.cache_maintenance_interval <= 0:
+    yield
+    return
+
+  task = asyncio.create_task(CacheMaintenance().run_forever())
+  try:
+    yield
+  finally:
+    task.cancel()
+    try:
+      await task
+    except asyncio.CancelledError:
+      pass
@@ -0,0 +1,258 @@
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from enum import Enum
+
+from fastapi.concurrency import run_in_threadpool
+
+from ... import metrics
+from ...apis import car_imagery, decoders, rate_limit, resilience, vpic
+from ...apis.http_client import Upstream
+from ...db import cache_backends
+from ...db.connection import SessionLocal
+from ...db.entities.lookup_lock import queries as lock_queries
+from ...db.entities.negative_vin import queries as negative_vin_queries
+from ...db.entities.negative_vin.entity import NegativeVinReason
+from ...db.entities.photo import queries as photo_queries
+from ...db.entities.vin.access_log import vin_access_log
+from ...schemas.vin import Vin
+from ...settings import settings
+from ...single_flight import SingleFlight
+
+@dataclass
+class FetchResult:
+  """ The outcome of fetching a VIN that wasn't in the cache. """
+  # `None` if vPIC could not decode the VIN
+  vin: Vin | None
+  # `True` if another worker cached the VIN while this one waited for it
+  cached: bool = False
+  # Stores the photo that missed the photo deadline once it arrives
+  late_photo_task: asyncio.Task[None] | None = None
+
+class BatchLookupStatus(str, Enum):
+  CACHED = 'cached'
+  FETCHED = 'fetched'
+  NOT_FOUND = 'not_found'
+  INVALID = 'invalid'
+  ERROR = 'error'
+
+@dataclass
+class BatchLookupOutcome:
+  """ The outcome of looking up one VIN of a batch. """
+  status: BatchLookupStatus
+  # Set if the VIN was cached or fetched
+  vin: Vin | None = None
+  detail: str = ''
+
+_vin_fetches = SingleFlight[FetchResult]()
+_photo_fetches = SingleFlight[str]()
+
+async def fetch_vin(vin: str) -> FetchResult:
+  """ Fetch the VIN from upstream and cache it. Concurrent fetches of the
+      same VIN share a single upstream call, and with `lookup_db_lock`
+      enabled this also holds across workers that share the database.
+      Raises `vpic.VpicApiError` if vPIC fails.
+  """
+  return await _vin_fetches.do(vin, lambda: _fetch_vin_with_lock(vin))
+
+async def _fetch_vin_with_lock(vin: str) -> FetchResult:
+  if not settings.lookup_db_lock:
+    return await _fetch_and_cache_vin(vin)
+
+  owner = uuid.uuid4().hex
+  deadline = time.monotonic() + settings.lookup_db_lock_timeout
+  while not await run_in_threadpool(_try_acquire_lock, vin, owner):
+    # Another worker is fetching the VIN, wait for it to show up in the cache
+    await asyncio.sleep(settings.lookup_db_lock_poll_interval)
+    cache_vin = await run_in_threadpool(_find_cached_vin, vin)
+    if cache_vin:
+      return FetchResult(cache_vin, cached=True)
+    if time.monotonic() >= deadline:
+      # The other worker is taking too long, fetch the VIN anyway
+      return await _fetch_and_cache_vin(vin)
+
+  try:
+    # The VIN may have been cached between our cache miss and taking the lock
+    cache_vin = await run_in_threadpool(_find_cached_vin, vin)
+    if cache_vin:
+      return FetchResult(cache_vin, cached=True)
+    return await _fetch_and_cache_vin(vin)
+  finally:
+    await run_in_threadpool(_release_lock, vin, owner)
+
+async def _fetch_and_cache_vin(vin: str) -> FetchResult:
+  fetched_vin = await decoders.get_decoder().find_vin(vin)
+  if not fetched_vin:
+    await run_in_threadpool(insert_negative_vins, [vin], NegativeVinReason.VPIC_NOT_DECODED)
+    return FetchResult(None)
+
+  # The photo is optional, so don't hold the response back for longer than
+  # the photo deadline. A photo that arrives later is stored afterwards.
+  photo_task = asyncio.create_task(
+    find_photo_url(fetched_vin.make, fetched_vin.model, fetched_vin.model_year)
+  )
+  try:
+    fetched_vin.photo_url = await asyncio.wait_for(
+      asyncio.shield(photo_task), settings.lookup_photo_deadline
+    )
+    is_photo_late = False
+  except TimeoutError:
+    is_photo_late = True
+
+  await run_in_threadpool(_insert_vin, fetched_vin)
+
+  late_photo_task = None
+  if is_photo_late:
+    late_photo_task = asyncio.create_task(_store_photo_url(fetched_vin.vin, photo_task))
+  return FetchResult(fetched_vin, late_photo_task=late_photo_task)
+
+async def lookup_vins(vins: list[str]) -> dict[str, BatchLookupOutcome]:
+  """ Look up many valid, upper case and distinct VINs at once, for the
+      `lookup/batch` API and the backfill jobs. The cache and the negative
+      cache are checked first, then the misses are decoded in batches and
+      cached. A vPIC failure only fails the VINs of the batch it happened
+      in. Upstream calls queue behind single lookups.
+  """
+  outcomes: dict[str, BatchLookupOutcome] = {}
+
+  cache_backend = cache_backends.get_cache_backend()
+  cache_vins = await run_in_threadpool(cache_backend.find_vins, vins)
+  metrics.record_cache_result('database', True, len(cache_vins))
+  metrics.record_cache_result('database', False, len(vins) - len(cache_vins))
+  for cache_vin in cache_vins:
+    vin_access_log.touch(cache_vin.vin)
+    outcomes[cache_vin.vin] = BatchLookupOutcome(BatchLookupStatus.CACHED, cache_vin)
+
+  uncached_vins = [vin for vin in vins if vin not in outcomes]
+  negative_vins = await run_in_threadpool(_find_negative_vins, uncached_vins)
+  metrics.record_cache_result('negative', True, len(negative_vins))
+  metrics.record_cache_result('negative', False, len(uncached_vins) - len(negative_vins))
+  for vin in negative_vins:
+    outcomes[vin] = BatchLookupOutcome(BatchLookupStatus.NOT_FOUND, detail=f'VIN {vin} not found.')
+
+  missed_vins = [vin for vin in vins if vin not in outcomes]
+  fetched_vins: list[Vin] = []
+  undecoded_vins: list[str] = []
+
+  chunks = [
+    missed_vins[start:start + settings.vpic_batch_size]
+    for start in range(0, len(missed_vins), settings.vpic_batch_size)
+  ]
+  decoder = decoders.get_decoder()
+  # Decode all the chunks concurrently, the upstream's rate limit bounds how many
+  # run at once. Single lookups go first.
+  with rate_limit.priority(rate_limit.Priority.BATCH):
+    chunk_results = await asyncio.gather(
+      *(decoder.find_vins(chunk) for chunk in chunks),
+      return_exceptions=True
+    )
+
+  for chunk, decoded_vins in zip(chunks, chunk_results):
+    if isinstance(decoded_vins, vpic.VpicApiError):
+      for vin in chunk:
+        outcomes[vin] = BatchLookupOutcome(BatchLookupStatus.ERROR,
+                                           detail=f'vpic API returns an error: {decoded_vins}.')
+      continue
+    if isinstance(decoded_vins, BaseException):
+      raise decoded_vins
+
+    for vin, fetched_vin in decoded_vins.items():
+      if fetched_vin:
+        fetched_vins.append(fetched_vin)
+      else:
+        undecoded_vins.append(vin)
+        outcomes[vin] = BatchLookupOutcome(BatchLookupStatus.NOT_FOUND, detail=f'VIN {vin} not found.')
+
+  with rate_limit.priority(rate_limit.Priority.BATCH):
+    await add_photo_urls(fetched_vins)
+  await run_in_threadpool(cache_backend.insert_vins, fetched_vins)
+  await run_in_threadpool(insert_negative_vins, undecoded_vins, NegativeVinReason.VPIC_NOT_DECODED)
+
+  for fetched_vin in fetched_vins:
+    outcomes[fetched_vin.vin] = BatchLookupOutcome(BatchLookupStatus.FETCHED, fetched_vin)
+  return outcomes
+
+async def add_photo_urls(vins: list[Vin]):
+  """ Find the photo of each distinct make, model and model year only once.
+      The photo is optional, so a failed CarImagery call leaves it empty.
+  """
+  keys = list(dict.fromkeys((vin.make, vin.model, vin.model_year) for vin in vins))
+  photo_urls = dict(zip(keys, await asyncio.gather(*(find_photo_url(*key) for key in keys))))
+
+  for vin in vins:
+    vin.photo_url = photo_urls[(vin.make, vin.model, vin.model_year)]
+
+async def find_photo_url(make: str, model: str, model_year: str) -> str:
+  """ Find the photo of the vehicle in the photo cache, or in CarImagery if
+      it isn't cached or is stale. Concurrent misses of the same vehicle
+      share one CarImagery call. The photo is optional, so an empty string
+      is returned if there is no photo.
+  """
+  key = photo_queries.to_photo_key(make, model, model_year)
+  return await _photo_fetches.do(
+    '|'.join(key), lambda: _fetch_photo_url(key, make, model, model_year)
+  )
+
+async def _fetch_photo_url(key: photo_queries.PhotoKey, make: str, model: str, model_year: str) -> str:
+  cached_photo = await run_in_threadpool(_find_cached_photo, key)
+  is_hit = cached_photo is not None and not cached_photo.is_stale
+  metrics.record_cache_result('photo', is_hit)
+  if is_hit:
+    return cached_photo.photo_url
+
+  # Skip the photo right away while CarImagery is known to be down
+  if resilience.is_open(Upstream.CAR_IMAGERY.value):
+    return cached_photo.photo_url if cached_photo else ''
+
+  try:
+    photo_url = await car_imagery.find_car_photo_url(make, model, model_year) or ''
+  except car_imagery.CarImageryApiError:
+    # Keep serving the stale photo while CarImagery fails
+    return cached_photo.photo_url if cached_photo else ''
+
+  await run_in_threadpool(_store_photo, key, photo_url)
+  return photo_url
+
+async def _store_photo_url(vin: str, photo_task: asyncio.Task[str]):
+  """ Wait for a photo that missed the deadline and store it in the cache. """
+  photo_url = await photo_task
+  if not photo_url:
+    return
+
+  await run_in_threadpool(cache_backends.get_cache_backend().update_photo_url, vin, photo_url)
+
+def _find_negative_vins(vins: list[str]) -> dict[str, str]:
+  with SessionLocal() as db_session:
+    return negative_vin_queries.find_negative_vins(db_session, vins, settings.negative_cache_ttl)
+
+def insert_negative_vins(vins: list[str], reason: NegativeVinReason):
+  if settings.negative_cache_max_size <= 0:
+    return
+
+  with SessionLocal() as db_session:
+    negative_vin_queries.insert_negative_vins(db_session, vins, reason)
+
+# The fetch may outlive the request that started it,
+# so it works with sessions of its own
+def _find_cached_vin(vin: str) -> Vin | None:
+  return cache_backends.get_cache_backend().find_vin(vin)
+
+def _insert_vin(vin: Vin):
+  cache_backends.get_cache_backend().insert_vin(vin)
+
+def _find_cached_photo(key: photo_queries.PhotoKey) -> photo_queries.CachedPhoto | None:
+  with SessionLocal() as db_session:
+    return photo_queries.find_photo(db_session, key, settings.photo_cache_ttl)
+
+def _store_photo(key: photo_queries.PhotoKey, photo_url: str):
+  with SessionLocal() as db_session:
+    photo_queries.upsert_photo(db_session, key, photo_url)
+
+def _try_acquire_lock(vin: str, owner: str) -> bool:
+  with SessionLocal() as db_session:
+    return lock_queries.try_acquire_lock(db_session, vin, owner, settings.lookup_db_lock_timeout)
+
+def _release_lock(vin: str, owner: str):
+  with SessionLocal() as db_session:
+    lock_queries.release_lock(db_session, vin, owner)
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+
+from ... import metrics
+from ...apis import decoders, resilience
+from ...apis.http_client import Upstream
+from ...db.entities.vin.memory_cache import vin_memory_cache
+
+router = APIRouter()
+
+def _read_memory_cache_stats() -> dict[tuple[str, ...], float]:
+  stats = vin_memory_cache.stats()
+  return {
+    ('hits',): stats.hits,
+    ('misses',): stats.misses,
+    ('evictions',): stats.evictions,
+    ('size',): stats.size,
+  }
+
+def _read_shadow_decoder_stats() -> dict[tuple[str, ...], float]:
+  return {
+    ('match',): decoders.shadow_stats.matches,
+    ('mismatch',): decoders.shadow_stats.mismatches,
+    ('failure',): decoders.shadow_stats.failures,
+    ('skip',): decoders.shadow_stats.skips,
+  }
+
+def _read_circuit_breakers() -> dict[tuple[str, ...], float]:
+  return {(upstream.value,): float(resilience.is_open(upstream.value)) for upstream in Upstream}
+
+# The memory cache keeps its own counters, so the hit path doesn't record anything twice
+metrics.registry.register(metrics.Gauge(
+  'vin_lookup_memory_cache', 'Counters and size of the in-process VIN cache.',
+  ('stat',), _read_memory_cache_stats,
+))
+metrics.registry.register(metrics.Gauge(
+  'vin_lookup_shadow_decoder_results', 'Agreements of the shadow decoder with vPIC.',
+  ('result',), _read_shadow_decoder_stats,
+))
+metrics.registry.register(metrics.Gauge(
+  'vin_lookup_upstream_circuit_open', '1 while the circuit breaker of the upstream is open.',
+  ('upstream',), _read_circuit_breakers,
+))
+
+@router.get('/metrics', status_code=status.HTTP_200_OK, response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+  return PlainTextResponse(metrics.registry.render(), media_type='text/plain; version=0.0.4')
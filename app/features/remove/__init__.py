@@ -2,9 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy.orm.session import Session
 
+from ... import vin_analysis
+from ...db import cache_backends
 from ...db.connection import get_db_session
-from ...db.entities.vin import queries as vin_queries
-from ...schemas.vin import Vin
+from ...db.entities.negative_vin import queries as negative_vin_queries
 
 router = APIRouter()
 
@@ -12,12 +13,18 @@ class RemoveResponse(BaseModel):
   """ The response data returned by the `remove` API. """
   vin: str
   cache_delete_success: bool
+  negative_cache_delete_success: bool = False
 
 @router.delete("/remove/{vin}", status_code=status.HTTP_200_OK)
 def remove(vin: str, db_session: Session = Depends(get_db_session)) -> RemoveResponse:
-  if not Vin.is_vin_correct_format(vin):
-    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                        detail='VIN must be a 17 alphanumeric characters string.')
+  vin_error = vin_analysis.find_vin_error(vin)
+  if vin_error:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=vin_error)
 
-  vin_removed = vin_queries.remove_vin(db_session, vin)
-  return RemoveResponse(vin=vin, cache_delete_success=vin_removed)
+  vin = vin.upper()
+  # Other instances drop the VIN too if they share the cache backend
+  vin_removed = cache_backends.get_cache_backend().remove_vin(vin)
+  negative_vin_removed = negative_vin_queries.remove_negative_vin(db_session, vin)
+  return RemoveResponse(vin=vin,
+                        cache_delete_success=vin_removed,
+                        negative_cache_delete_success=negative_vin_removed)
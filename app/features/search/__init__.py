@@ -0,0 +1,52 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from pydantic import BaseModel
+
+from ... import vin_analysis
+from ...db import cache_backends
+from ...db.entities.vin import queries as vin_queries
+from ...responses import TrustedJSONResponse
+from ...schemas.vin import Vin
+from ...settings import settings
+
+router = APIRouter()
+
+class SearchResponse(BaseModel):
+  """ The response data returned by the `search` API. Pass `next_offset`
+      as the `offset` of the next request to get the next page, it is
+      `None` on the last page.
+  """
+  vins: list[Vin]
+  next_offset: int | None = None
+
+@router.get('/search', status_code=status.HTTP_200_OK, response_model=SearchResponse)
+def search_vins(
+  q: str = '',
+  vin_prefix: str = '',
+  offset: int = Query(default=0, ge=0),
+  limit: int = Query(default=None, ge=1),
+) -> TrustedJSONResponse:
+  """ Find the cached VINs whose make, model, body class and model year
+      have each word of `q`, the last one may be the start of a word, e.g.
+      `peterbilt 57`, and that start with `vin_prefix`. At least one of them
+      is required.
+  """
+  limit = limit or settings.list_default_page_size
+  if limit > settings.list_max_page_size:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f'The page size must be at most {settings.list_max_page_size}.')
+
+  terms = vin_queries.to_search_terms(q)
+  vin_prefix = vin_prefix.strip().upper()
+  if len(vin_prefix) > vin_analysis.VIN_LENGTH or not set(vin_prefix) <= vin_analysis.VIN_CHARACTERS:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f'VIN prefix {vin_prefix} can never match a VIN.')
+  if not terms and not vin_prefix:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail='Either q or vin_prefix is required.')
+
+  # One more than the page tells whether there's a next page
+  vins = cache_backends.get_cache_backend().search_vins(terms, vin_prefix, offset, limit + 1)
+
+  # The VINs come straight from our cache, so there's nothing to validate
+  next_offset = offset + limit if len(vins) > limit else None
+  return TrustedJSONResponse({'vins': [vin.__dict__ for vin in vins[:limit]], 'next_offset': next_offset})
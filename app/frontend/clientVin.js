@@ -13,12 +13,21 @@ async function lookupVin(vin) {
 }
 
 async function listVins() {
-  const url = `${API_URL}/list`;
-  const response = await fetch(url, { method: 'GET', 'content-type': 'application/json' });
-  if (!response.ok) {
-    throw new Error(`VIN lookup api returned with a ${response.statusText}.`);
-  }
-  return await response.json();
+  // The api returns the vins a page at a time, follow the cursors to the last page
+  const vins = [];
+  let cursor = null;
+  do {
+    const url = cursor === null ? `${API_URL}/list` : `${API_URL}/list?cursor=${cursor}`;
+    const response = await fetch(url, { method: 'GET', 'content-type': 'application/json' });
+    if (!response.ok) {
+      throw new Error(`VIN lookup api returned with a ${response.statusText}.`);
+    }
+
+    const page = await response.json();
+    vins.push(...page.vins);
+    cursor = page.next_cursor;
+  } while (cursor !== null);
+  return vins;
 }
 
 async function exportVins(export_format = 'csv') {
@@ -102,7 +111,7 @@ form.addEventListener('submit', (event) => {
 // List all VINs during initialization
 listVins()
   .then(vinsJson => {
-    for (const vinJson of vinsJson.vins) {
+    for (const vinJson of vinsJson) {
       addVin(vinJson);
     }
   })
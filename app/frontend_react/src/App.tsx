@@ -20,14 +20,21 @@ async function lookupVin(vin: string): Promise<Vin> {
 }
 
 async function listVins(): Promise<Array<Vin>> {
-  const url = `${API_URL}/list`;
-  const response = await fetch(url, { method: 'GET' });
-  if (!response.ok) {
-    throw new Error(`VIN lookup api returned with a ${response.statusText}.`);
-  }
-  
-  const json = await response.json();
-  return json.vins.map(mapToVinObject);
+  // The api returns the vins a page at a time, follow the cursors to the last page
+  const vins: Array<Vin> = [];
+  let cursor: number | null = null;
+  do {
+    const url: string = cursor === null ? `${API_URL}/list` : `${API_URL}/list?cursor=${cursor}`;
+    const response = await fetch(url, { method: 'GET' });
+    if (!response.ok) {
+      throw new Error(`VIN lookup api returned with a ${response.statusText}.`);
+    }
+
+    const json = await response.json();
+    vins.push(...json.vins.map(mapToVinObject));
+    cursor = json.next_cursor;
+  } while (cursor !== null);
+  return vins;
 }
 
 async function exportVins(exportFormat: ExportFormat = ExportFormat.CSV): Promise<void> {
@@ -0,0 +1,154 @@
+""" Backfill jobs: VINs submitted at once and looked up in the background
+    by `worker`, e.g. to warm up the cache, with their progress available
+    while they run.
+"""
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.orm.session import Session
+
+from .. import request_bodies, vin_analysis
+from ..db.connection import SessionLocal, get_db_session
+from ..db.entities.job import queries as job_queries
+from ..db.entities.job.entity import JobStatus, JobVinStatus
+from ..settings import settings
+from . import worker
+
+router = APIRouter()
+
+# Sent on an idle progress stream, so that proxies don't close it
+_KEEP_ALIVE_INTERVAL = 15
+
+class JobRequest(BaseModel):
+  """ The request data accepted by the `jobs` API. """
+  vins: list[str]
+
+class JobResponse(BaseModel):
+  """ The progress of a job returned by the `jobs` APIs. """
+  job_id: str
+  status: JobStatus
+  vin_count: int
+  # The number of VINs by status, `pending` until they are looked up
+  counts: dict[JobVinStatus, int]
+  # Epoch seconds
+  created_at: float
+  updated_at: float
+
+@router.post('/jobs', status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(request: JobRequest, db_session: Session = Depends(get_db_session)) -> JobResponse:
+  """ Look the VINs up in the background. VINs that are already cached are
+      only counted as `cached`.
+  """
+  return await _submit_job(db_session, request.vins)
+
+@router.post('/jobs/file', status_code=status.HTTP_202_ACCEPTED)
+async def submit_job_file(request: Request, db_session: Session = Depends(get_db_session)) -> JobResponse:
+  """ Like `jobs`, with the VINs sent as the raw request body, one per line.
+      Only the first column of a CSV is read, and a `vin` header is skipped.
+  """
+  body = b''.join([chunk async for chunk in request_bodies.stream_body(request, settings.jobs_max_file_bytes)])
+  vins = await run_in_threadpool(_read_vin_file, body)
+  return await _submit_job(db_session, vins)
+
+@router.get('/jobs/{job_id}', status_code=status.HTTP_200_OK)
+async def find_job(job_id: str, db_session: Session = Depends(get_db_session)) -> JobResponse:
+  progress = await run_in_threadpool(job_queries.find_job_progress, db_session, job_id)
+  if not progress:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Job {job_id} not found.')
+  return _to_response(progress)
+
+@router.get('/jobs/{job_id}/events', status_code=status.HTTP_200_OK)
+async def stream_job_events(job_id: str) -> StreamingResponse:
+  """ Stream the progress of the job as server-sent events: a `progress`
+      event whenever it changes, with the same data as `jobs/{job_id}`,
+      and a last `completed` event once the job is done.
+  """
+  progress = await run_in_threadpool(_find_job_progress, job_id)
+  if not progress:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Job {job_id} not found.')
+
+  return StreamingResponse(
+    _stream_progress(job_id, progress),
+    media_type='text/event-stream',
+    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+  )
+
+async def _submit_job(db_session: Session, vins: list[str]) -> JobResponse:
+  if len(vins) > settings.jobs_max_vins:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f'At most {settings.jobs_max_vins} VINs can be submitted at once.')
+
+  job_id = await run_in_threadpool(_create_job, db_session, vins)
+  worker.wake_up()
+
+  progress = await run_in_threadpool(job_queries.find_job_progress, db_session, job_id)
+  return _to_response(progress)
+
+def _read_vin_file(body: bytes) -> list[str]:
+  try:
+    lines = body.decode('utf-8-sig').splitlines()
+  except UnicodeDecodeError as ex:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail='The file must be UTF-8 text.') from ex
+
+  vins = [line.split(',', 1)[0].strip().strip('"') for line in lines]
+  if vins and vins[0].lower() == 'vin':
+    vins = vins[1:]
+  return [vin for vin in vins if vin]
+
+def _create_job(db_session: Session, vins: list[str]) -> str:
+  """ Return the id of the job. Checking up to `jobs_max_vins` VINs takes
+      a while, so this runs in the threadpool rather than on the event loop.
+  """
+  # Normalize and de-duplicate the VINs while keeping their order
+  vins = list(dict.fromkeys(vin.strip().upper() for vin in vins))
+  vin_errors = {}
+  for vin in vins:
+    vin_error = vin_analysis.find_vin_error(vin)
+    if vin_error:
+      vin_errors[vin] = vin_error
+
+  job_id = uuid.uuid4().hex
+  job_queries.create_job(db_session, job_id, vins, vin_errors)
+  return job_id
+
+async def _stream_progress(job_id: str, progress: job_queries.JobProgress) -> AsyncIterator[str]:
+  sent_progress = None
+  sent_at = time.monotonic()
+  while progress.status != JobStatus.COMPLETED:
+    if progress != sent_progress:
+      yield _to_event('progress', progress)
+      sent_progress = progress
+      sent_at = time.monotonic()
+    elif time.monotonic() - sent_at >= _KEEP_ALIVE_INTERVAL:
+      yield ': keep-alive\n\n'
+      sent_at = time.monotonic()
+
+    await asyncio.sleep(settings.jobs_event_interval)
+    # The stream may outlive the request's session, so it uses sessions of its own
+    progress = await run_in_threadpool(_find_job_progress, job_id) or progress
+
+  yield _to_event('completed', progress)
+
+def _find_job_progress(job_id: str) -> job_queries.JobProgress | None:
+  with SessionLocal() as db_session:
+    return job_queries.find_job_progress(db_session, job_id)
+
+def _to_event(event: str, progress: job_queries.JobProgress) -> str:
+  return f'event: {event}\ndata: {_to_response(progress).model_dump_json()}\n\n'
+
+def _to_response(progress: job_queries.JobProgress) -> JobResponse:
+  return JobResponse(
+    job_id=progress.id,
+    status=progress.status,
+    vin_count=progress.vin_count,
+    counts=progress.counts,
+    created_at=progress.created_at,
+    updated_at=progress.updated_at,
+  )
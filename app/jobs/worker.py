@@ -0,0 +1,143 @@
+""" Runs the backfill jobs in the background. Every job and the outcome of
+    each of its VINs is stored in the database as it goes, so a job resumes
+    where it stopped when its worker is restarted.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..db.connection import SessionLocal
+from ..db.entities.job import queries as job_queries
+from ..db.entities.job.entity import JobVinStatus
+from ..features.lookup import pipeline
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+class JobWorkerPool:
+  """ `jobs_workers` workers that each claim a job and look its VINs up a
+      batch at a time, through the same pipeline as the `lookup/batch` API.
+      Cached VINs are skipped by the pipeline, and upstream calls queue
+      behind single lookups. Workers of every process that shares the
+      database share the jobs.
+  """
+  def __init__(self):
+    self.owner = uuid.uuid4().hex
+    self._submitted = asyncio.Event()
+
+  def wake_up(self):
+    """ Let the idle workers know that a job was submitted. """
+    self._submitted.set()
+
+  async def run_forever(self):
+    await asyncio.gather(*(self._work() for _ in range(settings.jobs_workers)))
+
+  async def _work(self):
+    while True:
+      self._submitted.clear()
+      try:
+        job_id = await run_in_threadpool(self._claim_job)
+        if job_id:
+          await self.run_job(job_id)
+          continue
+      except Exception:
+        logger.exception('A backfill job failed, it is resumed once its heartbeat times out.')
+
+      try:
+        await asyncio.wait_for(self._submitted.wait(), settings.jobs_poll_interval)
+      except asyncio.TimeoutError:
+        pass
+
+  async def run_job(self, job_id: str):
+    """ Look up the pending VINs of a job claimed by this pool until none is
+        left, or until another worker takes the job over.
+    """
+    lookup_task = asyncio.create_task(self._look_up_pending_vins(job_id))
+    heartbeat_task = asyncio.create_task(self._keep_alive(job_id))
+    try:
+      await asyncio.wait([lookup_task, heartbeat_task], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+      lookup_task.cancel()
+      heartbeat_task.cancel()
+      await asyncio.gather(lookup_task, heartbeat_task, return_exceptions=True)
+
+    if not lookup_task.cancelled() and lookup_task.exception():
+      raise lookup_task.exception()
+    if not heartbeat_task.cancelled():
+      logger.warning('The backfill job %s was taken over by another worker.', job_id)
+
+  async def _look_up_pending_vins(self, job_id: str):
+    while True:
+      pending_vins = await run_in_threadpool(self._find_pending_vins, job_id)
+      if not pending_vins:
+        await run_in_threadpool(self._complete_job, job_id)
+        return
+
+      lookup_outcomes = await pipeline.lookup_vins([pending_vin.vin for pending_vin in pending_vins])
+      outcomes = {}
+      for pending_vin in pending_vins:
+        lookup_outcome = lookup_outcomes[pending_vin.vin]
+        outcomes[pending_vin.id] = (JobVinStatus(lookup_outcome.status.value), lookup_outcome.detail)
+
+      if not await run_in_threadpool(self._record_outcomes, job_id, outcomes):
+        logger.warning('The backfill job %s was taken over by another worker.', job_id)
+        return
+
+  async def _keep_alive(self, job_id: str):
+    """ Return once another worker took the job over. """
+    # A batch can take longer than the heartbeat timeout while upstream is rate limited
+    while True:
+      await asyncio.sleep(settings.jobs_heartbeat_timeout / 3)
+      try:
+        if not await run_in_threadpool(self._record_outcomes, job_id, {}):
+          return
+      except Exception:
+        logger.warning('Failed to record the heartbeat of the backfill job %s.', job_id, exc_info=True)
+
+  def _claim_job(self) -> str | None:
+    with SessionLocal() as db_session:
+      return job_queries.claim_job(db_session, self.owner, time.time() - settings.jobs_heartbeat_timeout)
+
+  def _find_pending_vins(self, job_id: str) -> list[job_queries.PendingVin]:
+    with SessionLocal() as db_session:
+      return job_queries.find_pending_vins(db_session, job_id, settings.jobs_batch_size)
+
+  def _record_outcomes(self, job_id: str, outcomes: dict[int, tuple[JobVinStatus, str]]) -> bool:
+    with SessionLocal() as db_session:
+      return job_queries.record_outcomes(db_session, job_id, self.owner, outcomes)
+
+  def _complete_job(self, job_id: str):
+    with SessionLocal() as db_session:
+      job_queries.complete_job(db_session, job_id, self.owner)
+
+_running_pools: list[JobWorkerPool] = []
+
+def wake_up():
+  """ Start on a submitted job right away, instead of on the next poll. """
+  for pool in _running_pools:
+    pool.wake_up()
+
+@asynccontextmanager
+async def run_in_background() -> AsyncIterator[None]:
+  """ Run the backfill jobs for as long as the context is open. """
+  if settings.jobs_workers <= 0:
+    yield
+    return
+
+  pool = JobWorkerPool()
+  _running_pools.append(pool)
+  task = asyncio.create_task(pool.run_forever())
+  try:
+    yield
+  finally:
+    _running_pools.remove(pool)
+    task.cancel()
+    try:
+      await task
+    except asyncio.CancelledError:
+      pass
@@ -1,21 +1,46 @@
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from .db.connection import Base, Engine, SQLITE_FILE_PATH
+from . import metrics
+from .apis import decoders, http_client
+from .db import cache_backends, migrations
+from .db.connection import Engine, SessionLocal
+from .db.warmup import warm_up_cache
 from .features import lookup
+from .features.lookup import maintenance
 from .features import remove
 from .features import export
 from .features import list_vins
+from .features import search
+from .features import import_vins
+from .features import metrics as metrics_feature
+from . import jobs
+from .jobs import worker as jobs_worker
+from .settings import settings
 
-# Remove the sqlite cache at startup
-if os.path.exists(SQLITE_FILE_PATH):
-  os.remove(SQLITE_FILE_PATH)
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+  # The cache persists across restarts, so bring its schema up to date
+  # and optionally load a pre-built cache before accepting traffic
+  migrations.migrate(Engine)
+  # Opens the local vPIC snapshot, if any, so that a missing file fails the startup
+  decoders.get_decoder()
+  if settings.cache_warmup_file:
+    with SessionLocal() as db_session:
+      warm_up_cache(db_session, settings.cache_warmup_file)
 
-# Create all tables
-Base.metadata.create_all(bind=Engine)
+  # Share one pool of keep-alive connections per upstream API across all requests,
+  # keep the cache within its budgets while the app runs, run the backfill jobs,
+  # resuming those that were interrupted, and drop the VINs that other instances
+  # remove from the memory cache
+  with cache_backends.listen_for_invalidations():
+    async with (http_client.open_clients(), maintenance.run_in_background(),
+                jobs_worker.run_in_background()):
+      yield
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # TODO: update this to allow certain origins only
 origins = ["*"]
@@ -27,11 +52,17 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so that it wraps the other middlewares and times them too
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(lookup.router)
 app.include_router(remove.router)
 app.include_router(export.router)
 app.include_router(list_vins.router)
+app.include_router(search.router)
+app.include_router(import_vins.router)
+app.include_router(metrics_feature.router)
+app.include_router(jobs.router)
 
 frontend_path = os.path.join(os.path.dirname(__file__), 'frontend')
 app.mount('/', StaticFiles(directory=frontend_path, html=True), name='frontend')
@@ -0,0 +1,229 @@
+""" Metrics in the Prometheus text format, served by the `metrics` API.
+    Recording a metric takes a lock and a few arithmetic operations, so it
+    is cheap enough for the cache hit path.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from sqlalchemy import Engine, event
+
+from .apis.exceptions import ApiError
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(11))
+
+class _Metric:
+  metric_type = ''
+
+  def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+    self.name = name
+    self.description = description
+    self.label_names = label_names
+    self._lock = threading.Lock()
+
+  def render(self) -> Iterator[str]:
+    yield f'# HELP {self.name} {self.description}'
+    yield f'# TYPE {self.name} {self.metric_type}'
+    yield from self._render_samples()
+
+  def _render_samples(self) -> Iterator[str]:
+    raise NotImplementedError()
+
+  def _format_labels(self, label_values: tuple[str, ...], **extra_labels: str) -> str:
+    labels = [*zip(self.label_names, label_values), *extra_labels.items()]
+    if not labels:
+      return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels) + '}'
+
+class Counter(_Metric):
+  metric_type = 'counter'
+
+  def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+    super().__init__(name, description, label_names)
+    self._values: dict[tuple[str, ...], float] = {}
+
+  def inc(self, *label_values: str, amount: float = 1):
+    with self._lock:
+      self._values[label_values] = self._values.get(label_values, 0) + amount
+
+  def value(self, *label_values: str) -> float:
+    return self._values.get(label_values, 0)
+
+  def _render_samples(self) -> Iterator[str]:
+    with self._lock:
+      values = list(self._values.items())
+    for label_values, value in values:
+      yield f'{self.name}{self._format_labels(label_values)} {value}'
+
+class Histogram(_Metric):
+  metric_type = 'histogram'
+
+  def __init__(self, name: str, description: str, label_names: tuple[str, ...] = (),
+               buckets: tuple[float, ...] = LATENCY_BUCKETS):
+    super().__init__(name, description, label_names)
+    self.buckets = buckets
+    # Per label values: the count of each bucket, not cumulative, then the sum
+    self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+  def observe(self, value: float, *label_values: str):
+    bucket_index = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      counts, total = self._values.setdefault(label_values, ([0] * (len(self.buckets) + 1), [0.0]))
+      counts[bucket_index] += 1
+      total[0] += value
+
+  def count(self, *label_values: str) -> int:
+    counts, _ = self._values.get(label_values, ([0], [0.0]))
+    return sum(counts)
+
+  @contextmanager
+  def time(self, *label_values: str) -> Iterator[None]:
+    started_at = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - started_at, *label_values)
+
+  def _render_samples(self) -> Iterator[str]:
+    with self._lock:
+      values = [(label_values, list(counts), total[0]) for label_values, (counts, total) in self._values.items()]
+
+    for label_values, counts, total in values:
+      cumulative_count = 0
+      for upper_bound, count in zip([*self.buckets, '+Inf'], counts):
+        cumulative_count += count
+        labels = self._format_labels(label_values, le=upper_bound)
+        yield f'{self.name}_bucket{labels} {cumulative_count}'
+      yield f'{self.name}_sum{self._format_labels(label_values)} {total}'
+      yield f'{self.name}_count{self._format_labels(label_values)} {cumulative_count}'
+
+class Gauge(_Metric):
+  """ A gauge whose samples are read when the metrics are rendered, from
+      a function that returns the value of each set of label values.
+  """
+  metric_type = 'gauge'
+
+  def __init__(self, name: str, description: str, label_names: tuple[str, ...],
+               read: Callable[[], dict[tuple[str, ...], float]]):
+    super().__init__(name, description, label_names)
+    self._read = read
+
+  def _render_samples(self) -> Iterator[str]:
+    for label_values, value in self._read().items():
+      yield f'{self.name}{self._format_labels(label_values)} {value}'
+
+def _escape(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Registry:
+  def __init__(self):
+    self._metrics: list[_Metric] = []
+
+  def register(self, metric: _Metric) -> _Metric:
+    self._metrics.append(metric)
+    return metric
+
+  def render(self) -> str:
+    return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+  'vin_lookup_http_request_duration_seconds', 'Time to answer a request, by route.',
+  ('method', 'route', 'status_code'),
+))
+upstream_request_duration = registry.register(Histogram(
+  'vin_lookup_upstream_request_duration_seconds', 'Time of the calls to upstream APIs.',
+  ('upstream',),
+))
+upstream_errors = registry.register(Counter(
+  'vin_lookup_upstream_errors_total', 'Failed calls to upstream APIs.',
+  ('upstream', 'error', 'status_code'),
+))
+cache_requests = registry.register(Counter(
+  'vin_lookup_cache_requests_total', 'Cache lookups by cache tier and result.',
+  ('cache', 'result'),
+))
+db_query_duration = registry.register(Histogram(
+  'vin_lookup_db_query_duration_seconds', 'Time of the database statements.',
+  ('statement',),
+))
+export_duration = registry.register(Histogram(
+  'vin_lookup_export_duration_seconds', 'Time to stream a whole export.',
+  ('format',), buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+))
+export_size = registry.register(Histogram(
+  'vin_lookup_export_size_bytes', 'Size of the exported files.',
+  ('format',), buckets=SIZE_BUCKETS,
+))
+
+def record_cache_result(cache: str, is_hit: bool, count: int = 1):
+  if count:
+    cache_requests.inc(cache, 'hit' if is_hit else 'miss', amount=count)
+
+@contextmanager
+def track_upstream(upstream: str) -> Iterator[None]:
+  """ Time a call to an upstream API and count the `ApiError` it raises. """
+  started_at = time.perf_counter()
+  try:
+    yield
+  except ApiError as ex:
+    upstream_errors.inc(upstream, type(ex).__name__, str(ex.error_status_code))
+    raise
+  finally:
+    upstream_request_duration.observe(time.perf_counter() - started_at, upstream)
+
+def instrument_engine(engine: Engine):
+  """ Time every statement the engine runs, by the statement's first keyword. """
+  @event.listens_for(engine, 'before_cursor_execute')
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+  @event.listens_for(engine, 'after_cursor_execute')
+  def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info['query_started_at'].pop()
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    db_query_duration.observe(time.perf_counter() - started_at, keyword)
+
+class MetricsMiddleware:
+  """ Time every HTTP request, labeled by the path template of its route
+      so that the number of label values stays bounded.
+  """
+  def __init__(self, app):
+    self.app = app
+    self._route_paths: dict[Callable, str] = {}
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+
+    status_code = 500
+
+    async def send_with_status(message):
+      nonlocal status_code
+      if message['type'] == 'http.response.start':
+        status_code = message['status']
+      await send(message)
+
+    started_at = time.perf_counter()
+    try:
+      await self.app(scope, receive, send_with_status)
+    finally:
+      http_request_duration.observe(
+        time.perf_counter() - started_at,
+        scope['method'], self._find_route_path(scope), str(status_code)
+      )
+
+  def _find_route_path(self, scope) -> str:
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+      return 'other'
+    if endpoint not in self._route_paths:
+      self._route_paths.update(
+        (route.endpoint, route.path) for route in scope['app'].routes if hasattr(route, 'endpoint')
+      )
+    return self._route_paths.get(endpoint, 'other')
@@ -0,0 +1,26 @@
+""" Reading the raw request bodies that the upload routes accept, without
+    letting a client send more than the route allows.
+"""
+from typing import AsyncIterator
+
+from fastapi import HTTPException, Request, status
+
+async def stream_body(request: Request, max_bytes: int) -> AsyncIterator[bytes]:
+  """ The chunks of the body. Fails with a 413 as soon as the body turns
+      out to be larger than `max_bytes`, a declared length is checked
+      before anything is read.
+  """
+  content_length = request.headers.get('content-length', '')
+  if content_length.isdigit() and int(content_length) > max_bytes:
+    raise _too_large(max_bytes)
+
+  size = 0
+  async for chunk in request.stream():
+    size += len(chunk)
+    if size > max_bytes:
+      raise _too_large(max_bytes)
+    yield chunk
+
+def _too_large(max_bytes: int) -> HTTPException:
+  return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                       detail=f'The request body must be at most {max_bytes} bytes.')
@@ -0,0 +1,22 @@
+""" A fast path for responses made of data read from our own cache. The
+    data was validated when it was cached, so it's serialized as is rather
+    than validated again against the route's response model, and with
+    orjson when it's installed.
+"""
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+class TrustedJSONResponse(JSONResponse):
+  """ Routes that return it should still declare their `response_model`,
+      it documents the response even though it's no longer checked.
+  """
+  def render(self, content: Any) -> bytes:
+    if orjson is None:
+      return super().render(content)
+    return orjson.dumps(content)
@@ -1,5 +1,6 @@
 from urllib.parse import urlparse
 from pydantic import BaseModel, ValidationInfo, field_validator
+from .. import vin_analysis
 
 class Vin(BaseModel):
   """ The domain model that represents a VIN. """
@@ -34,8 +35,9 @@ class Vin(BaseModel):
   @field_validator('vin')
   @classmethod
   def check_vin_format(cls, value: str) -> str:
-    if not cls.is_vin_correct_format(value):
-      raise ValueError(f"VIN \"{value}\" must be a 17 alphanumeric characters string.")
+    error = vin_analysis.find_vin_error(value)
+    if error:
+      raise ValueError(f"VIN \"{value}\" is invalid: {error}")
     return value
 
   @field_validator("vin", "make", "model", "model_year", "body_class")
@@ -47,10 +49,11 @@ class Vin(BaseModel):
 
   @classmethod
   def is_vin_correct_format(cls, vin: str) -> bool:
-    """ Check if the given vin is 17 characters and
-        all characters are alphanumeric.
+    """ Check if the given vin is 17 characters, made of the
+        characters allowed by ISO 3779 and has a valid check digit
+        where one is required. See `vin_analysis.find_vin_error`.
     """
-    return len(vin) == 17 and vin.isalnum()
+    return vin_analysis.is_vin_valid(vin)
 
   @classmethod
   def is_url(cls, url: str) -> bool:
@@ -0,0 +1,175 @@
+from typing import Literal
+
+from pydantic import model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+class Settings(BaseSettings):
+  """ The application settings. Every field can be overridden
+      with an environment variable prefixed with `VIN_LOOKUP_`,
+      e.g. `VIN_LOOKUP_VPIC_BASE_URL`.
+  """
+  model_config = SettingsConfigDict(env_prefix='VIN_LOOKUP_')
+
+  # The cache database, a SQLAlchemy URL of a SQLite or PostgreSQL database
+  database_url: str = 'sqlite:///./vin_cache.db'
+  # AnyIO runs sync routes and `run_in_threadpool` calls on up to 40 threads,
+  # each of which may hold a connection
+  database_pool_size: int = 40
+  database_max_overflow: int = 10
+  database_pool_timeout: float = 30
+  # Applied to every SQLite connection. WAL lets readers run while a write
+  # commits, and NORMAL sync is durable enough in WAL mode for a cache.
+  sqlite_journal_mode: Literal['WAL', 'DELETE', 'TRUNCATE', 'MEMORY'] = 'WAL'
+  sqlite_synchronous: Literal['OFF', 'NORMAL', 'FULL'] = 'NORMAL'
+  sqlite_mmap_size: int = 256 * 1024 * 1024
+  # A negative size is in KiB
+  sqlite_cache_size: int = -64 * 1024
+  # Milliseconds a connection waits for a lock before failing
+  sqlite_busy_timeout: int = 5000
+
+  # Where the cached VINs are kept: `database` above, `redis` to also share them with the
+  # other instances through Redis, or `memory` for tests. See `app.db.cache_backends`.
+  cache_backend: Literal['database', 'redis', 'memory'] = 'database'
+  redis_url: str = 'redis://localhost:6379/0'
+  redis_key_prefix: str = 'vin-lookup:'
+  # VINs shared through Redis expire after this many seconds, 0 keeps them
+  redis_vin_ttl: float = 7 * 24 * 60 * 60
+  redis_timeout: float = 1
+  redis_reconnect_delay: float = 1
+
+  # The in-process cache in front of the database, a max size of 0 disables it.
+  # Each worker has its own, and only the `redis` backend tells the others when a VIN
+  # is removed or changed. Otherwise another worker may keep serving the old VIN
+  # until its entry expires after `vin_memory_cache_ttl` seconds.
+  vin_memory_cache_max_size: int = 10_000
+  vin_memory_cache_ttl: float = 5
+
+  # The cache maintenance runs in the background every this many seconds, 0 disables it.
+  # It records when VINs were last served, evicts VINs beyond the budgets below,
+  # prunes the negative cache and looks for photos of the VINs that have none.
+  cache_maintenance_interval: float = 60
+  # Budgets of the `vin` table, 0 means unlimited. Over budget, the least recently
+  # served VINs are evicted first with the `lru` policy, the oldest with `age`.
+  cache_max_rows: int = 0
+  cache_max_bytes: int = 0
+  cache_max_age: float = 0
+  cache_eviction_policy: Literal['lru', 'age'] = 'lru'
+  # At most this many VINs are evicted per run, so that a run never holds the database for long
+  cache_eviction_batch_size: int = 10_000
+  # VINs looked at per run for a missing photo, 0 disables the photo refresh
+  cache_photo_refresh_batch_size: int = 100
+  cache_photo_refresh_concurrency: int = 4
+
+  # Backfill jobs look up their VINs in the background, `jobs_workers` jobs at once and
+  # `jobs_batch_size` VINs at a time, 0 workers disables running them. A running job whose
+  # worker made no progress for `jobs_heartbeat_timeout` seconds, e.g. because it was
+  # restarted, is resumed by another worker. Idle workers look for jobs every poll interval.
+  jobs_workers: int = 2
+  jobs_batch_size: int = 500
+  jobs_max_vins: int = 1_000_000
+  # The largest file of VINs the `jobs/file` API accepts, it's held in memory while it's read
+  jobs_max_file_bytes: int = 64 * 1024 * 1024
+  jobs_heartbeat_timeout: float = 60
+  jobs_poll_interval: float = 1
+  # The progress stream of a job checks for progress every this many seconds
+  jobs_event_interval: float = 1
+
+  # A file produced by the `export` API, loaded into the cache at startup
+  cache_warmup_file: str = ''
+  # The largest file the `import` API accepts, it's spooled to disk while it's read
+  import_max_bytes: int = 1024 * 1024 * 1024
+
+  # The `list` API pages through the cache
+  list_default_page_size: int = 100
+  list_max_page_size: int = 1000
+  # The `search` API ranks its matches best first, unless there are more than this
+  # many, which would take too long to rank. They then come in the order they were cached.
+  search_max_ranked_matches: int = 1000
+
+  # The export is streamed in chunks of rows to keep memory flat
+  export_csv_chunk_size: int = 10_000
+  export_parquet_row_group_size: int = 100_000
+  # Each export is stored until the cache changes and served again meanwhile. The least
+  # recently used ones are removed beyond the size budget, 0 disables storing them.
+  export_snapshot_dir: str = './export_snapshots'
+  export_snapshot_max_bytes: int = 1024 * 1024 * 1024
+
+  # Outbound HTTP connection pool, shared by all upstream APIs
+  http2: bool = True
+  http_max_connections: int = 200
+  http_max_keepalive_connections: int = 50
+  http_keepalive_expiry: float = 30
+  http_connect_timeout: float = 3
+
+  vpic_base_url: str = 'https://vpic.nhtsa.dot.gov/api/vehicles'
+  # vPIC accepts at most 50 VINs per DecodeVINValuesBatch call
+  vpic_batch_size: int = 50
+  vpic_timeout: float = 3
+  # A local snapshot of vPIC's decode tables, see `app.apis.local_vpic`. It can be the
+  # `primary` decoder with vPIC decoding what it can't, the `fallback` while vPIC fails,
+  # or a `shadow` whose disagreements with vPIC are logged
+  local_vpic_mode: Literal['off', 'primary', 'fallback', 'shadow'] = 'off'
+  local_vpic_snapshot: str = ''
+  car_imagery_base_url: str = 'https://www.carimagery.com/api.asmx'
+  car_imagery_timeout: float = 3
+
+  # Calls to each upstream are spaced out to at most `rate_limit` per second, with bursts
+  # of up to `rate_burst` calls, and at most `max_concurrency` are in flight at once.
+  # 0 disables either limit. Lookups queue ahead of batch lookups and background work.
+  vpic_rate_limit: float = 20
+  vpic_rate_burst: int = 20
+  vpic_max_concurrency: int = 10
+  car_imagery_rate_limit: float = 10
+  car_imagery_rate_burst: int = 10
+  car_imagery_max_concurrency: int = 10
+  # Share the limits above across the workers that use the database, instead of
+  # applying them to each worker. A slot not released within the lease TTL is freed.
+  rate_limit_shared: bool = False
+  rate_limit_lease_ttl: float = 30
+  rate_limit_poll_interval: float = 0.05
+
+  # After this many consecutive failures an upstream's circuit breaker opens and
+  # its calls fail right away, until a trial call succeeds after the open duration
+  upstream_breaker_failure_threshold: int = 5
+  upstream_breaker_open_duration: float = 30
+  # Idempotent calls that fail with a 429 or 5xx are retried after a jittered backoff
+  upstream_retries: int = 2
+  upstream_retry_base_delay: float = 0.1
+  upstream_retry_max_delay: float = 1
+  # The timeout of a call is this many times the upstream's recent p99 latency, at least
+  # the min timeout and at most the upstream's own timeout above
+  upstream_timeout_multiplier: float = 3
+  upstream_min_timeout: float = 0.5
+  upstream_latency_window: int = 200
+  # An idempotent call slower than this percentile of recent calls gets a second,
+  # hedged request, and the first answer wins. 0 disables hedging.
+  upstream_hedge_percentile: float = 0.95
+
+  lookup_batch_max_vins: int = 5000
+  # How many seconds a cache miss waits for its photo before responding without
+  # one. A photo that arrives later is still stored in the cache.
+  lookup_photo_deadline: float = 0
+  # VINs that vPIC can't decode are remembered for this many seconds,
+  # a max size of 0 disables the negative cache. The cache maintenance
+  # drops the expired entries and the oldest ones beyond the max size.
+  negative_cache_ttl: float = 24 * 60 * 60
+  negative_cache_max_size: int = 100_000
+  # Photos are shared by every VIN of the same make, model and model year
+  # and are fetched again from CarImagery once they are older than this
+  photo_cache_ttl: float = 7 * 24 * 60 * 60
+  # While vPIC is unavailable, answer lookups with the make and model year decoded
+  # from the VIN itself, as a 203 response with `partial` set, instead of a 503
+  lookup_partial_on_vpic_error: bool = False
+  # Coordinate concurrent misses of the same VIN across workers through a lock in the
+  # database. Within a worker they are always coalesced into a single upstream call.
+  lookup_db_lock: bool = False
+  lookup_db_lock_timeout: float = 10
+  lookup_db_lock_poll_interval: float = 0.05
+
+  @model_validator(mode='after')
+  def check_local_vpic_snapshot(self) -> 'Settings':
+    if self.local_vpic_mode != 'off' and not self.local_vpic_snapshot:
+      raise ValueError('local_vpic_snapshot must be set to use the local vPIC decoder.')
+    return self
+
+settings = Settings()
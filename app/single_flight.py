@@ -0,0 +1,28 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar('T')
+
+class SingleFlight(Generic[T]):
+  """ Coalesce concurrent calls for the same key into one. While a call
+      for a key is in flight, every other caller with that key awaits the
+      result of that call instead of making its own. The call runs as a
+      task, so a caller that gets cancelled doesn't cancel the others.
+  """
+  def __init__(self):
+    self._tasks: dict[str, asyncio.Task[T]] = {}
+
+  async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+    task = self._tasks.get(key)
+    if task is None:
+      task = asyncio.ensure_future(fn())
+      self._tasks[key] = task
+      task.add_done_callback(lambda done_task: self._forget(key, done_task))
+    return await asyncio.shield(task)
+
+  def in_flight(self, key: str) -> bool:
+    return key in self._tasks
+
+  def _forget(self, key: str, task: asyncio.Task[T]):
+    if self._tasks.get(key) is task:
+      del self._tasks[key]
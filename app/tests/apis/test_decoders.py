@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+from pydantic import ValidationError
+
+from ...apis import decoders
+from ...apis.vpic import VpicApiError
+from ...schemas import Vin
+from ...settings import Settings, settings
+from ..data import STUB_VEHICLES
+from .test_local_vpic import write_snapshot
+
+pytestmark = pytest.mark.anyio
+
+VINS = list(STUB_VEHICLES)
+
+class FakeDecoder(decoders.VinDecoder):
+  def __init__(self, vehicles: dict[str, dict[str, str]], error: Exception | None = None):
+    self.vehicles = vehicles
+    self.error = error
+    self.calls: list[list[str]] = []
+
+  async def find_vin(self, vin: str) -> Vin | None:
+    return (await self.find_vins([vin]))[vin]
+
+  async def find_vins(self, vins: list[str]) -> dict[str, Vin | None]:
+    self.calls.append(vins)
+    if self.error:
+      raise self.error
+    return {vin: Vin(vin=vin, **self.vehicles[vin]) if vin in self.vehicles else None for vin in vins}
+
+async def test_chained_decoder_only_sends_misses_to_secondary():
+  primary = FakeDecoder({VINS[0]: STUB_VEHICLES[VINS[0]]})
+  secondary = FakeDecoder(STUB_VEHICLES)
+
+  decoded_vins = await decoders.ChainedDecoder(primary, secondary).find_vins(VINS)
+
+  assert all(decoded_vins.values())
+  assert secondary.calls == [VINS[1:]]
+
+async def test_failover_decoder_uses_backup_while_primary_fails():
+  primary = FakeDecoder(STUB_VEHICLES, error=VpicApiError("Down", 503))
+  backup = FakeDecoder(STUB_VEHICLES)
+
+  decoded_vin = await decoders.FailoverDecoder(primary, backup).find_vin(VINS[0])
+
+  assert decoded_vin.make == STUB_VEHICLES[VINS[0]]["make"]
+
+async def test_failover_decoder_raises_if_backup_cannot_decode():
+  primary = FakeDecoder(STUB_VEHICLES, error=VpicApiError("Down", 503))
+  backup = FakeDecoder({})
+
+  with pytest.raises(VpicApiError):
+    await decoders.FailoverDecoder(primary, backup).find_vins(VINS)
+
+async def test_shadow_decoder_counts_mismatches(monkeypatch: pytest.MonkeyPatch):
+  monkeypatch.setattr(decoders, "shadow_stats", decoders.ShadowStats())
+  primary = FakeDecoder(STUB_VEHICLES)
+  shadow = FakeDecoder({**STUB_VEHICLES, VINS[0]: {**STUB_VEHICLES[VINS[0]], "model": "Other"}})
+
+  decoded_vins = await decoders.ShadowDecoder(primary, shadow).find_vins(VINS)
+  await decoders.wait_for_shadow_comparisons()
+
+  assert decoded_vins[VINS[0]].model == STUB_VEHICLES[VINS[0]]["model"]
+  assert decoders.shadow_stats == decoders.ShadowStats(matches=2, mismatches=1)
+
+async def test_shadow_decoder_failure_does_not_fail_lookup(monkeypatch: pytest.MonkeyPatch):
+  monkeypatch.setattr(decoders, "shadow_stats", decoders.ShadowStats())
+  primary = FakeDecoder(STUB_VEHICLES)
+  shadow = FakeDecoder(STUB_VEHICLES, error=sqlite3.OperationalError("database is locked"))
+
+  decoded_vin = await decoders.ShadowDecoder(primary, shadow).find_vin(VINS[0])
+  await decoders.wait_for_shadow_comparisons()
+
+  assert decoded_vin.make == STUB_VEHICLES[VINS[0]]["make"]
+  assert decoders.shadow_stats == decoders.ShadowStats(failures=1)
+
+@pytest.mark.parametrize("mode, decoder_type", [
+  ("off", decoders.VpicDecoder),
+  ("primary", decoders.ChainedDecoder),
+  ("fallback", decoders.FailoverDecoder),
+  ("shadow", decoders.ShadowDecoder),
+])
+async def test_get_decoder(tmp_path, monkeypatch: pytest.MonkeyPatch, mode: str, decoder_type: type):
+  monkeypatch.setattr(settings, "local_vpic_mode", mode)
+  monkeypatch.setattr(settings, "local_vpic_snapshot", write_snapshot(tmp_path))
+
+  assert isinstance(decoders.get_decoder(), decoder_type)
+
+def test_local_decoder_requires_a_snapshot():
+  with pytest.raises(ValidationError, match="local_vpic_snapshot"):
+    Settings(local_vpic_mode="primary")
+
+async def test_local_primary_decodes_without_vpic(tmp_path, monkeypatch: pytest.MonkeyPatch):
+  monkeypatch.setattr(settings, "local_vpic_mode", "primary")
+  monkeypatch.setattr(settings, "local_vpic_snapshot", write_snapshot(tmp_path))
+
+  # The HTTP clients aren't open, so any call to vPIC would fail
+  decoded_vins = await decoders.get_decoder().find_vins(VINS)
+
+  assert all(decoded_vins.values())
@@ -0,0 +1,70 @@
+import csv
+from pathlib import Path
+
+import pytest
+
+from ...apis.local_vpic import LocalVpicDecoder, build_snapshot
+from ..data import STUB_VEHICLES
+
+WMIS = [
+  {"wmi": "1XP", "make": "PETERBILT"},
+  {"wmi": "1XK", "make": "KENWORTH"},
+]
+VDS_PATTERNS = [
+  {"wmi": "1XP", "pattern": "WD***", "year_from": 2013, "year_to": 2020,
+   "make": "", "model": "579", "body_class": "Truck-Tractor"},
+  {"wmi": "1XP", "pattern": "5DB**", "year_from": 1990, "year_to": 2005,
+   "make": "", "model": "379", "body_class": "Truck-Tractor"},
+  {"wmi": "1XK", "pattern": "WDB[0-9]X", "year_from": 2007, "year_to": 2007,
+   "make": "", "model": "W9 Series", "body_class": "Truck-Tractor"},
+  # Less specific than the pattern above, so it never wins over it
+  {"wmi": "1XK", "pattern": "WD***", "year_from": 2000, "year_to": 2010,
+   "make": "", "model": "W900", "body_class": "Truck-Tractor"},
+]
+
+def write_snapshot(tmp_path: Path) -> str:
+  for name, rows in [("wmi.csv", WMIS), ("vds_pattern.csv", VDS_PATTERNS)]:
+    with open(tmp_path / name, "w", newline="") as file:
+      writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+      writer.writeheader()
+      writer.writerows(rows)
+
+  snapshot_path = str(tmp_path / "vpic_snapshot.db")
+  build_snapshot(snapshot_path, str(tmp_path / "wmi.csv"), str(tmp_path / "vds_pattern.csv"))
+  return snapshot_path
+
+@pytest.fixture
+def decoder(tmp_path: Path):
+  decoder = LocalVpicDecoder(write_snapshot(tmp_path))
+  yield decoder
+  decoder.close()
+
+@pytest.mark.parametrize("vin, vehicle", list(STUB_VEHICLES.items()))
+def test_find_vin(decoder: LocalVpicDecoder, vin: str, vehicle: dict[str, str]):
+  decoded_vin = decoder.find_vin(vin.lower())
+
+  assert decoded_vin is not None
+  assert decoded_vin.vin == vin
+  assert decoded_vin.make == vehicle["make"]
+  assert decoded_vin.model == vehicle["model"]
+  assert decoded_vin.model_year == vehicle["model_year"]
+  assert decoded_vin.body_class == vehicle["body_class"]
+
+def test_find_vin_of_the_previous_year_cycle(decoder: LocalVpicDecoder):
+  # S is 2025 in the latest cycle, but the pattern is for 1990 to 2005
+  decoded_vin = decoder.find_vin("1XP5DB9X8SN526158")
+
+  assert decoded_vin is not None
+  assert decoded_vin.model == "379"
+  assert decoded_vin.model_year == "1995"
+
+@pytest.mark.parametrize("vin", [
+  # Unknown WMI
+  "2T1BURHE0JC123456",
+  # Known WMI but no pattern matches
+  "1XPXX40X1ED215307",
+  # The pattern matches but not for this model year
+  "1XPWD40X3AD215307",
+])
+def test_find_vin_not_decoded(decoder: LocalVpicDecoder, vin: str):
+  assert decoder.find_vin(vin) is None
@@ -0,0 +1,107 @@
+import asyncio
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ...apis import rate_limit
+from ...db.migrations import migrate
+from ...settings import settings
+
+pytestmark = pytest.mark.anyio
+
+async def test_token_bucket_spaces_out_calls_after_the_burst():
+  with patch('time.monotonic', return_value=100):
+    bucket = rate_limit.TokenBucket(rate=10, burst=2)
+    waits = [bucket.reserve() for _ in range(4)]
+
+  assert waits == pytest.approx([0, 0, 0.1, 0.2])
+
+async def test_semaphore_wakes_waiters_by_priority():
+  semaphore = rate_limit.PrioritySemaphore(1)
+  await semaphore.acquire(rate_limit.Priority.BATCH)
+  order = []
+
+  async def wait(name: str, priority: rate_limit.Priority):
+    await semaphore.acquire(priority)
+    order.append(name)
+    semaphore.release()
+
+  tasks = [
+    asyncio.create_task(wait('batch', rate_limit.Priority.BATCH)),
+    asyncio.create_task(wait('interactive', rate_limit.Priority.INTERACTIVE)),
+  ]
+  await asyncio.sleep(0)
+  semaphore.release()
+  await asyncio.gather(*tasks)
+
+  assert order == ['interactive', 'batch']
+
+async def test_semaphore_skips_cancelled_waiters():
+  semaphore = rate_limit.PrioritySemaphore(1)
+  await semaphore.acquire(rate_limit.Priority.INTERACTIVE)
+  cancelled_task = asyncio.create_task(semaphore.acquire(rate_limit.Priority.INTERACTIVE))
+  await asyncio.sleep(0)
+  cancelled_task.cancel()
+  await asyncio.sleep(0)
+
+  semaphore.release()
+
+  await asyncio.wait_for(semaphore.acquire(rate_limit.Priority.BATCH), 1)
+
+async def test_limiter_caps_calls_in_flight():
+  limiter = rate_limit.UpstreamLimiter('test', rate=0, burst=0, max_concurrency=2)
+  in_flight = max_in_flight = 0
+
+  async def call():
+    nonlocal in_flight, max_in_flight
+    async with limiter.acquire():
+      in_flight += 1
+      max_in_flight = max(max_in_flight, in_flight)
+      await asyncio.sleep(0.01)
+      in_flight -= 1
+
+  await asyncio.gather(*(call() for _ in range(6)))
+
+  assert max_in_flight == 2
+
+async def test_limiter_lets_interactive_calls_go_first():
+  limiter = rate_limit.UpstreamLimiter('test', rate=100, burst=1, max_concurrency=0)
+  order = []
+
+  async def call(name: str):
+    async with limiter.acquire():
+      order.append(name)
+
+  with rate_limit.priority(rate_limit.Priority.BATCH):
+    batch_tasks = [asyncio.create_task(call(f'batch{i}')) for i in range(3)]
+  await asyncio.sleep(0)
+  await call('interactive')
+  await asyncio.gather(*batch_tasks)
+
+  # The first batch call took the token that was free, the interactive call
+  # then went ahead of the batch calls that were waiting for one
+  assert order == ['batch0', 'interactive', 'batch1', 'batch2']
+
+async def test_shared_limiter_uses_the_database(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  monkeypatch.setattr(rate_limit, 'SessionLocal', sessionmaker(bind=engine))
+  monkeypatch.setattr(settings, 'rate_limit_shared', True)
+  # Two workers, each with its own limiter
+  limiters = [rate_limit.UpstreamLimiter('test', rate=100, burst=2, max_concurrency=1) for _ in range(2)]
+  in_flight = max_in_flight = 0
+
+  async def call(limiter: rate_limit.UpstreamLimiter):
+    nonlocal in_flight, max_in_flight
+    async with limiter.acquire():
+      in_flight += 1
+      max_in_flight = max(max_in_flight, in_flight)
+      await asyncio.sleep(0.01)
+      in_flight -= 1
+
+  await asyncio.gather(*(call(limiter) for limiter in limiters * 2))
+
+  assert max_in_flight == 1
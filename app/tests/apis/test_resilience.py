@@ -0,0 +1,189 @@
+import asyncio
+
+import pytest
+
+from ...apis import rate_limit, resilience
+from ...apis.exceptions import ApiError
+from ...settings import settings
+
+pytestmark = pytest.mark.anyio
+
+OPEN_ERROR = ApiError("Unavailable", 503)
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch: pytest.MonkeyPatch):
+  monkeypatch.setattr(settings, "upstream_retry_base_delay", 0)
+  monkeypatch.setattr(settings, "upstream_breaker_failure_threshold", 3)
+  monkeypatch.setattr(settings, "upstream_breaker_open_duration", 60)
+
+def failing_send(status_code: int, calls: list[float]):
+  async def send(timeout: float):
+    calls.append(timeout)
+    raise ApiError("Failed", status_code)
+  return send
+
+async def test_retries_idempotent_calls():
+  calls = []
+
+  with pytest.raises(ApiError):
+    await resilience.ResilientUpstream(3).call(failing_send(503, calls), idempotent=True, open_error=OPEN_ERROR)
+
+  assert len(calls) == settings.upstream_retries + 1
+
+@pytest.mark.parametrize("idempotent, status_code", [(False, 503), (True, 400)])
+async def test_does_not_retry(idempotent: bool, status_code: int):
+  calls = []
+
+  with pytest.raises(ApiError) as ex:
+    await resilience.ResilientUpstream(3).call(failing_send(status_code, calls), idempotent, OPEN_ERROR)
+
+  assert ex.value.error_status_code == status_code
+  assert len(calls) == 1
+
+async def test_breaker_fails_fast_once_open():
+  upstream = resilience.ResilientUpstream(3)
+  calls = []
+  for _ in range(3):
+    with pytest.raises(ApiError):
+      await upstream.call(failing_send(503, calls), idempotent=False, open_error=OPEN_ERROR)
+
+  with pytest.raises(ApiError) as ex:
+    await upstream.call(failing_send(503, calls), idempotent=False, open_error=OPEN_ERROR)
+
+  assert ex.value is OPEN_ERROR
+  assert len(calls) == 3
+  assert upstream.breaker.is_open
+
+async def test_breaker_closes_after_successful_trial(monkeypatch: pytest.MonkeyPatch):
+  breaker = resilience.CircuitBreaker(failure_threshold=1, open_duration=60)
+  breaker.record_failure()
+  assert not breaker.allow_call()
+
+  # The open duration is over
+  breaker._opened_at -= 60
+  assert breaker.allow_call()
+  # Only one trial call at a time
+  assert not breaker.allow_call()
+  breaker.record_success()
+
+  assert breaker.allow_call()
+  assert not breaker.is_open
+
+def open_for_trial(upstream: resilience.ResilientUpstream):
+  """ Open the breaker and let its open duration pass. """
+  for _ in range(upstream.breaker.failure_threshold):
+    upstream.breaker.record_failure()
+  upstream.breaker._opened_at -= upstream.breaker.open_duration
+
+async def test_breaker_closes_after_trial_rejected_by_upstream():
+  # Arrange
+  upstream = resilience.ResilientUpstream(3)
+  open_for_trial(upstream)
+
+  # Act
+  with pytest.raises(ApiError) as ex:
+    await upstream.call(failing_send(404, []), idempotent=True, open_error=OPEN_ERROR)
+
+  # Assert
+  assert ex.value.error_status_code == 404
+  assert upstream.breaker.allow_call()
+  assert not upstream.breaker.is_open
+
+async def test_breaker_lets_another_trial_through_after_cancelled_trial():
+  # Arrange
+  upstream = resilience.ResilientUpstream(3)
+  open_for_trial(upstream)
+  started = asyncio.Event()
+
+  async def hanging_send(timeout: float):
+    started.set()
+    await asyncio.sleep(60)
+
+  # Act
+  task = asyncio.create_task(upstream.call(hanging_send, idempotent=False, open_error=OPEN_ERROR))
+  await started.wait()
+  task.cancel()
+  with pytest.raises(asyncio.CancelledError):
+    await task
+
+  # Assert
+  assert upstream.breaker.allow_call()
+
+async def test_timeout_follows_latency(monkeypatch: pytest.MonkeyPatch):
+  upstream = resilience.ResilientUpstream(max_timeout=3)
+  assert upstream.timeout() == 3
+
+  for _ in range(50):
+    upstream.latencies.add(0.2)
+
+  assert upstream.timeout() == pytest.approx(0.2 * settings.upstream_timeout_multiplier)
+
+async def test_hedges_slow_calls():
+  upstream = resilience.ResilientUpstream(max_timeout=3)
+  for _ in range(50):
+    upstream.latencies.add(0.01)
+  calls = []
+
+  async def send(timeout: float) -> str:
+    calls.append(timeout)
+    # The first request is stuck, the hedged one answers right away
+    if len(calls) == 1:
+      await asyncio.sleep(10)
+    return f"answer {len(calls)}"
+
+  result = await asyncio.wait_for(upstream.call(send, idempotent=True, open_error=OPEN_ERROR), 1)
+
+  assert result == "answer 2"
+  assert len(calls) == 2
+
+def fast_upstream() -> resilience.ResilientUpstream:
+  """ An upstream that usually answers in 10ms, so calls are hedged soon. """
+  upstream = resilience.ResilientUpstream(max_timeout=3)
+  for _ in range(50):
+    upstream.latencies.add(0.01)
+  return upstream
+
+async def test_limiter_wait_is_not_latency(monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  monkeypatch.setattr(settings, "rate_limit_shared", False)
+  upstream = fast_upstream()
+  limiter = rate_limit.UpstreamLimiter("test", rate=0, burst=1, max_concurrency=1)
+  calls = []
+
+  async def send(timeout: float) -> str:
+    calls.append(timeout)
+    return "answer"
+
+  # Another call holds the only slot for much longer than the hedge delay
+  async def hold_slot():
+    async with limiter.acquire():
+      await asyncio.sleep(0.2)
+
+  holder = asyncio.ensure_future(hold_slot())
+  await asyncio.sleep(0)
+
+  # Act
+  result = await upstream.call(send, idempotent=True, open_error=OPEN_ERROR, limiter=limiter)
+  await holder
+
+  # Assert
+  assert result == "answer"
+  # The queued request wasn't hedged and its wait didn't count as latency
+  assert len(calls) == 1
+  assert upstream.latencies.percentile(1.0) < 0.1
+
+async def test_does_not_hedge_while_limiter_is_saturated(monkeypatch: pytest.MonkeyPatch):
+  monkeypatch.setattr(settings, "rate_limit_shared", False)
+  upstream = fast_upstream()
+  limiter = rate_limit.UpstreamLimiter("test", rate=0, burst=1, max_concurrency=1)
+  calls = []
+
+  async def send(timeout: float) -> str:
+    calls.append(timeout)
+    await asyncio.sleep(0.1)
+    return f"answer {len(calls)}"
+
+  result = await upstream.call(send, idempotent=True, open_error=OPEN_ERROR, limiter=limiter)
+
+  assert result == "answer 1"
+  assert len(calls) == 1
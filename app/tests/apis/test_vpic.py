@@ -1,29 +1,64 @@
-from unittest.mock import MagicMock, patch
+import json
+
+import httpx
 import pytest
-import requests
 
-from ...apis.vpic import find_vin, VpicApiError
-from ..data import REAL_VINS, FAKE_VALID_FORMAT_VIN
+from ...apis import http_client
+from ...apis.vpic import find_vin, find_vins, VpicApiError
+from ..data import REAL_VINS, FAKE_VALID_FORMAT_VIN, STUB_VEHICLES
+
+pytestmark = pytest.mark.anyio
 
 @pytest.mark.parametrize("vin", ["xxxxxxxxxxxxxxxxxx", "xxxxxxxxxxxxxxxx;", "123"])
-def test_find_vin_bad_format_vin(vin: str):
+async def test_find_vin_bad_format_vin(vin: str):
   with pytest.raises(ValueError):
-    find_vin(vin)
+    await find_vin(vin)
 
 @pytest.mark.parametrize("error_status_code", [500, 400])
-def test_find_vin_vpic_api_failed(error_status_code: int):
-  with patch("requests.get") as mock_requests_get:
-    dummy_response = requests.Response()
-    dummy_response.status_code = error_status_code
-    dummy_response.raise_for_status = MagicMock(side_effect=requests.HTTPError("Dummy HTTP error"))
-    mock_requests_get.return_value = dummy_response
-
+async def test_find_vin_vpic_api_failed(error_status_code: int):
+  transport = httpx.MockTransport(lambda _: httpx.Response(error_status_code))
+  async with http_client.open_clients(transport):
     with pytest.raises(VpicApiError) as ex:
-      find_vin(FAKE_VALID_FORMAT_VIN)
+      await find_vin(FAKE_VALID_FORMAT_VIN)
     assert ex.value.error_status_code == error_status_code
 
-def test_find_vin_returns_vin_object():
-  vin = find_vin(REAL_VINS[0])
+async def test_find_vin_vpic_api_timeout():
+  def handler(request: httpx.Request) -> httpx.Response:
+    raise httpx.ReadTimeout("Dummy timeout", request=request)
+
+  async with http_client.open_clients(httpx.MockTransport(handler)):
+    with pytest.raises(VpicApiError) as ex:
+      await find_vin(FAKE_VALID_FORMAT_VIN)
+    assert ex.value.error_status_code == 504
+
+async def test_find_vins_batch():
+  def handler(request: httpx.Request) -> httpx.Response:
+    assert request.url.path.endswith("/DecodeVINValuesBatch/")
+    vins = dict(httpx.QueryParams(request.content.decode()))["data"].split(";")
+    results = [
+      {
+        "VIN": vin,
+        "Make": STUB_VEHICLES.get(vin, {}).get("make", ""),
+        "Model": STUB_VEHICLES.get(vin, {}).get("model", ""),
+        "ModelYear": STUB_VEHICLES.get(vin, {}).get("model_year", ""),
+        "BodyClass": STUB_VEHICLES.get(vin, {}).get("body_class", ""),
+      }
+      for vin in vins
+    ]
+    return httpx.Response(200, content=json.dumps({"Results": results}))
+
+  vins = [*STUB_VEHICLES, FAKE_VALID_FORMAT_VIN]
+  async with http_client.open_clients(httpx.MockTransport(handler)):
+    decoded_vins = await find_vins(vins)
+
+  assert list(decoded_vins) == vins
+  assert decoded_vins[FAKE_VALID_FORMAT_VIN] is None
+  for vin in STUB_VEHICLES:
+    assert decoded_vins[vin].make == STUB_VEHICLES[vin]["make"]
+
+async def test_find_vin_returns_vin_object():
+  async with http_client.open_clients():
+    vin = await find_vin(REAL_VINS[0])
   assert vin.vin != ""
   assert vin.make != ""
   assert vin.model != ""
@@ -0,0 +1,23 @@
+import pytest
+from sqlalchemy import Engine
+
+from .. import main, metrics
+from ..db import connection, migrations
+from ..settings import settings
+
+@pytest.fixture(autouse=True)
+def cache_database(monkeypatch: pytest.MonkeyPatch, tmp_path_factory: pytest.TempPathFactory) -> Engine:
+  """ Give every test its own migrated cache database, the one in the
+      settings persists and belongs to whoever runs the tests.
+  """
+  # Out of `tmp_path`, which some tests expect to hold only their own files
+  database_url = f'sqlite:///{tmp_path_factory.mktemp("cache_database") / "vin_cache.db"}'
+  monkeypatch.setattr(settings, 'database_url', database_url)
+  engine = connection.create_db_engine(database_url)
+  metrics.instrument_engine(engine)
+  monkeypatch.setattr(connection, 'Engine', engine)
+  monkeypatch.setattr(main, 'Engine', engine)
+  monkeypatch.setattr(connection.SessionLocal, 'kw', {**connection.SessionLocal.kw, 'bind': engine})
+  migrations.migrate(engine)
+  yield engine
+  engine.dispose()
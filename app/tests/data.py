@@ -1,2 +1,10 @@
 FAKE_VALID_FORMAT_VIN = "01234567891234567"
 REAL_VINS = ["1XPWD40X1ED215307", "1XKWDB0X57J211825", "1XP5DB9X7YN526158", "4V4NC9EJXEN171694"]
+STUB_VEHICLES = {
+  "1XPWD40X1ED215307": {"make": "PETERBILT", "model": "579", "model_year": "2014", "body_class": "Truck-Tractor"},
+  "1XKWDB0X57J211825": {"make": "KENWORTH", "model": "W9 Series", "model_year": "2007", "body_class": "Truck-Tractor"},
+  "1XP5DB9X7YN526158": {"make": "PETERBILT", "model": "379", "model_year": "2000", "body_class": "Truck-Tractor"},
+}
+# Well-formed but with a wrong check digit and with a letter O
+BAD_CHECK_DIGIT_VIN = "1XPWD40X2ED215307"
+BAD_CHARACTER_VIN = "1XPWD40X1ED2153O7"
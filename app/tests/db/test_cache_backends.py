@@ -0,0 +1,212 @@
+import time
+from typing import Callable
+
+import pytest
+
+from ...db import cache_backends
+from ...db.entities.vin.memory_cache import vin_memory_cache
+from ...schemas import Vin
+from ...settings import settings
+from ..data import STUB_VEHICLES
+from ...benchmarks.stubs import StubRedisServer
+
+VINS = [Vin(vin=vin, **vehicle) for vin, vehicle in STUB_VEHICLES.items()]
+
+@pytest.fixture
+def redis_server():
+  server = StubRedisServer()
+  server.start()
+  try:
+    yield server
+  finally:
+    server.stop()
+
+def wait_until(condition: Callable[[], bool], timeout: float = 5):
+  deadline = time.monotonic() + timeout
+  while not condition():
+    assert time.monotonic() < deadline, 'Timed out'
+    time.sleep(0.01)
+
+def make_redis_backend(redis_server: StubRedisServer) -> cache_backends.RedisBackend:
+  """ An instance with its own backend, sharing VINs through Redis. """
+  return cache_backends.RedisBackend(cache_backends.MemoryBackend(), redis_server.url, 'test:')
+
+def test_memory_backend_lists_vins_in_insertion_order():
+  backend = cache_backends.MemoryBackend()
+  backend.insert_vins(VINS)
+  # Overwriting a VIN keeps its place
+  backend.insert_vin(VINS[0])
+
+  rows = backend.list_vin_rows(['vin'], {}, after_id=1, limit=2)
+
+  assert rows == [(2, VINS[1].vin), (3, VINS[2].vin)]
+  assert [row[0] for batch in backend.iter_vin_rows(2) for row in batch] == [vin.vin for vin in VINS]
+
+def test_memory_backend_filters_vins():
+  backend = cache_backends.MemoryBackend()
+  backend.insert_vins(VINS)
+
+  rows = backend.list_vin_rows(['vin'], {'make': VINS[0].make}, after_id=None, limit=100)
+
+  assert [row[1] for row in rows] == [vin.vin for vin in VINS if vin.make == VINS[0].make]
+
+def test_memory_backend_searches_vins():
+  backend = cache_backends.MemoryBackend()
+  backend.insert_vins(VINS)
+
+  assert backend.search_vins(['pete'], '', offset=0, limit=100) == [vin for vin in VINS if vin.make == 'PETERBILT']
+  assert backend.search_vins(['truck'], '1XK', offset=0, limit=100) == [VINS[1]]
+  assert backend.search_vins([], '1X', offset=1, limit=1) == [sorted(VINS, key=lambda vin: vin.vin)[1]]
+
+def test_memory_backend_changes_bump_the_generation():
+  backend = cache_backends.MemoryBackend()
+  generation = backend.find_generation()
+
+  backend.insert_vin(VINS[0])
+  assert backend.remove_vin(VINS[0].vin)
+  assert not backend.remove_vin(VINS[0].vin)
+
+  assert backend.find_generation().generation == generation.generation + 2
+
+def test_memory_backend_evicts_vins():
+  backend = cache_backends.MemoryBackend()
+  backend.insert_vins(VINS)
+  # The first VIN was served most recently
+  backend.touch_vins({VINS[0].vin: time.time() + 60})
+
+  assert backend.remove_oldest_vins(1, by_last_access=True) == [VINS[1].vin]
+  assert backend.remove_vins_created_before(time.time() + 60, limit=1) == [VINS[0].vin]
+  assert backend.measure_vins()[0] == 1
+
+def test_memory_backend_fills_empty_photo_urls():
+  backend = cache_backends.MemoryBackend()
+  backend.insert_vins(VINS)
+
+  updated_vins = backend.fill_empty_photo_urls(
+    VINS[0].make, VINS[0].model, VINS[0].model_year, 'http://images.example.com/1.jpg'
+  )
+
+  assert updated_vins == [VINS[0].vin]
+  assert backend.find_vin(VINS[0].vin).photo_url == 'http://images.example.com/1.jpg'
+  assert [row[0] for row in backend.find_vehicles_without_photo(after_id=0, limit=10)] == [2, 3]
+
+def test_redis_backend_shares_vins_between_instances(redis_server: StubRedisServer):
+  first_backend, second_backend = make_redis_backend(redis_server), make_redis_backend(redis_server)
+
+  first_backend.insert_vin(VINS[0])
+  first_backend.insert_vins(VINS[1:])
+
+  assert second_backend.find_vin(VINS[0].vin) == VINS[0]
+  assert sorted(vin.vin for vin in second_backend.find_vins([vin.vin for vin in VINS])) == \
+    sorted(vin.vin for vin in VINS)
+  # Only the instance that cached the VINs has them in its own backend
+  assert not second_backend.store.has_vins()
+
+def test_redis_backend_shares_vins_found_in_its_own_backend(redis_server: StubRedisServer):
+  first_backend, second_backend = make_redis_backend(redis_server), make_redis_backend(redis_server)
+  first_backend.store.insert_vin(VINS[0])
+
+  assert first_backend.find_vin(VINS[0].vin) == VINS[0]
+  assert second_backend.find_vin(VINS[0].vin) == VINS[0]
+
+def test_redis_backend_broadcasts_removals(redis_server: StubRedisServer):
+  first_backend, second_backend = make_redis_backend(redis_server), make_redis_backend(redis_server)
+  first_backend.insert_vin(VINS[0])
+  second_backend.store.insert_vin(VINS[0])
+  invalidated_vins = []
+  stop = second_backend.listen_for_invalidations(invalidated_vins.append)
+  try:
+    wait_until(lambda: redis_server.subscriber_count('test:invalidations') > 0)
+
+    assert first_backend.remove_vin(VINS[0].vin)
+
+    wait_until(lambda: invalidated_vins == [VINS[0].vin])
+  finally:
+    stop()
+
+  assert second_backend.find_vin(VINS[0].vin) is None
+
+def test_redis_backend_broadcasts_updates(redis_server: StubRedisServer):
+  first_backend, second_backend = make_redis_backend(redis_server), make_redis_backend(redis_server)
+  first_backend.insert_vin(VINS[0])
+  second_backend.store.insert_vin(VINS[0])
+  invalidated_vins = []
+  stops = [first_backend.listen_for_invalidations(lambda _: None),
+           second_backend.listen_for_invalidations(invalidated_vins.append)]
+  try:
+    wait_until(lambda: redis_server.subscriber_count('test:invalidations') > 1)
+
+    assert first_backend.update_photo_url(VINS[0].vin, 'http://images.example.com/1.jpg')
+
+    wait_until(lambda: invalidated_vins == [VINS[0].vin])
+  finally:
+    for stop in stops:
+      stop()
+
+  # The second instance refreshed its own copy rather than dropping it
+  assert second_backend.store.find_vin(VINS[0].vin).photo_url == 'http://images.example.com/1.jpg'
+  assert second_backend.find_vin(VINS[0].vin).photo_url == 'http://images.example.com/1.jpg'
+  # The instance that made the update keeps its copy
+  assert first_backend.store.find_vin(VINS[0].vin).photo_url == 'http://images.example.com/1.jpg'
+
+def test_redis_backend_keeps_imported_vins_on_other_instances(redis_server: StubRedisServer):
+  first_backend, second_backend = make_redis_backend(redis_server), make_redis_backend(redis_server)
+  # Both instances share one database
+  second_backend.store = first_backend.store
+  invalidated_vins = []
+  stop = second_backend.listen_for_invalidations(invalidated_vins.append)
+  try:
+    wait_until(lambda: redis_server.subscriber_count('test:invalidations') > 0)
+
+    first_backend.upsert_vin_rows([VINS[0].model_dump()])
+
+    wait_until(lambda: invalidated_vins == [VINS[0].vin])
+  finally:
+    stop()
+
+  assert first_backend.store.find_vin(VINS[0].vin) == VINS[0]
+
+def test_redis_backend_broadcasts_evictions(redis_server: StubRedisServer):
+  first_backend, second_backend = make_redis_backend(redis_server), make_redis_backend(redis_server)
+  first_backend.insert_vins(VINS)
+  second_backend.store.insert_vins(VINS)
+  invalidated_vins = []
+  stop = second_backend.listen_for_invalidations(invalidated_vins.append)
+  try:
+    wait_until(lambda: redis_server.subscriber_count('test:invalidations') > 0)
+
+    evicted_vins = first_backend.remove_oldest_vins(2, by_last_access=False)
+
+    wait_until(lambda: invalidated_vins == evicted_vins)
+  finally:
+    stop()
+
+  assert evicted_vins == [VINS[0].vin, VINS[1].vin]
+  assert not any(redis_server.data.get(f'test:vin:{vin}'.encode()) for vin in evicted_vins)
+  assert second_backend.find_vins([vin.vin for vin in VINS]) == [VINS[2]]
+
+def test_redis_backend_falls_back_to_its_own_backend(monkeypatch: pytest.MonkeyPatch):
+  monkeypatch.setattr(settings, 'redis_timeout', 0.1)
+  # Nothing listens on the port
+  backend = cache_backends.RedisBackend(cache_backends.MemoryBackend(), 'redis://127.0.0.1:1/0', 'test:')
+
+  backend.insert_vin(VINS[0])
+
+  assert backend.find_vin(VINS[0].vin) == VINS[0]
+  assert backend.find_vins([VINS[0].vin]) == [VINS[0]]
+  assert backend.remove_vin(VINS[0].vin)
+
+def test_listen_for_invalidations_drops_vins_from_memory_cache(redis_server: StubRedisServer,
+                                                              monkeypatch: pytest.MonkeyPatch):
+  monkeypatch.setattr(settings, 'cache_backend', 'redis')
+  monkeypatch.setattr(settings, 'redis_url', redis_server.url)
+  monkeypatch.setattr(cache_backends, '_backends', {})
+  other_backend = cache_backends.RedisBackend(
+    cache_backends.MemoryBackend(), redis_server.url, settings.redis_key_prefix
+  )
+  vin_memory_cache.put(VINS[0].vin, VINS[0])
+
+  with cache_backends.listen_for_invalidations():
+    wait_until(lambda: redis_server.subscriber_count(f'{settings.redis_key_prefix}invalidations') > 0)
+    other_backend.remove_vin(VINS[0].vin)
+    wait_until(lambda: vin_memory_cache.get(VINS[0].vin) is None)
@@ -0,0 +1,75 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ...db.entities.job import queries as job_queries
+from ...db.entities.job.entity import JobStatus, JobVinStatus
+from ...db.migrations import migrate
+
+@pytest.fixture
+def db_session(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  with sessionmaker(bind=engine)() as session:
+    yield session
+
+def test_create_job_counts_vins_by_status(db_session):
+  job_queries.create_job(db_session, 'job', ['A', 'B', 'C'], {'C': 'Bad VIN.'})
+
+  progress = job_queries.find_job_progress(db_session, 'job')
+  assert progress.status == JobStatus.PENDING
+  assert progress.vin_count == 3
+  assert progress.counts[JobVinStatus.PENDING] == 2
+  assert progress.counts[JobVinStatus.INVALID] == 1
+  assert progress.counts[JobVinStatus.FETCHED] == 0
+
+def test_job_without_pending_vins_is_completed(db_session):
+  job_queries.create_job(db_session, 'job', ['C'], {'C': 'Bad VIN.'})
+
+  assert job_queries.find_job_progress(db_session, 'job').status == JobStatus.COMPLETED
+  assert job_queries.claim_job(db_session, 'worker', stale_before=0) is None
+
+def test_unknown_job_has_no_progress(db_session):
+  assert job_queries.find_job_progress(db_session, 'job') is None
+
+def test_jobs_are_claimed_oldest_first_and_once(db_session):
+  with patch('time.time', return_value=100):
+    job_queries.create_job(db_session, 'first', ['A'], {})
+  with patch('time.time', return_value=101):
+    job_queries.create_job(db_session, 'second', ['A'], {})
+
+  with patch('time.time', return_value=102):
+    claimed = [job_queries.claim_job(db_session, 'worker', stale_before=50) for _ in range(3)]
+
+  assert claimed == ['first', 'second', None]
+
+def test_stale_job_is_taken_over(db_session):
+  # Arrange
+  job_queries.create_job(db_session, 'job', ['A', 'B'], {})
+  with patch('time.time', return_value=100):
+    job_queries.claim_job(db_session, 'old_worker', stale_before=0)
+
+  # Act
+  with patch('time.time', return_value=200):
+    job_id = job_queries.claim_job(db_session, 'new_worker', stale_before=150)
+
+  # Assert
+  assert job_id == 'job'
+  outcomes = {vin.id: (JobVinStatus.FETCHED, '') for vin in job_queries.find_pending_vins(db_session, 'job', 1)}
+  assert not job_queries.record_outcomes(db_session, 'job', 'old_worker', outcomes)
+  assert job_queries.record_outcomes(db_session, 'job', 'new_worker', outcomes)
+
+  progress = job_queries.find_job_progress(db_session, 'job')
+  assert progress.counts[JobVinStatus.FETCHED] == 1
+  assert [vin.vin for vin in job_queries.find_pending_vins(db_session, 'job', 10)] == ['B']
+
+def test_complete_job(db_session):
+  job_queries.create_job(db_session, 'job', ['A'], {})
+  job_queries.claim_job(db_session, 'worker', stale_before=0)
+
+  job_queries.complete_job(db_session, 'job', 'worker')
+
+  assert job_queries.find_job_progress(db_session, 'job').status == JobStatus.COMPLETED
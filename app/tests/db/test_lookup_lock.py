@@ -0,0 +1,39 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ...db.entities.lookup_lock import queries as lock_queries
+from ...db.migrations import migrate
+from ..data import FAKE_VALID_FORMAT_VIN
+
+@pytest.fixture
+def db_session(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  with sessionmaker(bind=engine)() as session:
+    yield session
+
+def test_lock_is_exclusive(db_session):
+  assert lock_queries.try_acquire_lock(db_session, FAKE_VALID_FORMAT_VIN, 'first', ttl=10)
+  assert not lock_queries.try_acquire_lock(db_session, FAKE_VALID_FORMAT_VIN, 'second', ttl=10)
+
+  lock_queries.release_lock(db_session, FAKE_VALID_FORMAT_VIN, 'first')
+
+  assert lock_queries.try_acquire_lock(db_session, FAKE_VALID_FORMAT_VIN, 'second', ttl=10)
+
+def test_lock_release_by_other_owner_is_ignored(db_session):
+  assert lock_queries.try_acquire_lock(db_session, FAKE_VALID_FORMAT_VIN, 'first', ttl=10)
+
+  lock_queries.release_lock(db_session, FAKE_VALID_FORMAT_VIN, 'second')
+
+  assert not lock_queries.try_acquire_lock(db_session, FAKE_VALID_FORMAT_VIN, 'second', ttl=10)
+
+def test_expired_lock_can_be_taken_over(db_session):
+  with patch('time.time', return_value=100):
+    assert lock_queries.try_acquire_lock(db_session, FAKE_VALID_FORMAT_VIN, 'first', ttl=10)
+
+  with patch('time.time', return_value=111):
+    assert lock_queries.try_acquire_lock(db_session, FAKE_VALID_FORMAT_VIN, 'second', ttl=10)
@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+from ...db.memory_cache import MemoryCache
+
+def test_memory_cache_hit_and_miss():
+  cache = MemoryCache[str](max_size=2, ttl=0)
+  cache.put('a', 'A')
+
+  assert cache.get('a') == 'A'
+  assert cache.get('b') is None
+
+  stats = cache.stats()
+  assert (stats.hits, stats.misses, stats.evictions, stats.size) == (1, 1, 0, 1)
+
+def test_memory_cache_evicts_least_recently_used():
+  cache = MemoryCache[str](max_size=2, ttl=0)
+  cache.put('a', 'A')
+  cache.put('b', 'B')
+  # Touch "a" so that "b" becomes the least recently used entry
+  cache.get('a')
+
+  cache.put('c', 'C')
+
+  assert cache.get('a') == 'A'
+  assert cache.get('b') is None
+  assert cache.get('c') == 'C'
+  assert cache.stats().evictions == 1
+
+def test_memory_cache_expires_entries():
+  cache = MemoryCache[str](max_size=2, ttl=10)
+  with patch('time.monotonic', return_value=100):
+    cache.put('a', 'A')
+
+  with patch('time.monotonic', return_value=105):
+    assert cache.get('a') == 'A'
+  with patch('time.monotonic', return_value=111):
+    assert cache.get('a') is None
+  assert cache.stats().evictions == 1
+
+def test_memory_cache_invalidate():
+  cache = MemoryCache[str](max_size=2, ttl=0)
+  cache.put('a', 'A')
+
+  cache.invalidate('a')
+  cache.invalidate('b')
+
+  assert cache.get('a') is None
+
+def test_memory_cache_disabled():
+  cache = MemoryCache[str](max_size=0, ttl=0)
+  cache.put('a', 'A')
+  assert cache.get('a') is None
@@ -0,0 +1,111 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from sqlalchemy import Engine, create_engine, inspect, select, text
+
+from ...db.migrations import SCHEMA_VERSION, migrate, schema_version_table
+
+def test_migrate_new_database(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+
+  previous_version = migrate(engine)
+
+  assert previous_version == 0
+  assert 'vin' in inspect(engine).get_table_names()
+  with engine.connect() as connection:
+    assert connection.execute(select(schema_version_table.c.version)).scalar() == SCHEMA_VERSION
+
+def test_migrate_is_idempotent(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+
+  previous_version = migrate(engine)
+
+  assert previous_version == SCHEMA_VERSION
+  with engine.connect() as connection:
+    assert connection.execute(select(schema_version_table.c.version)).scalars().all() == [SCHEMA_VERSION]
+
+def test_concurrent_migrations_migrate_once(tmp_path: Path):
+  # Arrange
+  # Like the workers of one deployment starting together, each with its own engine
+  engines = [create_engine(f'sqlite:///{tmp_path / "cache.db"}') for _ in range(4)]
+  barrier = threading.Barrier(len(engines))
+
+  def run_migration(engine: Engine) -> int:
+    barrier.wait()
+    return migrate(engine)
+
+  # Act
+  with ThreadPoolExecutor(len(engines)) as executor:
+    previous_versions = list(executor.map(run_migration, engines))
+
+  # Assert
+  assert sorted(previous_versions) == [0] + [SCHEMA_VERSION] * (len(engines) - 1)
+  with engines[0].connect() as connection:
+    assert connection.execute(select(schema_version_table.c.version)).scalars().all() == [SCHEMA_VERSION]
+
+def test_migrate_newer_database_fails(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  with engine.begin() as connection:
+    connection.execute(schema_version_table.update().values(version=SCHEMA_VERSION + 1))
+
+  with pytest.raises(RuntimeError):
+    migrate(engine)
+
+# From before the list indexes, and from just before the timestamps
+@pytest.mark.parametrize('version', [1, 5])
+def test_migrate_adds_vin_timestamps(tmp_path: Path, version: int):
+  # Arrange
+  # The `vin` table as it was before it had timestamps
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  with engine.begin() as connection:
+    connection.execute(text(
+      'CREATE TABLE vin (id INTEGER PRIMARY KEY, vin VARCHAR(17) NOT NULL UNIQUE, '
+      'make VARCHAR NOT NULL, model VARCHAR NOT NULL, model_year VARCHAR NOT NULL, '
+      'body_class VARCHAR NOT NULL, photo_url VARCHAR NOT NULL)'
+    ))
+    connection.execute(text(
+      "INSERT INTO vin (vin, make, model, model_year, body_class, photo_url) "
+      "VALUES ('1XPWD40X1ED215307', 'PETERBILT', '579', '2014', 'Truck-Tractor', '')"
+    ))
+    schema_version_table.create(connection)
+    connection.execute(schema_version_table.insert().values(version=version))
+
+  # Act
+  migrate(engine)
+
+  # Assert
+  assert {'ix_vin_created_at', 'ix_vin_last_accessed_at'} <= \
+    {index['name'] for index in inspect(engine).get_indexes('vin')}
+  with engine.connect() as connection:
+    created_at, last_accessed_at = connection.execute(
+      text('SELECT created_at, last_accessed_at FROM vin')
+    ).one()
+  assert created_at > 0 and last_accessed_at > 0
+
+def test_migrate_indexes_cached_vins_for_search(tmp_path: Path):
+  # Arrange
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  # The database as it was before the search index
+  with engine.begin() as connection:
+    for trigger in ['vin_search_insert', 'vin_search_delete', 'vin_search_update']:
+      connection.execute(text(f'DROP TRIGGER {trigger}'))
+    connection.execute(text('DROP TABLE vin_search'))
+    connection.execute(text(
+      "INSERT INTO vin (vin, make, model, model_year, body_class, photo_url, created_at, last_accessed_at) "
+      "VALUES ('1XPWD40X1ED215307', 'PETERBILT', '579', '2014', 'Truck-Tractor', '', 0, 0)"
+    ))
+    connection.execute(schema_version_table.update().values(version=SCHEMA_VERSION - 1))
+
+  # Act
+  migrate(engine)
+
+  # Assert
+  with engine.connect() as connection:
+    assert connection.execute(
+      text("SELECT rowid FROM vin_search WHERE vin_search MATCH 'peterbilt'")
+    ).scalars().all() == [1]
@@ -0,0 +1,51 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ...db.entities.negative_vin import queries as negative_vin_queries
+from ...db.entities.negative_vin.entity import NegativeVinReason
+from ...db.migrations import migrate
+
+VINS = ['00000000000000001', '00000000000000002', '00000000000000003']
+REASON = NegativeVinReason.VPIC_NOT_DECODED
+
+@pytest.fixture
+def db_session(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  with sessionmaker(bind=engine)() as session:
+    yield session
+
+def test_negative_vin_expires(db_session):
+  with patch('time.time', return_value=100):
+    negative_vin_queries.insert_negative_vins(db_session, VINS[:1], REASON)
+
+  with patch('time.time', return_value=105):
+    assert negative_vin_queries.find_negative_vin(db_session, VINS[0], ttl=10) == REASON.value
+  with patch('time.time', return_value=111):
+    assert negative_vin_queries.find_negative_vin(db_session, VINS[0], ttl=10) is None
+
+def test_negative_vins_are_pruned(db_session):
+  with patch('time.time', return_value=100):
+    negative_vin_queries.insert_negative_vins(db_session, ['00000000000000000'], REASON)
+  # Recorded at once, so they share their `created_at`
+  with patch('time.time', return_value=200):
+    negative_vin_queries.insert_negative_vins(db_session, VINS, REASON)
+
+  with patch('time.time', return_value=210):
+    removed_count = negative_vin_queries.prune_negative_vins(db_session, ttl=60, max_size=2)
+    negative_vins = negative_vin_queries.find_negative_vins(db_session, VINS, ttl=60)
+
+  # The expired entry is dropped, then the oldest entry beyond the max size
+  assert removed_count == 2
+  assert sorted(negative_vins) == VINS[1:]
+
+def test_remove_negative_vin(db_session):
+  negative_vin_queries.insert_negative_vins(db_session, VINS[:1], REASON)
+
+  assert negative_vin_queries.remove_negative_vin(db_session, VINS[0])
+  assert not negative_vin_queries.remove_negative_vin(db_session, VINS[0])
+  assert negative_vin_queries.find_negative_vin(db_session, VINS[0], ttl=60) is None
@@ -0,0 +1,36 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ...db.entities.photo import queries as photo_queries
+from ...db.migrations import migrate
+
+@pytest.fixture
+def db_session(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  with sessionmaker(bind=engine)() as session:
+    yield session
+
+def test_to_photo_key_normalizes():
+  assert photo_queries.to_photo_key(' Kenworth', 'W9  Series ', '2007') == ('KENWORTH', 'W9 SERIES', '2007')
+
+def test_find_photo(db_session):
+  key = photo_queries.to_photo_key('Kenworth', 'W9 Series', '2007')
+  assert photo_queries.find_photo(db_session, key, ttl=10) is None
+
+  with patch('time.time', return_value=100):
+    photo_queries.upsert_photo(db_session, key, 'http://images.example.com/1.jpg')
+
+  with patch('time.time', return_value=105):
+    assert photo_queries.find_photo(db_session, key, ttl=10) == ('http://images.example.com/1.jpg', False)
+  with patch('time.time', return_value=111):
+    assert photo_queries.find_photo(db_session, key, ttl=10) == ('http://images.example.com/1.jpg', True)
+
+  # Refreshing the photo overwrites it
+  with patch('time.time', return_value=111):
+    photo_queries.upsert_photo(db_session, key, '')
+    assert photo_queries.find_photo(db_session, key, ttl=10) == ('', False)
@@ -0,0 +1,56 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ...db.entities.rate_limit import queries as rate_limit_queries
+from ...db.migrations import migrate
+
+@pytest.fixture
+def db_session(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  with sessionmaker(bind=engine)() as session:
+    yield session
+
+def test_tokens_are_free_up_to_the_burst(db_session):
+  with patch('time.time', return_value=100):
+    waits = [rate_limit_queries.reserve_token(db_session, 'vpic', rate=2, burst=3) for _ in range(5)]
+
+  assert waits == [0, 0, 0, 0.5, 1]
+
+def test_tokens_refill_at_the_rate(db_session):
+  with patch('time.time', return_value=100):
+    for _ in range(3):
+      rate_limit_queries.reserve_token(db_session, 'vpic', rate=2, burst=3)
+
+  with patch('time.time', return_value=101):
+    waits = [rate_limit_queries.reserve_token(db_session, 'vpic', rate=2, burst=3) for _ in range(3)]
+
+  assert waits == [0, 0, 0.5]
+
+def test_buckets_are_per_upstream(db_session):
+  with patch('time.time', return_value=100):
+    rate_limit_queries.reserve_token(db_session, 'vpic', rate=1, burst=1)
+
+    assert rate_limit_queries.reserve_token(db_session, 'car_imagery', rate=1, burst=1) == 0
+
+def test_leases_are_capped(db_session):
+  first_lease = rate_limit_queries.try_acquire_lease(db_session, 'vpic', max_concurrency=2, ttl=10)
+  second_lease = rate_limit_queries.try_acquire_lease(db_session, 'vpic', max_concurrency=2, ttl=10)
+
+  assert first_lease is not None and second_lease is not None
+  assert rate_limit_queries.try_acquire_lease(db_session, 'vpic', max_concurrency=2, ttl=10) is None
+
+  rate_limit_queries.release_lease(db_session, first_lease)
+
+  assert rate_limit_queries.try_acquire_lease(db_session, 'vpic', max_concurrency=2, ttl=10) is not None
+
+def test_expired_leases_are_freed(db_session):
+  with patch('time.time', return_value=100):
+    assert rate_limit_queries.try_acquire_lease(db_session, 'vpic', max_concurrency=1, ttl=10)
+
+  with patch('time.time', return_value=111):
+    assert rate_limit_queries.try_acquire_lease(db_session, 'vpic', max_concurrency=1, ttl=10)
@@ -0,0 +1,153 @@
+import time
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ...db.entities.cache_generation import queries as generation_queries
+from ...db.entities.vin import queries as vin_queries
+from ...db.migrations import migrate
+from ...schemas import Vin
+from ..data import STUB_VEHICLES
+
+@pytest.fixture
+def db_session(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  with sessionmaker(bind=engine)() as session:
+    yield session
+
+def test_insert_vin_is_idempotent(db_session):
+  vin, vehicle = next(iter(STUB_VEHICLES.items()))
+
+  vin_queries.insert_vin(db_session, Vin(vin=vin, **vehicle))
+  vin_queries.insert_vin(db_session, Vin(vin=vin, **vehicle, photo_url='http://images.example.com/1.jpg'))
+
+  cache_vins = vin_queries.get_all_vins(db_session)
+  assert len(cache_vins) == 1
+  assert cache_vins[0].photo_url == 'http://images.example.com/1.jpg'
+
+def _insert_stub_vins(db_session) -> list[str]:
+  vins = [Vin(vin=vin, **vehicle) for vin, vehicle in STUB_VEHICLES.items()]
+  vin_queries.insert_vins(db_session, vins)
+  return [vin.vin for vin in vins]
+
+def test_remove_oldest_vins_by_last_access(db_session):
+  # Arrange
+  vins = _insert_stub_vins(db_session)
+  # The first VIN was served most recently
+  vin_queries.touch_vins(db_session, {vins[0]: time.time() + 60})
+
+  # Act
+  removed_vins = vin_queries.remove_oldest_vins(db_session, 2, by_last_access=True)
+
+  # Assert
+  assert removed_vins == vins[1:]
+  assert [vin.vin for vin in vin_queries.get_all_vins(db_session)] == [vins[0]]
+
+def test_remove_vins_created_before(db_session):
+  _insert_stub_vins(db_session)
+
+  assert vin_queries.remove_vins_created_before(db_session, time.time() - 60, limit=10) == []
+  assert len(vin_queries.remove_vins_created_before(db_session, time.time() + 60, limit=2)) == 2
+  assert len(vin_queries.get_all_vins(db_session)) == 1
+
+def test_measure_vins(db_session):
+  assert vin_queries.measure_vins(db_session) == (0, 0)
+
+  _insert_stub_vins(db_session)
+  row_count, byte_count = vin_queries.measure_vins(db_session)
+
+  assert row_count == len(STUB_VEHICLES)
+  assert byte_count > row_count * 17
+
+def test_fill_empty_photo_urls(db_session):
+  # Arrange
+  vins = _insert_stub_vins(db_session)
+  vehicle = STUB_VEHICLES[vins[0]]
+  rows = vin_queries.find_vehicles_without_photo(db_session, after_id=0, limit=10)
+
+  # Act
+  updated_vins = vin_queries.fill_empty_photo_urls(
+    db_session, vehicle['make'], vehicle['model'], vehicle['model_year'], 'http://images.example.com/1.jpg'
+  )
+
+  # Assert
+  assert len(rows) == len(vins)
+  assert updated_vins == [vins[0]]
+  assert vin_queries.find_vin(db_session, vins[0]).photo_url == 'http://images.example.com/1.jpg'
+  assert len(vin_queries.find_vehicles_without_photo(db_session, after_id=0, limit=10)) == len(vins) - 1
+
+def test_changes_bump_the_cache_generation(db_session):
+  vin, vehicle = next(iter(STUB_VEHICLES.items()))
+  generations = [generation_queries.find_generation(db_session).generation]
+
+  vin_queries.insert_vin(db_session, Vin(vin=vin, **vehicle))
+  generations.append(generation_queries.find_generation(db_session).generation)
+  vin_queries.remove_vin(db_session, vin)
+  generations.append(generation_queries.find_generation(db_session).generation)
+  # Nothing to remove
+  vin_queries.remove_vin(db_session, vin)
+  generations.append(generation_queries.find_generation(db_session).generation)
+
+  assert generations == [0, 1, 2, 2]
+
+def _search(db_session, query: str = '', vin_prefix: str = '', offset: int = 0, limit: int = 10,
+            max_ranked_count: int = 100) -> list[str]:
+  terms = vin_queries.to_search_terms(query)
+  return [vin.vin for vin in vin_queries.search_vins(db_session, terms, vin_prefix, offset, limit, max_ranked_count)]
+
+def test_search_vins_by_words(db_session):
+  _insert_stub_vins(db_session)
+
+  assert sorted(_search(db_session, 'pete')) == ['1XP5DB9X7YN526158', '1XPWD40X1ED215307']
+  assert _search(db_session, 'Peterbilt 57') == ['1XPWD40X1ED215307']
+  assert _search(db_session, 'w9 truck-tractor 2007') == ['1XKWDB0X57J211825']
+  # Only the last word may be the start of a word
+  assert _search(db_session, 'pete 579') == []
+  assert _search(db_session, 'ford') == []
+
+def test_search_vins_ranks_better_matches_first(db_session):
+  vin_queries.insert_vins(db_session, [
+    Vin(vin='1XKWDB0X57J211825', make='KENWORTH', model='W9', model_year='2007', body_class='Truck'),
+    Vin(vin='1XPWD40X1ED215307', make='PETERBILT', model='579 Truck', model_year='2014', body_class='Truck'),
+  ])
+
+  assert _search(db_session, 'truck') == ['1XPWD40X1ED215307', '1XKWDB0X57J211825']
+  # Too many matches to rank, they come in the order they were cached
+  assert _search(db_session, 'truck', max_ranked_count=1) == ['1XKWDB0X57J211825', '1XPWD40X1ED215307']
+
+def test_search_vins_by_vin_prefix(db_session):
+  _insert_stub_vins(db_session)
+
+  assert _search(db_session, vin_prefix='1XP') == ['1XP5DB9X7YN526158', '1XPWD40X1ED215307']
+  assert _search(db_session, 'peterbilt', vin_prefix='1XPW') == ['1XPWD40X1ED215307']
+  assert _search(db_session, vin_prefix='1XPWD40X1ED215307') == ['1XPWD40X1ED215307']
+
+def test_search_vins_pages(db_session):
+  _insert_stub_vins(db_session)
+
+  pages = [_search(db_session, 'truck', offset=offset, limit=2) for offset in (0, 2)]
+
+  assert [len(page) for page in pages] == [2, 1]
+  assert sorted(pages[0] + pages[1]) == sorted(STUB_VEHICLES)
+
+def test_search_index_follows_changes(db_session):
+  # Arrange
+  vins = _insert_stub_vins(db_session)
+
+  # Act
+  vin_queries.remove_vin(db_session, vins[0])
+  vin_queries.insert_vin(db_session, Vin(vin=vins[2], make='FORD', model='F-150', model_year='2020',
+                                         body_class='Pickup'))
+
+  # Assert
+  assert _search(db_session, 'peterbilt') == []
+  assert _search(db_session, 'f 150 pickup') == [vins[2]]
+  assert _search(db_session, 'kenworth') == [vins[1]]
+
+def test_search_terms_are_not_operators(db_session):
+  _insert_stub_vins(db_session)
+
+  assert _search(db_session, 'peterbilt OR "kenworth" NOT * ^') == []
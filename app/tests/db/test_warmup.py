@@ -0,0 +1,109 @@
+from pathlib import Path
+
+import fastparquet
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ...db import cache_backends
+from ...db.entities.vin import queries as vin_queries
+from ...db.migrations import migrate
+from ... import vin_analysis
+from ...db.warmup import ImportCounts, _find_valid_vins, import_vins, warm_up_cache
+from ..data import BAD_CHARACTER_VIN, BAD_CHECK_DIGIT_VIN, STUB_VEHICLES
+
+@pytest.fixture
+def db_session(tmp_path: Path):
+  engine = create_engine(f'sqlite:///{tmp_path / "cache.db"}')
+  migrate(engine)
+  with sessionmaker(bind=engine)() as session:
+    yield session
+
+def _export_df() -> pd.DataFrame:
+  rows = [
+    {'vin': vin, **vehicle, 'photo_url': f'http://images.example.com/{vin}.jpg'}
+    for vin, vehicle in STUB_VEHICLES.items()
+  ]
+  # A row with a bad VIN and a row with a missing make are skipped
+  rows.append({**rows[0], 'vin': '123'})
+  rows.append({**rows[0], 'vin': '01234567891234567', 'make': ''})
+  # A row with a photo that isn't a URL is skipped as well
+  rows.append({**rows[0], 'vin': 'WVWZZZ1JZXW000001', 'photo_url': 'not a url'})
+  return pd.DataFrame(rows)
+
+@pytest.mark.parametrize('export_format', ['csv', 'parquet'])
+def test_warm_up_cache(tmp_path: Path, db_session, export_format: str):
+  # Arrange
+  file_path = str(tmp_path / f'vins_cache.{export_format}')
+  if export_format == 'csv':
+    _export_df().to_csv(file_path, header=True, sep=',', index=False)
+  else:
+    fastparquet.write(file_path, _export_df())
+
+  # Act
+  loaded_count = warm_up_cache(db_session, file_path)
+  # Loading the same file again doesn't duplicate any VIN
+  warm_up_cache(db_session, file_path)
+
+  # Assert
+  assert loaded_count == len(STUB_VEHICLES)
+  vins = vin_queries.get_all_vins(db_session)
+  assert sorted(vin.vin for vin in vins) == sorted(STUB_VEHICLES)
+  for vin in vins:
+    assert vin.make == STUB_VEHICLES[vin.vin]['make']
+    assert vin.photo_url == f'http://images.example.com/{vin.vin}.jpg'
+
+def test_warm_up_cache_unsupported_format(tmp_path: Path, db_session):
+  with pytest.raises(ValueError):
+    warm_up_cache(db_session, str(tmp_path / 'vins_cache.json'))
+
+@pytest.mark.parametrize('export_format', ['csv', 'parquet'])
+def test_import_vins(tmp_path: Path, export_format: str):
+  # Arrange
+  file_path = str(tmp_path / f'vins_cache.{export_format}')
+  df = _export_df()
+  if export_format == 'csv':
+    df.to_csv(file_path, header=True, sep=',', index=False)
+  else:
+    fastparquet.write(file_path, df)
+  first_vin = next(iter(STUB_VEHICLES))
+  cache_backend = cache_backends.MemoryBackend()
+  import_vins(cache_backend, file_path, export_format)
+  cache_backend.update_photo_url(first_vin, 'http://images.example.com/old.jpg')
+
+  # Act
+  counts = import_vins(cache_backend, file_path, export_format)
+
+  # Assert
+  assert counts == ImportCounts(inserted=0, updated=len(STUB_VEHICLES), rejected=3)
+  assert cache_backend.find_vin(first_vin).photo_url == f'http://images.example.com/{first_vin}.jpg'
+
+def test_import_vins_counts_new_and_repeated_vins(tmp_path: Path):
+  # Arrange
+  file_path = str(tmp_path / 'vins_cache.csv')
+  df = _export_df()
+  pd.concat([df, df.iloc[:1]]).to_csv(file_path, header=True, sep=',', index=False)
+  cache_backend = cache_backends.MemoryBackend()
+
+  # Act
+  counts = import_vins(cache_backend, file_path, 'csv')
+
+  # Assert
+  assert counts == ImportCounts(inserted=len(STUB_VEHICLES), updated=1, rejected=3)
+  assert cache_backend.measure_vins()[0] == len(STUB_VEHICLES)
+
+def test_import_vins_missing_columns(tmp_path: Path):
+  file_path = str(tmp_path / 'vins_cache.csv')
+  _export_df().drop(columns=['make']).to_csv(file_path, header=True, sep=',', index=False)
+
+  with pytest.raises(ValueError, match='make'):
+    import_vins(cache_backends.MemoryBackend(), file_path, 'csv')
+
+@pytest.mark.parametrize('vin', [
+  *STUB_VEHICLES, BAD_CHECK_DIGIT_VIN, BAD_CHARACTER_VIN,
+  # No check digit outside of North America
+  'WVWZZZ1JZXW000001', '123', '',
+])
+def test_find_valid_vins_matches_vin_analysis(vin: str):
+  assert bool(_find_valid_vins(pd.Series([vin]))[0]) == vin_analysis.is_vin_valid(vin)
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+import pytest
+
+from ...features.export import snapshots
+from ...settings import settings
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Path:
+  monkeypatch.setattr(settings, 'export_snapshot_dir', str(tmp_path))
+  monkeypatch.setattr(settings, 'export_snapshot_max_bytes', 100)
+  return tmp_path
+
+def test_snapshot_removed_while_served_is_read_to_the_end(snapshot_dir: Path):
+  # Arrange
+  snapshots.store_snapshot('csv', '1-100', iter([b'vin\n', b'1XPWD40X1ED215307\n'])).close()
+  snapshot = snapshots.open_snapshot('csv', '1-100')
+
+  # Act
+  # A newer generation replaces it before the response is sent
+  snapshots.store_snapshot('csv', '2-200', iter([b'vin\n'])).close()
+
+  # Assert
+  assert b''.join(snapshots.read_snapshot(snapshot)) == b'vin\n1XPWD40X1ED215307\n'
+  assert snapshots.open_snapshot('csv', '1-100') is None
+
+def test_snapshot_over_budget_is_only_read_by_its_request(snapshot_dir: Path):
+  content = [b'x' * 60, b'y' * 60]
+
+  snapshot = snapshots.store_snapshot('csv', '1-100', iter(content))
+
+  assert list(snapshot_dir.iterdir()) == []
+  assert b''.join(snapshots.read_snapshot(snapshot)) == b''.join(content)
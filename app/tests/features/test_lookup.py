@@ -0,0 +1,187 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from ...apis import http_client, resilience
+from ...apis.http_client import Upstream
+from ...db import cache_backends
+from ...db.connection import SessionLocal
+from ...db.entities.lookup_lock import queries as lock_queries
+from ...db.entities.negative_vin import queries as negative_vin_queries
+from ...db.entities.negative_vin.entity import NegativeVinReason
+from ...db.entities.photo import queries as photo_queries
+from ...db.entities.vin import queries as vin_queries
+from ...db.entities.vin.access_log import vin_access_log
+from ...features.lookup import maintenance, pipeline
+from ...schemas import Vin
+from ...settings import settings
+from ..data import STUB_VEHICLES
+from ...benchmarks.stubs import StubUpstreamServer
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def stub_upstream(monkeypatch: pytest.MonkeyPatch):
+  stub = StubUpstreamServer(dict(STUB_VEHICLES))
+  stub.start()
+  monkeypatch.setattr(settings, 'vpic_base_url', stub.vpic_url)
+  monkeypatch.setattr(settings, 'car_imagery_base_url', stub.car_imagery_url)
+  try:
+    async with http_client.open_clients():
+      yield stub
+  finally:
+    stub.stop()
+    with SessionLocal() as db_session:
+      for vin in stub.vehicles:
+        vin_queries.remove_vin(db_session, vin)
+      photo_queries.remove_all_photos(db_session)
+
+@pytest.mark.parametrize('db_lock', [False, True])
+async def test_fetch_vin_coalesces_concurrent_misses(stub_upstream: StubUpstreamServer,
+                                                     monkeypatch: pytest.MonkeyPatch, db_lock: bool):
+  # Arrange
+  monkeypatch.setattr(settings, 'lookup_db_lock', db_lock)
+  vin = next(iter(STUB_VEHICLES))
+
+  # Act
+  results = await asyncio.gather(*(pipeline.fetch_vin(vin) for _ in range(10)))
+
+  # Assert
+  assert all(result.vin.vin == vin for result in results)
+  vpic_requests = [request for request in stub_upstream.requests if '/vpic/' in request]
+  assert len(vpic_requests) == 1
+
+async def test_fetch_vin_waits_for_other_worker(stub_upstream: StubUpstreamServer,
+                                                monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  # Pretend another worker holds the lock and caches the VIN shortly after
+  monkeypatch.setattr(settings, 'lookup_db_lock', True)
+  vin, vehicle = next(iter(STUB_VEHICLES.items()))
+  with SessionLocal() as db_session:
+    assert lock_queries.try_acquire_lock(db_session, vin, 'other-worker', ttl=10)
+
+  async def other_worker():
+    await asyncio.sleep(0.1)
+    with SessionLocal() as db_session:
+      vin_queries.insert_vin(db_session, Vin(vin=vin, **vehicle))
+      lock_queries.release_lock(db_session, vin, 'other-worker')
+
+  # Act
+  result, _ = await asyncio.gather(pipeline.fetch_vin(vin), other_worker())
+
+  # Assert
+  assert result.cached
+  assert result.vin.vin == vin
+  assert not [request for request in stub_upstream.requests if '/vpic/' in request]
+
+async def test_fetch_vin_shares_photo_of_same_vehicle(stub_upstream: StubUpstreamServer,
+                                                      monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  monkeypatch.setattr(settings, 'lookup_photo_deadline', 5)
+  # Two more VINs of the same vehicle, spelled slightly differently
+  vin, vehicle = next(iter(STUB_VEHICLES.items()))
+  stub_upstream.vehicles['00000000000000001'] = {**vehicle, 'make': vehicle['make'].lower()}
+  stub_upstream.vehicles['00000000000000002'] = {**vehicle, 'model': f' {vehicle["model"]} '}
+
+  # Act
+  results = await asyncio.gather(
+    *(pipeline.fetch_vin(vin) for vin in [vin, '00000000000000001', '00000000000000002'])
+  )
+
+  # Assert
+  photo_urls = {result.vin.photo_url for result in results}
+  assert len(photo_urls) == 1 and '' not in photo_urls
+  car_imagery_requests = [request for request in stub_upstream.requests if '/carimagery/' in request]
+  assert len(car_imagery_requests) == 1
+
+async def test_find_photo_url_serves_stale_photo_on_error(stub_upstream: StubUpstreamServer,
+                                                          monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  vehicle = next(iter(STUB_VEHICLES.values()))
+  key = (vehicle['make'], vehicle['model'], vehicle['model_year'])
+  photo_url = await pipeline.find_photo_url(*key)
+
+  # Every cached photo is now stale and CarImagery is down
+  monkeypatch.setattr(settings, 'photo_cache_ttl', -1)
+  monkeypatch.setattr(settings, 'car_imagery_base_url', f'{stub_upstream.url}/down')
+
+  # Act
+  stale_photo_url = await pipeline.find_photo_url(*key)
+
+  # Assert
+  assert stale_photo_url == photo_url
+  car_imagery_requests = [request for request in stub_upstream.requests if 'GetImageUrl' in request]
+  assert len(car_imagery_requests) == 2
+
+async def test_maintenance_fills_missing_photos(stub_upstream: StubUpstreamServer):
+  # Arrange
+  # Cached while CarImagery was down
+  with SessionLocal() as db_session:
+    vin_queries.insert_vins(db_session, [Vin(vin=vin, **vehicle) for vin, vehicle in STUB_VEHICLES.items()])
+
+  # Act
+  await maintenance.CacheMaintenance().run_once()
+
+  # Assert
+  with SessionLocal() as db_session:
+    assert all(vin.photo_url for vin in vin_queries.get_all_vins(db_session))
+
+async def test_maintenance_evicts_least_recently_served(stub_upstream: StubUpstreamServer,
+                                                        monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  monkeypatch.setattr(settings, 'cache_max_rows', 1)
+  monkeypatch.setattr(settings, 'cache_photo_refresh_batch_size', 0)
+  vins = list(STUB_VEHICLES)
+  with SessionLocal() as db_session:
+    vin_queries.insert_vins(db_session, [Vin(vin=vin, **vehicle) for vin, vehicle in STUB_VEHICLES.items()])
+  await asyncio.sleep(0.01)
+  vin_access_log.touch(vins[1])
+
+  # Act
+  await maintenance.CacheMaintenance().run_once()
+
+  # Assert
+  with SessionLocal() as db_session:
+    assert [vin.vin for vin in vin_queries.get_all_vins(db_session)] == [vins[1]]
+
+async def test_maintenance_prunes_negative_cache(monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  monkeypatch.setattr(settings, 'negative_cache_max_size', 1)
+  monkeypatch.setattr(settings, 'cache_photo_refresh_batch_size', 0)
+  vins = ['00000000000000001', '00000000000000002']
+  pipeline.insert_negative_vins(vins, NegativeVinReason.VPIC_NOT_DECODED)
+
+  # Act
+  await maintenance.CacheMaintenance().run_once()
+
+  # Assert
+  with SessionLocal() as db_session:
+    assert list(negative_vin_queries.find_negative_vins(db_session, vins, settings.negative_cache_ttl)) == vins[1:]
+
+async def test_maintenance_does_not_measure_without_budgets(monkeypatch: pytest.MonkeyPatch):
+  monkeypatch.setattr(settings, 'cache_max_rows', 0)
+  monkeypatch.setattr(settings, 'cache_max_bytes', 0)
+  monkeypatch.setattr(settings, 'cache_photo_refresh_batch_size', 0)
+  measure_vins = Mock(side_effect=AssertionError('Measured the cache'))
+  monkeypatch.setattr(cache_backends.DatabaseBackend, 'measure_vins', measure_vins)
+
+  await maintenance.CacheMaintenance().run_once()
+
+  measure_vins.assert_not_called()
+
+async def test_fetch_vin_skips_photo_while_car_imagery_is_down(stub_upstream: StubUpstreamServer,
+                                                               monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  monkeypatch.setattr(settings, 'lookup_photo_deadline', 5)
+  breaker = resilience.get_upstream(Upstream.CAR_IMAGERY.value, settings.car_imagery_timeout).breaker
+  for _ in range(breaker.failure_threshold):
+    breaker.record_failure()
+  vin = next(iter(STUB_VEHICLES))
+
+  # Act
+  result = await asyncio.wait_for(pipeline.fetch_vin(vin), 1)
+
+  # Assert
+  assert result.vin.photo_url == ''
+  assert not [request for request in stub_upstream.requests if '/carimagery/' in request]
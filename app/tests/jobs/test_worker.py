@@ -0,0 +1,124 @@
+import asyncio
+import uuid
+
+import pytest
+
+from ...apis import http_client
+from ...db.connection import SessionLocal
+from ...db.entities.job import queries as job_queries
+from ...db.entities.job.entity import JobEntity, JobStatus, JobVinStatus
+from ...db.entities.photo import queries as photo_queries
+from ...db.entities.vin import queries as vin_queries
+from ...jobs import worker
+from ...schemas import Vin
+from ...settings import settings
+from ..data import FAKE_VALID_FORMAT_VIN, STUB_VEHICLES
+from ...benchmarks.stubs import StubUpstreamServer
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def stub_upstream(monkeypatch: pytest.MonkeyPatch):
+  stub = StubUpstreamServer(dict(STUB_VEHICLES))
+  stub.start()
+  monkeypatch.setattr(settings, 'vpic_base_url', stub.vpic_url)
+  monkeypatch.setattr(settings, 'car_imagery_base_url', stub.car_imagery_url)
+  monkeypatch.setattr(settings, 'jobs_poll_interval', 0.05)
+  try:
+    async with http_client.open_clients():
+      yield stub
+  finally:
+    stub.stop()
+    with SessionLocal() as db_session:
+      for vin in [*stub.vehicles, FAKE_VALID_FORMAT_VIN]:
+        vin_queries.remove_vin(db_session, vin)
+      photo_queries.remove_all_photos(db_session)
+
+async def wait_for_job(job_id: str) -> job_queries.JobProgress:
+  for _ in range(200):
+    with SessionLocal() as db_session:
+      progress = job_queries.find_job_progress(db_session, job_id)
+    if progress.status == JobStatus.COMPLETED:
+      return progress
+    await asyncio.sleep(0.05)
+  raise AssertionError(f'The job {job_id} did not complete.')
+
+async def test_job_skips_cached_vins(stub_upstream: StubUpstreamServer, monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  monkeypatch.setattr(settings, 'jobs_batch_size', 2)
+  # The jobs of earlier runs are still in the database
+  job_id = uuid.uuid4().hex
+  cached_vin, *fetched_vins = STUB_VEHICLES
+  with SessionLocal() as db_session:
+    vin_queries.insert_vin(db_session, Vin(vin=cached_vin, **STUB_VEHICLES[cached_vin]))
+    job_queries.create_job(db_session, job_id, [cached_vin, *fetched_vins, FAKE_VALID_FORMAT_VIN], {})
+
+  # Act
+  async with worker.run_in_background():
+    progress = await wait_for_job(job_id)
+
+  # Assert
+  assert progress.counts[JobVinStatus.CACHED] == 1
+  assert progress.counts[JobVinStatus.FETCHED] == len(fetched_vins)
+  assert progress.counts[JobVinStatus.NOT_FOUND] == 1
+  assert progress.counts[JobVinStatus.PENDING] == 0
+  decode_requests = [request for request in stub_upstream.requests if '/vpic/' in request]
+  assert len(decode_requests) == 2
+  with SessionLocal() as db_session:
+    assert len(vin_queries.find_vins(db_session, fetched_vins)) == len(fetched_vins)
+
+async def test_interrupted_job_resumes(stub_upstream: StubUpstreamServer, monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  monkeypatch.setattr(settings, 'jobs_heartbeat_timeout', 1)
+  job_id = uuid.uuid4().hex
+  done_vin, *pending_vins = STUB_VEHICLES
+  with SessionLocal() as db_session:
+    job_queries.create_job(db_session, job_id, [done_vin, *pending_vins], {})
+    # A worker that died after its first batch
+    (db_session
+      .query(JobEntity)
+      .filter(JobEntity.id == job_id)
+      .update({'status': JobStatus.RUNNING.value, 'owner': 'dead-worker', 'heartbeat_at': 0})
+    )
+    db_session.commit()
+    first_batch = job_queries.find_pending_vins(db_session, job_id, 1)
+    job_queries.record_outcomes(db_session, job_id, 'dead-worker', {
+      first_batch[0].id: (JobVinStatus.FETCHED, '')
+    })
+
+  # Act
+  async with worker.run_in_background():
+    progress = await wait_for_job(job_id)
+
+  # Assert
+  assert progress.counts[JobVinStatus.FETCHED] == len(STUB_VEHICLES)
+  decode_requests = [request for request in stub_upstream.requests if '/vpic/' in request]
+  assert len(decode_requests) == 1
+  with SessionLocal() as db_session:
+    assert {vin.vin for vin in vin_queries.find_vins(db_session, list(STUB_VEHICLES))} == set(pending_vins)
+
+async def test_job_taken_over_stops_mid_batch(stub_upstream: StubUpstreamServer, monkeypatch: pytest.MonkeyPatch):
+  # Arrange
+  monkeypatch.setattr(settings, 'jobs_heartbeat_timeout', 0.3)
+  stub_upstream.vpic_delay = 5
+  job_id = uuid.uuid4().hex
+  pool = worker.JobWorkerPool()
+  with SessionLocal() as db_session:
+    job_queries.create_job(db_session, job_id, list(STUB_VEHICLES), {})
+    # Another worker takes the job over while the batch waits for vPIC
+    (db_session
+      .query(JobEntity)
+      .filter(JobEntity.id == job_id)
+      .update({'status': JobStatus.RUNNING.value, 'owner': 'other-worker'})
+    )
+    db_session.commit()
+
+  # Act
+  started_at = asyncio.get_running_loop().time()
+  await asyncio.wait_for(pool.run_job(job_id), 3)
+
+  # Assert
+  assert asyncio.get_running_loop().time() - started_at < 1
+  with SessionLocal() as db_session:
+    progress = job_queries.find_job_progress(db_session, job_id)
+  assert progress.counts[JobVinStatus.PENDING] == len(STUB_VEHICLES)
@@ -0,0 +1,31 @@
+from .. import vin_analysis
+from ..benchmarks.data import generate_vins
+from ..benchmarks.harness import find_regressions, measure
+
+BASELINE = {"lookup_hit": {"throughput": 100.0, "p50_ms": 10.0, "p99_ms": 20.0, "calls": 10}}
+
+def test_generate_vins_are_valid_and_distinct():
+  vins = generate_vins(1000, offset=999_500)
+
+  assert len(set(vins)) == 1000
+  assert all(vin_analysis.is_vin_valid(vin) for vin in vins)
+
+def test_measure():
+  result = measure("noop", lambda: None, calls=100)
+
+  assert result.calls == 100
+  assert 0 <= result.p50_ms <= result.p99_ms
+
+def test_find_regressions_within_tolerance():
+  results = {"lookup_hit": {"throughput": 90.0, "p50_ms": 11.0, "p99_ms": 24.0, "calls": 10}}
+
+  assert find_regressions(results, BASELINE, tolerance=0.25) == []
+
+def test_find_regressions():
+  results = {"lookup_hit": {"throughput": 50.0, "p50_ms": 10.0, "p99_ms": 40.0, "calls": 10}}
+
+  regressions = find_regressions(results, BASELINE, tolerance=0.25)
+
+  assert len(regressions) == 2
+  assert regressions[0].startswith("lookup_hit: p99_ms")
+  assert regressions[1].startswith("lookup_hit: throughput")
@@ -1,30 +1,66 @@
 import csv
 import os
+import time
 import fastparquet
 import pandas as pd
+from unittest.mock import patch
+
 import pytest
 from fastapi.testclient import TestClient
 from fastapi import status
 
 from ..main import app
-from .data import REAL_VINS, FAKE_VALID_FORMAT_VIN
-from ..features.lookup import LookupResponse
+from .data import BAD_CHARACTER_VIN, BAD_CHECK_DIGIT_VIN, REAL_VINS, FAKE_VALID_FORMAT_VIN, STUB_VEHICLES
+from ..benchmarks.stubs import StubUpstreamServer
+from ..db import cache_backends
+from ..db.connection import SessionLocal
+from ..db.entities.job.entity import JobStatus, JobVinStatus
+from ..db.entities.photo import queries as photo_queries
+from ..db.entities.vin import queries as vin_queries
+from ..db.entities.vin.memory_cache import vin_memory_cache
+from ..features.lookup import BatchLookupResponse, BatchLookupStatus, LookupResponse
 from ..features.remove import RemoveResponse
+from ..features.import_vins import ImportResponse
 from ..features.list_vins import ListResponse
+from ..features.search import SearchResponse
+from ..jobs import JobResponse
 from ..schemas import Vin
+from ..settings import settings
 
 @pytest.fixture(autouse=True, scope='function')
 def client():
   with TestClient(app) as test_client:
     yield test_client
 
-    # The vin cache persists until the application is shutdown, so we
-    # have to remove the inserted vin just in case subsequent tests
-    # also use the same vin number.
-    list_response = ListResponse(**test_client.get('/list').json())
-    for vin in list_response.vins:
-      response = test_client.delete(f'/remove/{vin.vin}')
-      assert response.status_code == status.HTTP_200_OK
+    # Each test gets its own database but the memory cache outlives it,
+    # so we have to remove the inserted vin just in case subsequent
+    # tests also use the same vin number.
+    params = {'fields': 'vin'}
+    while True:
+      list_response = ListResponse(**test_client.get('/list', params=params).json())
+      for vin in list_response.vins:
+        response = test_client.delete(f'/remove/{vin.vin}')
+        assert response.status_code == status.HTTP_200_OK
+
+      if list_response.next_cursor is None:
+        break
+      params['cursor'] = list_response.next_cursor
+
+    # Also forget that the fake VIN couldn't be decoded and the photos
+    test_client.delete(f'/remove/{FAKE_VALID_FORMAT_VIN}')
+    with SessionLocal() as db_session:
+      photo_queries.remove_all_photos(db_session)
+
+@pytest.fixture
+def stub_upstream(monkeypatch: pytest.MonkeyPatch):
+  stub = StubUpstreamServer(STUB_VEHICLES)
+  stub.start()
+  monkeypatch.setattr(settings, 'vpic_base_url', stub.vpic_url)
+  monkeypatch.setattr(settings, 'car_imagery_base_url', stub.car_imagery_url)
+  try:
+    yield stub
+  finally:
+    stub.stop()
 
 class TestLookupApi:
   @pytest.mark.parametrize('vin', ['xxxxxxxxxxxxxxxxxx', 'xxxxxxxxxxxxxxxx;', '123'])
@@ -32,6 +68,33 @@ class TestLookupApi:
     response = client.get(f'/lookup/{vin}')
     assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+  @pytest.mark.parametrize('vin', [BAD_CHARACTER_VIN, BAD_CHECK_DIGIT_VIN])
+  def test_lookup_invalid_vin_rejected_locally(self, vin: str, client: TestClient,
+                                               stub_upstream: StubUpstreamServer):
+    response = client.get(f'/lookup/{vin}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not stub_upstream.requests
+
+  def test_lookup_partial_when_vpic_unavailable(self, client: TestClient, stub_upstream: StubUpstreamServer,
+                                                monkeypatch: pytest.MonkeyPatch):
+    # Arrange
+    monkeypatch.setattr(settings, 'vpic_base_url', f'{stub_upstream.url}/down')
+    vin = next(iter(STUB_VEHICLES))
+
+    # Act
+    response = client.get(f'/lookup/{vin}')
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    monkeypatch.setattr(settings, 'lookup_partial_on_vpic_error', True)
+    response = client.get(f'/lookup/{vin}')
+
+    # Assert
+    assert response.status_code == status.HTTP_203_NON_AUTHORITATIVE_INFORMATION
+    lookup_response = LookupResponse(**response.json())
+    assert lookup_response.partial
+    assert lookup_response.make == STUB_VEHICLES[vin]['make']
+    assert lookup_response.model_year == STUB_VEHICLES[vin]['model_year']
+
   def test_lookup_vin_not_found(self, client: TestClient):
     response = client.get(f'/lookup/{FAKE_VALID_FORMAT_VIN}')
     assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -66,6 +129,220 @@ class TestLookupApi:
     lookup_response = LookupResponse(**response.json())
     assert lookup_response.cached
 
+  def test_lookup_vin_not_found_is_remembered(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    response = client.get(f'/lookup/{FAKE_VALID_FORMAT_VIN}')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert len(stub_upstream.requests) == 1
+
+    # Act
+    response = client.get(f'/lookup/{FAKE_VALID_FORMAT_VIN}')
+
+    # Assert
+    # The second lookup is answered without asking vPIC again
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert len(stub_upstream.requests) == 1
+
+    # Removing the VIN makes the next lookup ask vPIC again
+    response = client.delete(f'/remove/{FAKE_VALID_FORMAT_VIN}')
+    remove_response = RemoveResponse(**response.json())
+    assert not remove_response.cache_delete_success
+    assert remove_response.negative_cache_delete_success
+
+    response = client.get(f'/lookup/{FAKE_VALID_FORMAT_VIN}')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert len(stub_upstream.requests) == 2
+
+  def test_lookup_vin_photo_after_deadline(self, client: TestClient, stub_upstream: StubUpstreamServer,
+                                          monkeypatch: pytest.MonkeyPatch):
+    # Arrange
+    vin = next(iter(STUB_VEHICLES))
+    stub_upstream.car_imagery_delay = 0.5
+    monkeypatch.setattr(settings, 'lookup_photo_deadline', 0)
+
+    # Act
+    response = client.get(f'/lookup/{vin}')
+
+    # Assert
+    # The first response doesn't wait for the photo...
+    assert response.status_code == status.HTTP_200_OK
+    lookup_response = LookupResponse(**response.json())
+    assert not lookup_response.cached
+    assert lookup_response.photo_url == ''
+
+    # ...but the photo is stored in the cache once it arrives
+    response = client.get(f'/lookup/{vin}')
+    lookup_response = LookupResponse(**response.json())
+    assert lookup_response.cached
+    assert lookup_response.photo_url != ''
+
+  def test_lookup_vin_photo_within_deadline(self, client: TestClient, stub_upstream: StubUpstreamServer,
+                                           monkeypatch: pytest.MonkeyPatch):
+    # Arrange
+    vin = next(iter(STUB_VEHICLES))
+    monkeypatch.setattr(settings, 'lookup_photo_deadline', 5)
+
+    # Act
+    response = client.get(f'/lookup/{vin}')
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert LookupResponse(**response.json()).photo_url != ''
+
+  def test_lookup_vin_served_from_memory(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    vin = next(iter(STUB_VEHICLES))
+    for _ in range(2):
+      response = client.get(f'/lookup/{vin}')
+      assert response.status_code == status.HTTP_200_OK
+    hits = vin_memory_cache.stats().hits
+
+    # Act
+    with patch.object(vin_queries, 'find_vin') as mock_find_vin:
+      response = client.get(f'/lookup/{vin.lower()}')
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert LookupResponse(**response.json()).cached
+    mock_find_vin.assert_not_called()
+    assert vin_memory_cache.stats().hits == hits + 1
+
+    # Removing the VIN also removes it from memory
+    client.delete(f'/remove/{vin}')
+    assert vin_memory_cache.get(vin) is None
+
+class TestBatchLookupApi:
+  def test_lookup_batch(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    # Cache one VIN up front so that the batch has a cache hit
+    cached_vin, *fetched_vins = STUB_VEHICLES
+    response = client.get(f'/lookup/{cached_vin}')
+    assert response.status_code == status.HTTP_200_OK
+    stub_upstream.requests.clear()
+
+    vins = [cached_vin, *fetched_vins, FAKE_VALID_FORMAT_VIN, '123', fetched_vins[0].lower()]
+
+    # Act
+    response = client.post('/lookup/batch', json={'vins': vins})
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    batch_response = BatchLookupResponse(**response.json())
+    statuses = {item.vin: item.status for item in batch_response.results}
+    assert statuses == {
+      cached_vin: BatchLookupStatus.CACHED,
+      fetched_vins[0]: BatchLookupStatus.FETCHED,
+      fetched_vins[1]: BatchLookupStatus.FETCHED,
+      FAKE_VALID_FORMAT_VIN: BatchLookupStatus.NOT_FOUND,
+      '123': BatchLookupStatus.INVALID,
+    }
+
+    for item in batch_response.results:
+      if item.status in (BatchLookupStatus.CACHED, BatchLookupStatus.FETCHED):
+        assert item.result.cached == (item.status == BatchLookupStatus.CACHED)
+        assert item.result.make == STUB_VEHICLES[item.vin]['make']
+        assert item.result.photo_url != ''
+
+    # All misses are decoded with a single batch call
+    vpic_requests = [request for request in stub_upstream.requests if '/vpic/' in request]
+    assert vpic_requests == ['POST /vpic/DecodeVINValuesBatch/']
+
+    # The fetched VINs are now in the cache
+    for vin in fetched_vins:
+      response = client.get(f'/lookup/{vin}')
+      assert response.status_code == status.HTTP_200_OK
+      assert LookupResponse(**response.json()).cached
+
+  def test_lookup_batch_too_many_vins(self, client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'lookup_batch_max_vins', 2)
+    response = client.post('/lookup/batch', json={'vins': REAL_VINS[:3]})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+class TestJobsApi:
+  def test_job(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    vins = [*STUB_VEHICLES, FAKE_VALID_FORMAT_VIN, '123', next(iter(STUB_VEHICLES)).lower()]
+
+    # Act
+    response = client.post('/jobs', json={'vins': vins})
+
+    # Assert
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job = JobResponse(**response.json())
+    assert job.vin_count == len(STUB_VEHICLES) + 2
+    assert job.counts[JobVinStatus.INVALID] == 1
+
+    job = self._wait_for_job(job.job_id, client)
+    assert job.counts[JobVinStatus.FETCHED] == len(STUB_VEHICLES)
+    assert job.counts[JobVinStatus.NOT_FOUND] == 1
+    assert job.counts[JobVinStatus.PENDING] == 0
+    for vin in STUB_VEHICLES:
+      response = client.get(f'/lookup/{vin}')
+      assert LookupResponse(**response.json()).cached
+
+  def test_job_from_file(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    content = 'vin,make\n' + ''.join(f'{vin},{vehicle["make"]}\n' for vin, vehicle in STUB_VEHICLES.items())
+
+    # Act
+    response = client.post('/jobs/file', content=content.encode())
+
+    # Assert
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job = self._wait_for_job(JobResponse(**response.json()).job_id, client)
+    assert job.vin_count == len(STUB_VEHICLES)
+    assert job.counts[JobVinStatus.FETCHED] == len(STUB_VEHICLES)
+
+  def test_job_events(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    response = client.post('/jobs', json={'vins': list(STUB_VEHICLES)})
+    job_id = JobResponse(**response.json()).job_id
+
+    # Act
+    response = client.get(f'/jobs/{job_id}/events')
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = [event for event in response.text.split('\n\n') if event.startswith('event:')]
+    event_name, data = events[-1].split('\n')
+    assert event_name == 'event: completed'
+    job = JobResponse.model_validate_json(data.removeprefix('data: '))
+    assert job.status == JobStatus.COMPLETED
+    assert job.counts[JobVinStatus.FETCHED] == len(STUB_VEHICLES)
+    assert all(event.startswith('event: progress') for event in events[:-1])
+
+  @pytest.mark.parametrize('path', ['/jobs/unknown', '/jobs/unknown/events'])
+  def test_job_not_found(self, path: str, client: TestClient):
+    response = client.get(path)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+  def test_job_too_many_vins(self, client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'jobs_max_vins', 2)
+    response = client.post('/jobs', json={'vins': REAL_VINS[:3]})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+  @pytest.mark.parametrize('is_chunked', [False, True])
+  def test_job_file_too_large(self, is_chunked: bool, client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'jobs_max_file_bytes', 30)
+    lines = [f'{vin}\n'.encode() for vin in REAL_VINS[:2]]
+
+    # Without a declared length, the body is only found to be too large while it's read
+    response = client.post('/jobs/file', content=iter(lines) if is_chunked else b''.join(lines))
+
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+  @classmethod
+  def _wait_for_job(cls, job_id: str, client: TestClient) -> JobResponse:
+    for _ in range(100):
+      response = client.get(f'/jobs/{job_id}')
+      assert response.status_code == status.HTTP_200_OK
+      job = JobResponse(**response.json())
+      if job.status == JobStatus.COMPLETED:
+        return job
+      time.sleep(0.05)
+    raise AssertionError(f'The job {job_id} did not complete.')
+
 class TestRemoveApi:
   @pytest.mark.parametrize('vin', ['xxxxxxxxxxxxxxxxxx', 'xxxxxxxxxxxxxxxx;', '123'])
   def test_remove_bad_format_vin(self, vin: str, client: TestClient):
@@ -98,6 +375,187 @@ class TestRemoveApi:
     remove_response = RemoveResponse(**response.json())
     assert remove_response.cache_delete_success
 
+class TestListApi:
+  def test_list_pages(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    response = client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+    assert response.status_code == status.HTTP_200_OK
+
+    # Act
+    pages = []
+    params = {'limit': 2}
+    while True:
+      response = client.get('/list', params=params)
+      assert response.status_code == status.HTTP_200_OK
+      list_response = ListResponse(**response.json())
+      pages.append(list_response.vins)
+      if list_response.next_cursor is None:
+        break
+      params['cursor'] = list_response.next_cursor
+
+    # Assert
+    assert [len(page) for page in pages] == [2, 1]
+    vins = [vin for page in pages for vin in page]
+    assert [vin.vin for vin in vins] == list(STUB_VEHICLES)
+    for vin in vins:
+      assert vin.make == STUB_VEHICLES[vin.vin]['make']
+      assert vin.body_class == STUB_VEHICLES[vin.vin]['body_class']
+      assert vin.photo_url != ''
+
+  def test_list_filters_and_fields(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    response = client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+    assert response.status_code == status.HTTP_200_OK
+
+    # Act
+    response = client.get('/list', params={'make': 'PETERBILT', 'fields': ['vin', 'model']})
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+      'vins': [
+        {'vin': vin, 'model': vehicle['model']}
+        for vin, vehicle in STUB_VEHICLES.items()
+        if vehicle['make'] == 'PETERBILT'
+      ],
+      'next_cursor': None,
+    }
+
+  def test_list_page_too_large(self, client: TestClient):
+    response = client.get('/list', params={'limit': settings.list_max_page_size + 1})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+class TestSearchApi:
+  def test_search(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+
+    # Act
+    response = client.get('/search', params={'q': 'peterbilt 57'})
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    search_response = SearchResponse(**response.json())
+    assert [vin.vin for vin in search_response.vins] == ['1XPWD40X1ED215307']
+    assert search_response.vins[0].model == '579'
+    assert search_response.next_offset is None
+
+  def test_search_by_vin_prefix_pages(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+
+    # Act
+    first_page = SearchResponse(**client.get('/search', params={'vin_prefix': '1x', 'limit': 2}).json())
+    second_page = SearchResponse(**client.get(
+      '/search', params={'vin_prefix': '1x', 'limit': 2, 'offset': first_page.next_offset}
+    ).json())
+
+    # Assert
+    assert [vin.vin for vin in first_page.vins + second_page.vins] == sorted(STUB_VEHICLES)
+    assert second_page.next_offset is None
+
+  def test_search_after_remove(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+
+    # Act
+    client.delete('/remove/1XKWDB0X57J211825')
+
+    # Assert
+    assert SearchResponse(**client.get('/search', params={'q': 'kenworth'}).json()).vins == []
+
+  @pytest.mark.parametrize('params', [{}, {'q': ' - '}, {'vin_prefix': '1XO'}, {'q': 'truck', 'limit': 1001}])
+  def test_search_bad_request(self, params: dict[str, str], client: TestClient):
+    response = client.get('/search', params=params)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+class TestImportApi:
+  @pytest.mark.parametrize('import_format', ['csv', 'parquet'])
+  def test_import(self, client: TestClient, tmp_path, import_format: str):
+    # Arrange
+    rows = [{'vin': vin, **vehicle, 'photo_url': ''} for vin, vehicle in STUB_VEHICLES.items()]
+    rows.append({**rows[0], 'vin': BAD_CHECK_DIGIT_VIN})
+    file_path = str(tmp_path / f'vins_cache.{import_format}')
+    if import_format == 'csv':
+      pd.DataFrame(rows).to_csv(file_path, header=True, sep=',', index=False)
+    else:
+      fastparquet.write(file_path, pd.DataFrame(rows))
+    with open(file_path, 'rb') as file:
+      content = file.read()
+
+    # Act
+    response = client.post('/import', params={'import_format': import_format}, content=content)
+    second_response = client.post('/import', params={'import_format': import_format}, content=content)
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert ImportResponse(**response.json()) == \
+      ImportResponse(inserted=len(STUB_VEHICLES), updated=0, rejected=1)
+    assert ImportResponse(**second_response.json()) == \
+      ImportResponse(inserted=0, updated=len(STUB_VEHICLES), rejected=1)
+
+    list_response = ListResponse(**client.get('/list').json())
+    assert sorted(vin.vin for vin in list_response.vins) == sorted(STUB_VEHICLES)
+
+  def test_import_bad_file(self, client: TestClient):
+    # Act
+    response = client.post('/import', params={'import_format': 'parquet'}, content=b'vin,make\n')
+
+    # Assert
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+  def test_import_too_large(self, client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    # Arrange
+    monkeypatch.setattr(settings, 'import_max_bytes', 10)
+
+    # Act
+    response = client.post('/import', content=iter([b'vin,make\n', b'1XPWD40X1ED215307,PETERBILT\n']))
+
+    # Assert
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert ListResponse(**client.get('/list').json()).vins == []
+
+class TestCacheBackend:
+  def test_apis_use_the_cache_backend(self, client: TestClient, stub_upstream: StubUpstreamServer,
+                                      monkeypatch: pytest.MonkeyPatch):
+    # Arrange
+    monkeypatch.setattr(settings, 'cache_backend', 'memory')
+    monkeypatch.setattr(cache_backends, '_backends', {})
+    vin = next(iter(STUB_VEHICLES))
+    client.get(f'/lookup/{vin}')
+    vin_memory_cache.invalidate(vin)
+
+    # Act
+    lookup_response = client.get(f'/lookup/{vin}')
+    list_response = client.get('/list', params={'fields': 'vin'})
+    export_response = client.get('/export')
+    remove_response = client.delete(f'/remove/{vin}')
+
+    # Assert
+    assert LookupResponse(**lookup_response.json()).cached
+    assert ListResponse(**list_response.json()).vins[0].vin == vin
+    assert export_response.text.splitlines()[1].startswith(vin)
+    assert RemoveResponse(**remove_response.json()).cache_delete_success
+    assert not cache_backends.get_cache_backend().has_vins()
+    # The database was left alone
+    with SessionLocal() as db_session:
+      assert vin_queries.find_vin(db_session, vin) is None
+
+class TestMetricsApi:
+  def test_metrics(self, client: TestClient):
+    # Arrange
+    client.get('/lookup/123')
+
+    # Act
+    response = client.get('/metrics')
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'route="/lookup/{vin}",status_code="400"' in response.text
+    assert 'vin_lookup_memory_cache{stat="hits"}' in response.text
+    assert 'vin_lookup_db_query_duration_seconds_count{statement="SELECT"}' in response.text
+
 class TestExportApi:
   @pytest.mark.parametrize('export_format', ['csv', 'parquet'])
   def test_export_with_vins_in_cache(self, client: TestClient, export_format: str):
@@ -142,6 +600,46 @@ class TestExportApi:
     finally:
       os.remove(download_file_path)
 
+  @pytest.mark.parametrize('export_format', ['csv', 'parquet'])
+  def test_export_in_chunks(self, client: TestClient, stub_upstream: StubUpstreamServer,
+                            monkeypatch: pytest.MonkeyPatch, export_format: str):
+    # Arrange
+    # Use tiny chunks so that the export is made of several chunks and row groups
+    monkeypatch.setattr(settings, 'export_csv_chunk_size', 2)
+    monkeypatch.setattr(settings, 'export_parquet_row_group_size', 2)
+    response = client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+    assert response.status_code == status.HTTP_200_OK
+
+    # Act
+    response = client.get(f'/export?export_format={export_format}')
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert f'vins_cache.{export_format}' in response.headers['content-disposition']
+
+    download_file_path = f'download_vin_cache.{export_format}'
+    with open(download_file_path, 'wb') as cache_file:
+      cache_file.write(response.content)
+
+    try:
+      if export_format == 'csv':
+        cache_df = pd.read_csv(download_file_path, sep=',', header=0, dtype=str, keep_default_na=False)
+      else:
+        parq_file = fastparquet.ParquetFile(download_file_path)
+        assert len(parq_file.row_groups) == 2
+        cache_df = parq_file.to_pandas()
+
+      assert list(cache_df.columns) == ['vin', 'make', 'model', 'model_year', 'body_class', 'photo_url']
+      assert list(cache_df['vin']) == list(STUB_VEHICLES)
+      for _, actual_vin in cache_df.iterrows():
+        expected_vin = STUB_VEHICLES[actual_vin.vin]
+        assert actual_vin.make == expected_vin['make']
+        assert actual_vin.model == expected_vin['model']
+        assert actual_vin.model_year == expected_vin['model_year']
+        assert actual_vin.body_class == expected_vin['body_class']
+    finally:
+      os.remove(download_file_path)
+
   def test_export_with_no_vin_in_cache(self, client: TestClient):
     # Act
     response = client.get('/export')
@@ -150,6 +648,73 @@ class TestExportApi:
     assert response.status_code == status.HTTP_200_OK
     assert response.json() is None
 
+  def test_export_not_modified(self, client: TestClient, stub_upstream: StubUpstreamServer):
+    # Arrange
+    client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+    response = client.get('/export')
+    etag = response.headers['etag']
+
+    # Act
+    not_modified_response = client.get('/export', headers={'If-None-Match': etag})
+    client.delete(f'/remove/{next(iter(STUB_VEHICLES))}')
+    modified_response = client.get('/export', headers={'If-None-Match': etag})
+
+    # Assert
+    assert not_modified_response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert not_modified_response.headers['etag'] == etag
+    assert modified_response.status_code == status.HTTP_200_OK
+    assert modified_response.headers['etag'] != etag
+    assert len(modified_response.text.splitlines()) == len(STUB_VEHICLES)
+
+  def test_export_snapshot_is_reused(self, client: TestClient, stub_upstream: StubUpstreamServer,
+                                     monkeypatch: pytest.MonkeyPatch, tmp_path):
+    # Arrange
+    monkeypatch.setattr(settings, 'export_snapshot_dir', str(tmp_path))
+    client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+    first_response = client.get('/export')
+
+    # Act
+    with patch('app.features.export._stream_csv', side_effect=AssertionError('Exported again')):
+      second_response = client.get('/export')
+
+    # Assert
+    assert second_response.status_code == status.HTTP_200_OK
+    assert second_response.content == first_response.content
+    assert second_response.headers['etag'] == first_response.headers['etag']
+    assert [path.suffix for path in tmp_path.iterdir()] == ['.csv']
+
+  def test_export_snapshot_of_older_generation_is_removed(self, client: TestClient,
+                                                          stub_upstream: StubUpstreamServer,
+                                                          monkeypatch: pytest.MonkeyPatch, tmp_path):
+    # Arrange
+    monkeypatch.setattr(settings, 'export_snapshot_dir', str(tmp_path))
+    client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+    client.get('/export')
+    client.get('/export?export_format=parquet')
+    client.delete(f'/remove/{next(iter(STUB_VEHICLES))}')
+
+    # Act
+    client.get('/export')
+
+    # Assert
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == ['.csv', '.parquet']
+
+  def test_export_snapshot_over_budget_is_not_kept(self, client: TestClient,
+                                                   stub_upstream: StubUpstreamServer,
+                                                   monkeypatch: pytest.MonkeyPatch, tmp_path):
+    # Arrange
+    monkeypatch.setattr(settings, 'export_snapshot_dir', str(tmp_path))
+    monkeypatch.setattr(settings, 'export_snapshot_max_bytes', 10)
+    client.post('/lookup/batch', json={'vins': list(STUB_VEHICLES)})
+
+    # Act
+    response = client.get('/export')
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.text.splitlines()) == len(STUB_VEHICLES) + 1
+    assert list(tmp_path.iterdir()) == []
+
   @classmethod
   def _insert_vins(cls, vins: list[str], client: TestClient) -> list[Vin]:
     ''' Add multiple vins to the cache. '''
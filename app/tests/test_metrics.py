@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from .. import metrics
+from ..apis.vpic import VpicApiError
+
+def test_histogram_renders_cumulative_buckets():
+  histogram = metrics.Histogram('test_seconds', 'Test.', ('route',), buckets=(0.1, 1))
+
+  histogram.observe(0.05, '/a')
+  histogram.observe(0.5, '/a')
+  histogram.observe(5, '/a')
+
+  assert list(histogram.render()) == [
+    '# HELP test_seconds Test.',
+    '# TYPE test_seconds histogram',
+    'test_seconds_bucket{route="/a",le="0.1"} 1',
+    'test_seconds_bucket{route="/a",le="1"} 2',
+    'test_seconds_bucket{route="/a",le="+Inf"} 3',
+    'test_seconds_sum{route="/a"} 5.55',
+    'test_seconds_count{route="/a"} 3',
+  ]
+
+def test_counter_escapes_label_values():
+  counter = metrics.Counter('test_total', 'Test.', ('error',))
+
+  counter.inc('a "quoted"\nvalue', amount=2)
+
+  assert list(counter.render())[-1] == 'test_total{error="a \\"quoted\\"\\nvalue"} 2'
+
+def test_track_upstream_counts_errors():
+  errors_before = metrics.upstream_errors.value('test_upstream', 'VpicApiError', '503')
+
+  with pytest.raises(VpicApiError):
+    with metrics.track_upstream('test_upstream'):
+      raise VpicApiError('Down', 503)
+
+  assert metrics.upstream_errors.value('test_upstream', 'VpicApiError', '503') == errors_before + 1
+  assert metrics.upstream_request_duration.count('test_upstream') >= 1
+
+def test_instrument_engine():
+  engine = create_engine('sqlite://')
+  metrics.instrument_engine(engine)
+  selects_before = metrics.db_query_duration.count('SELECT')
+
+  with engine.connect() as connection:
+    connection.execute(text('SELECT 1'))
+
+  assert metrics.db_query_duration.count('SELECT') == selects_before + 1
@@ -0,0 +1,20 @@
+import json
+
+import pytest
+
+from .. import responses
+
+CONTENT = {'vins': [{'vin': '1XPWD40X1ED215307', 'make': 'PETERBILT'}], 'next_cursor': None}
+
+def test_trusted_response_renders_json():
+  response = responses.TrustedJSONResponse(CONTENT)
+
+  assert json.loads(response.body) == CONTENT
+  assert response.media_type == 'application/json'
+
+def test_trusted_response_without_orjson(monkeypatch: pytest.MonkeyPatch):
+  monkeypatch.setattr(responses, 'orjson', None)
+
+  response = responses.TrustedJSONResponse(CONTENT)
+
+  assert json.loads(response.body) == CONTENT
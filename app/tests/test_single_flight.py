@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from ..single_flight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+async def test_single_flight_coalesces_concurrent_calls():
+  single_flight = SingleFlight[str]()
+  calls = []
+
+  async def fetch() -> str:
+    calls.append(1)
+    await asyncio.sleep(0.01)
+    return 'result'
+
+  results = await asyncio.gather(*(single_flight.do('key', fetch) for _ in range(5)))
+
+  assert results == ['result'] * 5
+  assert len(calls) == 1
+  assert not single_flight.in_flight('key')
+
+async def test_single_flight_shares_exceptions():
+  single_flight = SingleFlight[str]()
+
+  async def fail() -> str:
+    await asyncio.sleep(0.01)
+    raise ValueError('Dummy error.')
+
+  results = await asyncio.gather(
+    *(single_flight.do('key', fail) for _ in range(2)),
+    return_exceptions=True
+  )
+
+  assert all(isinstance(result, ValueError) for result in results)
+
+async def test_single_flight_calls_again_after_completion():
+  single_flight = SingleFlight[int]()
+  calls = []
+
+  async def fetch() -> int:
+    calls.append(1)
+    return len(calls)
+
+  assert await single_flight.do('key', fetch) == 1
+  assert await single_flight.do('key', fetch) == 2
+
+async def test_single_flight_survives_cancelled_caller():
+  single_flight = SingleFlight[str]()
+
+  async def fetch() -> str:
+    await asyncio.sleep(0.05)
+    return 'result'
+
+  first_caller = asyncio.ensure_future(single_flight.do('key', fetch))
+  second_caller = asyncio.ensure_future(single_flight.do('key', fetch))
+  await asyncio.sleep(0.01)
+  first_caller.cancel()
+
+  assert await second_caller == 'result'
@@ -0,0 +1,32 @@
+import pytest
+
+from ..benchmarks import bench_startup
+
+# Measured at about 0.9 s and 75 MiB, and 130 MiB when pandas was imported at startup
+STARTUP_SECONDS_BUDGET = 3
+STARTUP_RSS_BUDGET = 110 * 1024 * 1024
+
+@pytest.fixture(scope='module')
+def startup_profile() -> bench_startup.StartupProfile:
+  return bench_startup.profile_startup()
+
+def test_startup_does_not_import_lazy_modules(startup_profile: bench_startup.StartupProfile):
+  assert not set(bench_startup.LAZY_MODULES) & set(startup_profile.modules)
+
+def test_startup_is_within_budget(startup_profile: bench_startup.StartupProfile):
+  assert startup_profile.seconds < STARTUP_SECONDS_BUDGET
+  assert startup_profile.rss_bytes < STARTUP_RSS_BUDGET
+
+def test_parse_import_times():
+  output = '\n'.join([
+    'import time: self [us] | cumulative | imported package',
+    'import time:       305 |     356148 |   fastapi',
+    'import time:      8085 |     939871 | app.main',
+  ])
+
+  import_times = bench_startup.parse_import_times(output)
+
+  assert import_times == [
+    bench_startup.ImportTime('fastapi', 305, 356148),
+    bench_startup.ImportTime('app.main', 8085, 939871),
+  ]
@@ -0,0 +1,58 @@
+import pytest
+from pydantic import ValidationError
+
+from .. import vin_analysis
+from ..schemas import Vin
+from .data import BAD_CHARACTER_VIN, BAD_CHECK_DIGIT_VIN, FAKE_VALID_FORMAT_VIN, REAL_VINS, STUB_VEHICLES
+
+@pytest.mark.parametrize('vin', [*REAL_VINS, FAKE_VALID_FORMAT_VIN, REAL_VINS[0].lower()])
+def test_find_vin_error_valid(vin: str):
+  assert vin_analysis.find_vin_error(vin) is None
+
+@pytest.mark.parametrize('vin', [
+  '123', 'xxxxxxxxxxxxxxxxxx', 'xxxxxxxxxxxxxxxx;', 'ÀBCDEFGH123456789',
+  BAD_CHARACTER_VIN, BAD_CHECK_DIGIT_VIN,
+])
+def test_find_vin_error_invalid(vin: str):
+  assert vin_analysis.find_vin_error(vin) is not None
+
+def test_check_digit_only_required_in_north_america():
+  # Same VIN as BAD_CHECK_DIGIT_VIN but made in Europe
+  assert vin_analysis.find_vin_error('W' + BAD_CHECK_DIGIT_VIN[1:]) is None
+
+@pytest.mark.parametrize('vin,check_digit', [
+  ('1XPWD40X1ED215307', '1'), ('4V4NC9EJXEN171694', 'X'), ('1HGCM82633A004352', '3'),
+])
+def test_compute_check_digit(vin: str, check_digit: str):
+  assert vin_analysis.compute_check_digit(vin) == check_digit
+
+@pytest.mark.parametrize('vin,current_year,model_year', [
+  ('1XPWD40X1ED215307', 2024, 2014),
+  ('1XPWD40X1ED215307', 2012, 1984),
+  ('1XP5DB9X7YN526158', 2024, 2000),
+  ('1XKWDB0X57J211825', 2024, 2007),
+  ('1HGCM82633A004352', 2024, 2003),
+  ('1HGCM8263UA004352', 2024, None),
+])
+def test_decode_model_year(vin: str, current_year: int, model_year: int | None):
+  assert vin_analysis.decode_model_year(vin, current_year) == model_year
+
+def test_analyze_vin():
+  analysis = vin_analysis.analyze_vin(REAL_VINS[3])
+
+  assert analysis.wmi == '4V4'
+  assert analysis.region == 'North America'
+  assert analysis.manufacturer == 'VOLVO TRUCK'
+  assert analysis.has_valid_check_digit
+
+@pytest.mark.parametrize('vin,manufacturer', [
+  ('1XKWDB0X57J211825', 'KENWORTH'), ('JTDKB20U093000000', 'TOYOTA'), (FAKE_VALID_FORMAT_VIN, None),
+])
+def test_find_manufacturer(vin: str, manufacturer: str | None):
+  assert vin_analysis.find_manufacturer(vin) == manufacturer
+
+@pytest.mark.parametrize('vin', [BAD_CHARACTER_VIN, BAD_CHECK_DIGIT_VIN])
+def test_vin_schema_rejects_invalid_vin(vin: str):
+  vehicle = next(iter(STUB_VEHICLES.values()))
+  with pytest.raises(ValidationError):
+    Vin(vin=vin, **vehicle)
@@ -0,0 +1,115 @@
+import datetime
+import string
+from dataclasses import dataclass
+
+from .wmi import WMI_MANUFACTURERS, WMI_PREFIX_MANUFACTURERS
+
+VIN_LENGTH = 17
+# I, O and Q are never used because they look like 1 and 0
+VIN_CHARACTERS = frozenset(string.digits + string.ascii_uppercase) - frozenset('IOQ')
+CHECK_DIGIT_INDEX = 8
+MODEL_YEAR_INDEX = 9
+
+TRANSLITERATIONS = {
+  **{digit: int(digit) for digit in string.digits},
+  **dict(zip('ABCDEFGH', range(1, 9))),
+  **dict(zip('JKLMN', range(1, 6))),
+  'P': 7, 'R': 9,
+  **dict(zip('STUVWXYZ', range(2, 10))),
+}
+CHECK_DIGIT_WEIGHTS = [8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2]
+
+# The model year codes repeat every 30 years, starting with A in 1980
+_MODEL_YEAR_CODES = 'ABCDEFGHJKLMNPRSTVWXY123456789'
+_MODEL_YEAR_CYCLE_START = 1980
+
+# The check digit is only mandatory for VINs from North America
+NORTH_AMERICA_CODES = '12345'
+
+_REGIONS = [
+  (NORTH_AMERICA_CODES, 'North America'),
+  ('67', 'Oceania'),
+  ('89', 'South America'),
+  ('ABCDEFGH', 'Africa'),
+  ('JKLMNPR', 'Asia'),
+  ('STUVWXYZ', 'Europe'),
+]
+
+@dataclass(frozen=True)
+class VinAnalysis:
+  """ What can be told about a VIN without asking vPIC. """
+  vin: str
+  wmi: str
+  region: str | None
+  manufacturer: str | None
+  model_year: int | None
+  has_valid_check_digit: bool
+
+def find_vin_error(vin: str) -> str | None:
+  """ Check the VIN against the ISO 3779 rules and return why it's
+      invalid, or `None` if it's valid. The check digit is only verified
+      for VINs from North America, where it's mandatory.
+  """
+  if len(vin) != VIN_LENGTH:
+    return f'VIN must be {VIN_LENGTH} characters long.'
+
+  vin = vin.upper()
+  if not VIN_CHARACTERS.issuperset(vin):
+    return 'VIN must only contain digits and letters other than I, O and Q.'
+
+  if requires_check_digit(vin) and compute_check_digit(vin) != vin[CHECK_DIGIT_INDEX]:
+    return 'VIN check digit is invalid.'
+
+  return None
+
+def is_vin_valid(vin: str) -> bool:
+  return find_vin_error(vin) is None
+
+def requires_check_digit(vin: str) -> bool:
+  return find_region(vin) == 'North America'
+
+def compute_check_digit(vin: str) -> str:
+  """ Compute the check digit of a 17 character VIN made of valid characters. """
+  remainder = sum(
+    TRANSLITERATIONS[character] * weight
+    for character, weight in zip(vin.upper(), CHECK_DIGIT_WEIGHTS)
+  ) % 11
+  return 'X' if remainder == 10 else str(remainder)
+
+def find_region(vin: str) -> str | None:
+  first_character = vin[:1].upper()
+  for characters, region in _REGIONS:
+    if first_character and first_character in characters:
+      return region
+  return None
+
+def find_manufacturer(vin: str) -> str | None:
+  """ Guess the manufacturer from the WMI, the first 3 characters of the VIN. """
+  vin = vin.upper()
+  return WMI_MANUFACTURERS.get(vin[:3]) or WMI_PREFIX_MANUFACTURERS.get(vin[:2])
+
+def decode_model_year(vin: str, current_year: int | None = None) -> int | None:
+  """ Decode the model year from the 10th character. The codes repeat every
+      30 years, so the latest year that isn't after next year is picked.
+  """
+  code = vin[MODEL_YEAR_INDEX:MODEL_YEAR_INDEX + 1].upper()
+  if not code or code not in _MODEL_YEAR_CODES:
+    return None
+
+  current_year = current_year or datetime.date.today().year
+  model_year = _MODEL_YEAR_CYCLE_START + _MODEL_YEAR_CODES.index(code)
+  while model_year + len(_MODEL_YEAR_CODES) <= current_year + 1:
+    model_year += len(_MODEL_YEAR_CODES)
+  return model_year
+
+def analyze_vin(vin: str) -> VinAnalysis:
+  """ Analyze a VIN that passed `find_vin_error`. """
+  vin = vin.upper()
+  return VinAnalysis(
+    vin=vin,
+    wmi=vin[:3],
+    region=find_region(vin),
+    manufacturer=find_manufacturer(vin),
+    model_year=decode_model_year(vin),
+    has_valid_check_digit=compute_check_digit(vin) == vin[CHECK_DIGIT_INDEX],
+  )
@@ -0,0 +1,39 @@
+# World Manufacturer Identifiers (the first 3 characters of a VIN) of
+# common manufacturers. Manufacturers that own every WMI of a 2 character
+# prefix are listed by that prefix instead, to keep the index small.
+WMI_MANUFACTURERS: dict[str, str] = {
+  # North America
+  '1FA': 'FORD', '1FB': 'FORD', '1FC': 'FORD', '1FD': 'FORD', '1FM': 'FORD', '1FT': 'FORD',
+  '1FU': 'FREIGHTLINER', '1FV': 'FREIGHTLINER',
+  '1G1': 'CHEVROLET', '1GC': 'CHEVROLET', '1GN': 'CHEVROLET', '1G4': 'BUICK',
+  '1G6': 'CADILLAC', '1GT': 'GMC', '1GK': 'GMC', '1GY': 'CADILLAC',
+  '1C3': 'CHRYSLER', '1C4': 'CHRYSLER', '1C6': 'RAM', '1J4': 'JEEP', '1J8': 'JEEP',
+  '1HG': 'HONDA', '19X': 'HONDA', '19U': 'ACURA',
+  '1HT': 'INTERNATIONAL', '1HS': 'INTERNATIONAL', '3HS': 'INTERNATIONAL',
+  '1LN': 'LINCOLN', '1ME': 'MERCURY', '1M1': 'MACK', '1M2': 'MACK',
+  '1N4': 'NISSAN', '1N6': 'NISSAN', '1VW': 'VOLKSWAGEN',
+  '1XK': 'KENWORTH', '2XK': 'KENWORTH', '1XP': 'PETERBILT', '2XP': 'PETERBILT',
+  '2FA': 'FORD', '2FM': 'FORD', '2FT': 'FORD', '2G1': 'CHEVROLET', '2GC': 'CHEVROLET',
+  '2GT': 'GMC', '2HG': 'HONDA', '2HK': 'HONDA', '2T1': 'TOYOTA', '2T3': 'TOYOTA',
+  '2C3': 'CHRYSLER', '2C4': 'CHRYSLER',
+  '3AK': 'FREIGHTLINER', '3FA': 'FORD', '3G1': 'CHEVROLET', '3GC': 'CHEVROLET',
+  '3N1': 'NISSAN', '3VW': 'VOLKSWAGEN', '3C4': 'CHRYSLER', '3C6': 'RAM',
+  '4S3': 'SUBARU', '4S4': 'SUBARU', '4T1': 'TOYOTA', '4T3': 'TOYOTA', '4V4': 'VOLVO TRUCK',
+  '5FN': 'HONDA', '5J6': 'HONDA', '5N1': 'NISSAN', '5NP': 'HYUNDAI', '5TD': 'TOYOTA',
+  '5TF': 'TOYOTA', '5UX': 'BMW', '5YJ': 'TESLA', '7SA': 'TESLA',
+  # Asia
+  'JH4': 'ACURA', 'JHM': 'HONDA', 'JF1': 'SUBARU', 'JF2': 'SUBARU', 'JA3': 'MITSUBISHI',
+  'JA4': 'MITSUBISHI', 'JAA': 'ISUZU', 'JAL': 'ISUZU', 'KMH': 'HYUNDAI', 'KNA': 'KIA',
+  'KND': 'KIA', 'KL1': 'CHEVROLET', 'KLA': 'DAEWOO', 'SAJ': 'JAGUAR', 'SAL': 'LAND ROVER',
+  # Europe
+  'VF1': 'RENAULT', 'VF3': 'PEUGEOT', 'VF7': 'CITROEN', 'VSS': 'SEAT', 'TMB': 'SKODA',
+  'TRU': 'AUDI', 'W0L': 'OPEL', 'WAU': 'AUDI', 'WBA': 'BMW', 'WBS': 'BMW', 'WBY': 'BMW',
+  'WDB': 'MERCEDES-BENZ', 'WDC': 'MERCEDES-BENZ', 'WDD': 'MERCEDES-BENZ',
+  'WP0': 'PORSCHE', 'WP1': 'PORSCHE', 'WVW': 'VOLKSWAGEN', 'WV1': 'VOLKSWAGEN',
+  'WV2': 'VOLKSWAGEN', 'YS3': 'SAAB', 'YV1': 'VOLVO', 'YV4': 'VOLVO',
+  'ZAR': 'ALFA ROMEO', 'ZFA': 'FIAT', 'ZFF': 'FERRARI',
+}
+
+WMI_PREFIX_MANUFACTURERS: dict[str, str] = {
+  'JM': 'MAZDA', 'JN': 'NISSAN', 'JS': 'SUZUKI', 'JT': 'TOYOTA',
+}